@@ -0,0 +1,57 @@
+import argparse
+from functools import partial
+import logging
+import time
+
+from domain.enum import RankingBasis, RepLevelScheme, RepLevelSearch, ScoringFormat
+from services import batch_services
+
+def get_args(args=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Calculates and saves player values for every combination of the input projections and settings.')
+    parser.add_argument('-p', '--projections', type=int, nargs='+', required=True, help='Projection ids to value')
+    parser.add_argument('-f', '--formats', nargs='+', default=[ScoringFormat.FG_POINTS.name], choices=[f.name for f in ScoringFormat if ScoringFormat.is_points_type(f)])
+    parser.add_argument('-t', '--teams', type=int, nargs='+', default=[12], help='League sizes')
+    parser.add_argument('--hitter-basis', nargs='+', default=[RankingBasis.PPG.name], choices=[RankingBasis.PPG.name, RankingBasis.PPPA.name])
+    parser.add_argument('--pitcher-basis', nargs='+', default=[RankingBasis.PIP.name], choices=[RankingBasis.PIP.name, RankingBasis.PPG.name])
+    parser.add_argument('-s', '--schemes', nargs='+', default=[RepLevelScheme.NUM_ROSTERED.name], choices=[s.name for s in RepLevelScheme])
+    parser.add_argument('--search', nargs='+', default=[RepLevelSearch.HEURISTIC.name], choices=[s.name for s in RepLevelSearch],
+                        help='Replacement level search methods for TOTAL_ROSTERED')
+    parser.add_argument('--min-pa', type=float, default=150)
+    parser.add_argument('--min-sp-ip', type=float, default=70)
+    parser.add_argument('--min-rp-ip', type=float, default=30)
+    parser.add_argument('--non-prod-dollars', type=int, default=300)
+    parser.add_argument('--no-svh', action='store_true', help='Exclude saves and holds')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Worker processes (default: one per CPU)')
+    parser.add_argument('-n', '--name', default='Batch', help='Prefix for the saved calculation names')
+    parser.add_argument('--no-cache', action='store_true', help='Recalculate every job instead of reading matching cached calculations')
+    parser.add_argument('--timings', action='store_true', help='Print the time spent in each stage of each calculation and save the timings with the calculations')
+    return parser.parse_args(args)
+
+def print_result(result:batch_services.BatchResult, timings:bool=False) -> None:
+    print(f'Projection {result.job.projection_id}, {result.job.get_name()}: {len(result.values)} values in {result.seconds:.1f}s')
+    if timings and result.timer is not None:
+        print(result.timer.to_df().to_string(index=False))
+
+if __name__ == "__main__":
+    args = get_args()
+    logging.basicConfig(level=logging.INFO)
+    jobs = batch_services.get_job_grid(
+        args.projections,
+        [ScoringFormat[f] for f in args.formats],
+        args.teams,
+        [RankingBasis[b] for b in args.hitter_basis],
+        [RankingBasis[b] for b in args.pitcher_basis],
+        [RepLevelScheme[s] for s in args.schemes],
+        searches=[RepLevelSearch[s] for s in args.search],
+        min_pa=args.min_pa,
+        min_sp_ip=args.min_sp_ip,
+        min_rp_ip=args.min_rp_ip,
+        non_prod_dollars=args.non_prod_dollars,
+        include_svh=not args.no_svh
+    )
+    print(f'Running {len(jobs)} calculations')
+    start = time.time()
+    value_calcs = batch_services.run_batch(jobs, max_workers=args.workers, name_prefix=args.name, callback=partial(print_result, timings=args.timings),
+                                            use_cache=not args.no_cache, save_timings=args.timings)
+    elapsed = time.time() - start
+    print(f'Saved {len(value_calcs)} calculations (ids {", ".join(str(vc.index) for vc in value_calcs)}) in {elapsed:.1f}s')
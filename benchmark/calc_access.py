@@ -0,0 +1,75 @@
+'''Times ValueCalculation input and output access through the data_type indexes against the list scans they replaced, and reports the memory
+used by the per-calculation player value index and by the same values as a stored record array.
+
+Run from the repository root with: python -m benchmark.calc_access [iterations]'''
+import sys
+import timeit
+
+from domain.domain import ValueArrays, ValueCalculation, CalculationInput, ValueData
+from domain.enum import CalculationDataType, Position
+
+def scan_get(items:list, data_type:CalculationDataType, default=None) -> float:
+    '''The list scan previously used by get_input and get_output.'''
+    for item in items:
+        if item.data_type == data_type:
+            return item.value
+    return default
+
+def scan_set(items:list, data_type:CalculationDataType, value:float, item_type) -> None:
+    '''The list scan previously used by set_input and set_output.'''
+    for item in items:
+        if item.data_type == data_type:
+            item.value = value
+            return
+    item = item_type()
+    item.data_type = data_type
+    item.value = value
+    items.append(item)
+
+def get_populated_calculation() -> ValueCalculation:
+    '''Returns a ValueCalculation with an input and an output for every CalculationDataType, the worst case for a scan.'''
+    value_calc = ValueCalculation()
+    for data_type in CalculationDataType:
+        value_calc.set_input(data_type, float(data_type.value))
+        value_calc.set_output(data_type, float(data_type.value))
+    return value_calc
+
+def run(iterations:int=2000) -> dict:
+    '''Returns the time in microseconds per pass over every CalculationDataType for each access pattern.'''
+    value_calc = get_populated_calculation()
+    data_types = list(CalculationDataType)
+    cases = {
+        'get_input (scan)' : lambda: [scan_get(value_calc.inputs, dt) for dt in data_types],
+        'get_input (index)' : lambda: [value_calc.get_input(dt) for dt in data_types],
+        'set_input (scan)' : lambda: [scan_set(value_calc.inputs, dt, 1.0, CalculationInput) for dt in data_types],
+        'set_input (index)' : lambda: [value_calc.set_input(dt, 1.0) for dt in data_types],
+        'get_output (scan)' : lambda: [scan_get(value_calc.data, dt) for dt in data_types],
+        'get_output (index)' : lambda: [value_calc.get_output(dt) for dt in data_types],
+        'set_output (scan)' : lambda: [scan_set(value_calc.data, dt, 1.0, ValueData) for dt in data_types],
+        'set_output (index)' : lambda: [value_calc.set_output(dt, 1.0) for dt in data_types],
+    }
+    results = {}
+    for name, case in cases.items():
+        results[name] = min(timeit.repeat(case, number=iterations, repeat=3)) / iterations * 1e6
+    return results
+
+def value_index_memory(num_players:int=5000) -> dict:
+    '''Returns the player value index size and stored array size for a calculation with values at OVERALL, OFFENSE, Util, and one other position
+    for each player.'''
+    value_calc = ValueCalculation()
+    player_ids = range(num_players)
+    for pos in [Position.OVERALL, Position.OFFENSE, Position.POS_UTIL, Position.POS_OF]:
+        value_calc.set_player_values(player_ids, pos, [1.0] * num_players)
+    size = value_calc.get_value_index_size()
+    array = ValueArrays.to_array([pv.player_id for pv in value_calc.values], [pv.position for pv in value_calc.values], [pv.value for pv in value_calc.values])
+    return {'players' : num_players, 'values' : len(value_calc.values), 'bytes' : size, 'bytes_per_value' : size / len(value_calc.values),
+            'array_bytes' : array.nbytes}
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f'{len(CalculationDataType)} data types, {iterations} passes, best of 3')
+    for name, usec in run(iterations).items():
+        print(f'{name:<20} {usec:10.1f} us/pass')
+    for num_players in [1000, 5000, 20000]:
+        memory = value_index_memory(num_players)
+        print(f"value index, {memory['values']} values: {memory['bytes'] / 1024:.0f} KiB ({memory['bytes_per_value']:.0f} bytes/value), stored array {memory['array_bytes'] / 1024:.0f} KiB")
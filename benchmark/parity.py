@@ -0,0 +1,168 @@
+'''Checks that the column operations in BatPoint.calc_points_and_rates, ArmPoint.calc_points_and_rates, ArmPoint.estimate_role_splits, and
+ArmPoint.role_multiplier_array match the row-wise methods they replaced, value for value, on synthetic projections. Hitters and pitchers with
+no G, PA, or IP are included so the zero-rate paths are covered. Pitchers are also checked without the SV, HLD, and HBP columns, which the
+row-wise methods fill in, and role splits are checked with and without saves and holds.
+
+Run from the repository root with: python -m benchmark.parity [-n 3000] [--seed 0]'''
+import argparse
+import os
+import sys
+import tempfile
+from itertools import product
+from typing import List, Tuple
+
+import numpy as np
+from pandas import DataFrame
+
+#dao.session creates db/otto_toolbox.db in the working directory when it is imported, so the check runs in a temporary directory and leaves no
+#database behind
+_db_dir = tempfile.TemporaryDirectory()
+os.chdir(_db_dir.name)
+
+from benchmark import synthetic
+from benchmark.valuation import get_value_calculation
+from domain.enum import CalculationDataType as CDT, RankingBasis, RepLevelScheme, ScoringFormat
+from value.arm_points import ArmPoint
+from value.bat_points import BatPoint
+
+formats = [ScoringFormat.FG_POINTS, ScoringFormat.SABR_POINTS]
+#Rows given no playing time, so their rates take the divide-by-zero path
+num_zero_rows = 25
+
+def get_mismatches(name:str, expected:DataFrame, actual:DataFrame, columns:List[str]) -> List[str]:
+    '''Returns a description of each column whose values differ between the row-wise and column results.'''
+    mismatches = []
+    for col in columns:
+        row_wise = expected[col].to_numpy(dtype=float)
+        vectorized = actual[col].to_numpy(dtype=float)
+        if not np.array_equal(row_wise, vectorized, equal_nan=True):
+            diff = np.abs(row_wise - vectorized)
+            mismatches.append(f'{name} {col}: {int((diff > 0).sum())} rows differ, max difference {np.nanmax(diff)}')
+    return mismatches
+
+def get_projections(num_players:int, seed:int) -> Tuple[DataFrame, DataFrame]:
+    '''Returns synthetic hitter and pitcher projections with the first rows of each given no playing time.'''
+    hitters, pitchers = synthetic.get_projections(num_players, seed=seed)
+    hitters.loc[hitters.index[:num_zero_rows], ['G', 'PA']] = 0
+    pitchers.loc[pitchers.index[:num_zero_rows], ['G', 'GS', 'IP']] = 0
+    return hitters, pitchers
+
+def check_hitters(hitters:DataFrame, format:ScoringFormat, hitter_basis:RankingBasis) -> List[str]:
+    '''Compares the hitter Points, P/G, and P/PA columns against calc_bat_points, calc_ppg, and calc_pppa.'''
+    bat_points = BatPoint(get_value_calculation(format, RepLevelScheme.NUM_ROSTERED, hitter_basis, RankingBasis.PIP))
+    expected = hitters.copy()
+    expected['Points'] = expected.apply(bat_points.calc_bat_points, axis=1)
+    expected['P/G'] = expected.apply(bat_points.calc_ppg, axis=1)
+    expected['P/PA'] = expected.apply(bat_points.calc_pppa, axis=1)
+    actual = hitters.copy()
+    bat_points.calc_points_and_rates(actual)
+    return get_mismatches(f'Hitters {format.name} {hitter_basis.name}', expected, actual, ['Points', 'P/G', 'P/PA'])
+
+def check_pitchers(pitchers:DataFrame, format:ScoringFormat, pitcher_basis:RankingBasis, drop_columns:List[str]) -> List[str]:
+    '''Compares the pitcher points and rate columns against calc_pitch_points, calc_pitch_points_no_svh, and the row-wise rate methods.'''
+    arm_points = ArmPoint(get_value_calculation(format, RepLevelScheme.NUM_ROSTERED, RankingBasis.PPG, pitcher_basis))
+    pitchers = pitchers.drop(columns=drop_columns)
+    expected = pitchers.copy()
+    expected['Points'] = expected.apply(arm_points.calc_pitch_points, axis=1)
+    expected['No SVH Points'] = expected.apply(arm_points.calc_pitch_points_no_svh, axis=1)
+    expected['P/IP'] = expected.apply(arm_points.calc_ppi, axis=1)
+    expected['No SVH P/IP'] = expected.apply(arm_points.calc_ppi_no_svh, axis=1)
+    columns = ['Points', 'No SVH Points', 'P/IP', 'No SVH P/IP']
+    if pitcher_basis == RankingBasis.PPG:
+        expected['PPG'] = expected.apply(arm_points.calc_ppg, axis=1)
+        expected['No SVH PPG'] = expected.apply(arm_points.calc_ppg_no_svh, axis=1)
+        columns.extend(['PPG', 'No SVH PPG'])
+    actual = pitchers.copy()
+    arm_points.calc_points_and_rates(actual)
+    dropped = f' without {"/".join(drop_columns)}' if len(drop_columns) > 0 else ''
+    return get_mismatches(f'Pitchers {format.name} {pitcher_basis.name}{dropped}', expected, actual, columns)
+
+def estimate_role_splits_row_wise(arm_points:ArmPoint, df:DataFrame) -> List[str]:
+    '''Sets the role split columns as estimate_role_splits did before it used column operations and returns the columns set.'''
+    df['IP RP'] = df.apply(arm_points.rp_ip_func, axis=1)
+    df['IP SP'] = df.apply(arm_points.sp_ip_func, axis=1)
+    df['FIP SP'] = df.apply(arm_points.sp_fip_calc, axis=1)
+    df['FIP RP'] = df.apply(arm_points.rp_fip_calc, axis=1)
+    prefix = 'No SVH ' if arm_points.no_sv_hld else ''
+    if arm_points.rank_basis == RankingBasis.PIP:
+        df['P/IP SP'] = df.apply(arm_points.sp_pip_calc, axis=1)
+        df['P/IP RP'] = df.apply(arm_points.rp_pip_calc, axis=1)
+        df['No SVH P/IP SP'] = df['P/IP SP']
+        df['No SVH P/IP RP'] = df.apply(arm_points.rp_no_svh_pip_calc, axis=1)
+        df['Rank SP Rate'] = df[f'{prefix}P/IP SP'].rank(ascending=False)
+        df['Rank RP Rate'] = df[f'{prefix}P/IP RP'].rank(ascending=False)
+        df['SP Multiplier'] = df.apply(arm_points.sp_multiplier_assignment, axis=1)
+        df['RP Multiplier'] = df.apply(arm_points.rp_multiplier_assignment, axis=1)
+        rate_cols = ['P/IP SP', 'P/IP RP', 'No SVH P/IP SP', 'No SVH P/IP RP']
+    else:
+        df['PPG SP'] = df.apply(arm_points.sp_ppg_calc, axis=1)
+        df['PPG RP'] = df.apply(arm_points.rp_ppg_calc, axis=1)
+        df['No SVH PPG SP'] = df['PPG SP']
+        df['No SVH PPG RP'] = df.apply(arm_points.rp_no_svh_ppg_calc, axis=1)
+        df['Rank SP Rate'] = df[f'{prefix}PPG SP'].rank(ascending=False)
+        df['Rank RP Rate'] = df[f'{prefix}PPG RP'].rank(ascending=False)
+        df['SP Multiplier'] = 1
+        df['RP Multiplier'] = 1
+        rate_cols = ['PPG SP', 'PPG RP', 'No SVH PPG SP', 'No SVH PPG RP']
+    return ['IP RP', 'IP SP', 'FIP SP', 'FIP RP'] + rate_cols + ['Rank SP Rate', 'Rank RP Rate', 'SP Multiplier', 'RP Multiplier']
+
+def check_role_splits(pitchers:DataFrame, format:ScoringFormat, pitcher_basis:RankingBasis, include_svh:bool) -> List[str]:
+    '''Compares the columns of estimate_role_splits against the row-wise role split methods, and role_multiplier_array against
+    sp_multiplier_assignment and rp_multiplier_assignment on the same ranks, for the pitchers that pass not_a_belly_itcher_filter.'''
+    value_calc = get_value_calculation(format, RepLevelScheme.NUM_ROSTERED, RankingBasis.PPG, pitcher_basis)
+    value_calc.set_input(CDT.INCLUDE_SVH, 1 if include_svh else 0)
+    arm_points = ArmPoint(value_calc)
+    pitchers = pitchers.copy()
+    arm_points.calc_points_and_rates(pitchers)
+    name = f'Role splits {format.name} {pitcher_basis.name}{"" if include_svh else " without SV/HLD"}'
+    mismatches = []
+    row_wise_mask = pitchers.apply(arm_points.not_a_belly_itcher_filter, axis=1).to_numpy(dtype=bool)
+    mask = arm_points.not_a_belly_itcher_mask(pitchers)
+    if not np.array_equal(row_wise_mask, mask):
+        mismatches.append(f'{name} rostered filter: {int((row_wise_mask != mask).sum())} rows differ')
+    real_pitchers = pitchers.loc[row_wise_mask]
+    expected = real_pitchers.copy()
+    columns = estimate_role_splits_row_wise(arm_points, expected)
+    expected_max = {'SP' : int((expected['IP SP'] >= arm_points.min_sp_ip).sum()), 'RP' : int((expected['IP RP'] >= arm_points.min_rp_ip).sum())}
+    actual = real_pitchers.copy()
+    arm_points.estimate_role_splits(actual)
+    mismatches.extend(get_mismatches(name, expected, actual, columns))
+    #The PPG multipliers are all 1, so the multipliers are also checked on the ranks directly
+    expected['SP Multiplier'] = expected.apply(arm_points.sp_multiplier_assignment, axis=1)
+    expected['RP Multiplier'] = expected.apply(arm_points.rp_multiplier_assignment, axis=1)
+    actual['SP Multiplier'] = arm_points.role_multiplier_array(actual['Rank SP Rate'], 6, 0.05)
+    actual['RP Multiplier'] = arm_points.role_multiplier_array(actual['Rank RP Rate'], 5, 0.15)
+    mismatches.extend(get_mismatches(f'{name} rank', expected, actual, ['SP Multiplier', 'RP Multiplier']))
+    if expected_max != arm_points.max_rost_num:
+        mismatches.append(f'{name} max rostered: {expected_max} != {arm_points.max_rost_num}')
+    return mismatches
+
+def run(num_players:int=3000, seed:int=0) -> Tuple[int, List[str]]:
+    '''Runs every check and returns the number of checks and the mismatches found.'''
+    hitters, pitchers = get_projections(num_players, seed)
+    num_checks = 0
+    mismatches = []
+    for format, hitter_basis in product(formats, [RankingBasis.PPG, RankingBasis.PPPA]):
+        mismatches.extend(check_hitters(hitters, format, hitter_basis))
+        num_checks += 1
+    for format, pitcher_basis, drop_columns in product(formats, [RankingBasis.PIP, RankingBasis.PPG], [[], ['SV', 'HLD', 'HBP']]):
+        mismatches.extend(check_pitchers(pitchers, format, pitcher_basis, drop_columns))
+        num_checks += 1
+    for format, pitcher_basis, include_svh in product(formats, [RankingBasis.PIP, RankingBasis.PPG], [True, False]):
+        mismatches.extend(check_role_splits(pitchers, format, pitcher_basis, include_svh))
+        num_checks += 1
+    return num_checks, mismatches
+
+def get_args(args=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Checks the vectorized points, rate, and role split columns against the row-wise methods.')
+    parser.add_argument('-n', '--players', type=int, default=3000, help='Number of synthetic players')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the synthetic projections')
+    return parser.parse_args(args)
+
+if __name__ == '__main__':
+    args = get_args()
+    num_checks, mismatches = run(args.players, args.seed)
+    for mismatch in mismatches:
+        print(mismatch)
+    print(f'{num_checks} checks, {len(mismatches)} mismatched columns')
+    sys.exit(1 if len(mismatches) > 0 else 0)
@@ -0,0 +1,156 @@
+'''Checks that the hot lookups in player_services, salary_services, projection_services, and calculation_services use indexes. Each lookup is
+run against the database, every statement it executes is captured, and SQLite's EXPLAIN QUERY PLAN is reported for each. A lookup fails the
+check if its plan scans a whole table it was not expected to, or has SQLite build an automatic index for the query because no index fits.
+
+Run from the repository root against db/otto_toolbox.db with: python -m benchmark.query_plans [-v]'''
+import argparse
+import logging
+import re
+import sys
+from typing import Callable, Dict, List, Set, Tuple
+
+from sqlalchemy import event, func, select, text
+from sqlalchemy.engine import Connection
+
+from dao.session import Session, engine
+from domain.domain import Base, Player, PlayerProjection, Projection, Salary_Info, ValueCalculation
+from services import calculation_services, player_services, projection_services
+
+class QueryPlan():
+    '''The EXPLAIN QUERY PLAN details of one captured statement.'''
+
+    def __init__(self, statement:str, details:List[str]):
+        self.statement = statement
+        self.details = details
+
+    def get_unindexed_tables(self) -> Set[str]:
+        '''Returns the tables the plan reads in full or through an automatic index. Aliases are resolved to their tables and subqueries are
+        skipped.'''
+        tables = set()
+        for detail in self.details:
+            words = detail.split()
+            if len(words) < 2 or words[0] not in ['SCAN', 'SEARCH']:
+                continue
+            table = get_table_name(words[1])
+            if table is None:
+                continue
+            if (words[0] == 'SCAN' and ' USING ' not in detail) or ' AUTOMATIC ' in detail:
+                tables.add(table)
+        return tables
+
+class LookupCheck():
+    '''A service lookup to run and the tables it is expected to scan in full, such as those it returns every row of.'''
+
+    def __init__(self, name:str, lookup:Callable, expected_scans:Set[str]=None):
+        self.name = name
+        self.lookup = lookup
+        self.expected_scans = expected_scans if expected_scans is not None else set()
+        self.plans:List[QueryPlan] = []
+
+    def get_unexpected_scans(self) -> Set[str]:
+        '''Returns the tables read without an index by any of the captured statements that the lookup was not expected to scan.'''
+        scanned = set()
+        for plan in self.plans:
+            scanned.update(plan.get_unindexed_tables())
+        return scanned - self.expected_scans
+
+def get_table_name(name:str) -> str:
+    '''Returns the table for a name in a query plan, which may be an alias such as salary_info_1, or None if it is not a table.'''
+    if name in Base.metadata.tables:
+        return name
+    table = re.sub(r'_\d+$', '', name)
+    if table in Base.metadata.tables:
+        return table
+    return None
+
+def get_query_plan(conn:Connection, statement:str, parameters) -> QueryPlan:
+    '''Returns the query plan of the statement with the given parameters.'''
+    cursor = conn.connection.cursor()
+    try:
+        rows = cursor.execute(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+    finally:
+        cursor.close()
+    return QueryPlan(statement, [row[3] for row in rows])
+
+def run_check(check:LookupCheck) -> LookupCheck:
+    '''Runs the check's lookup and captures the query plan of each SELECT it executes.'''
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            check.plans.append(get_query_plan(conn, statement, parameters))
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        check.lookup()
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+    return check
+
+def get_sample_ids() -> Dict[str, object]:
+    '''Returns ids of existing rows to look up, or None for any the database doesn't have.'''
+    with Session() as session:
+        return {
+            'fg_major_id' : session.scalar(select(Player.fg_major_id).where(Player.fg_major_id != '').limit(1)),
+            'fg_minor_id' : session.scalar(select(Player.fg_minor_id).where(Player.fg_minor_id != '').limit(1)),
+            'ottoneu_id' : session.scalar(select(Player.ottoneu_id).where(Player.ottoneu_id != None).limit(1)),
+            'projection_id' : session.scalar(select(func.max(Projection.index))),
+            'player_projection_id' : session.scalar(select(func.max(PlayerProjection.index))),
+            'calculation_id' : session.scalar(select(func.max(ValueCalculation.index))),
+        }
+
+def get_player_salary_info() -> None:
+    '''Runs the player and salary join from salary_services.update_salary_info, which needs a salary download to call directly.'''
+    with Session() as session:
+        session.query(Player).join(Salary_Info).all()
+
+def get_checks(ids:Dict[str, object]) -> List[LookupCheck]:
+    '''Returns the lookup checks that can be run with the sample ids.'''
+    checks = []
+    if ids['fg_major_id'] is not None:
+        checks.append(LookupCheck('player_services.get_player_by_fg_id (major)', lambda: player_services.get_player_by_fg_id(ids['fg_major_id'])))
+    if ids['fg_minor_id'] is not None:
+        checks.append(LookupCheck('player_services.get_player_by_fg_id (minor)', lambda: player_services.get_player_by_fg_id(ids['fg_minor_id'])))
+    if ids['fg_major_id'] is not None and ids['fg_minor_id'] is not None:
+        checks.append(LookupCheck('player_services.get_player_ids_by_fg_id', lambda: player_services.get_player_ids_by_fg_id([ids['fg_major_id'], ids['fg_minor_id']])))
+    if ids['ottoneu_id'] is not None:
+        checks.append(LookupCheck('player_services.get_player_ids_by_ottoneu_id', lambda: player_services.get_player_ids_by_ottoneu_id([ids['ottoneu_id']])))
+    #Substring matches can't use an index
+    checks.append(LookupCheck('player_services.search_by_name', lambda: player_services.search_by_name('smith'), {'player'}))
+    #Every player with salary information is read, so one side of the join is scanned
+    checks.append(LookupCheck('salary_services.update_salary_info player join', get_player_salary_info, {'player', 'salary_info'}))
+    if ids['projection_id'] is not None:
+        checks.append(LookupCheck('projection_services.get_projection', lambda: projection_services.get_projection(ids['projection_id'])))
+        checks.append(LookupCheck('projection_services.load_projection_dfs', lambda: projection_services.load_projection_dfs(ids['projection_id'])))
+        checks.append(LookupCheck('projection_services.load_projection_arrays', lambda: projection_services.load_projection_arrays(ids['projection_id'])))
+    if ids['player_projection_id'] is not None:
+        checks.append(LookupCheck('projection_services.get_player_projection', lambda: projection_services.get_player_projection(ids['player_projection_id'])))
+    if ids['calculation_id'] is not None:
+        checks.append(LookupCheck('calculation_services.load_calculation', lambda: calculation_services.load_calculation(ids['calculation_id'])))
+    return checks
+
+def get_indexes() -> List[Tuple[str, str]]:
+    '''Returns the name and table of each index in the database.'''
+    with Session() as session:
+        return session.execute(text("SELECT name, tbl_name FROM sqlite_master WHERE type = 'index' ORDER BY tbl_name, name")).all()
+
+def get_args(args=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Checks that the hot service lookups use indexes.')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Print every captured statement and its plan')
+    return parser.parse_args(args)
+
+if __name__ == '__main__':
+    args = get_args()
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    print('Indexes: ' + ', '.join(f'{table}.{name}' for name, table in get_indexes() if not name.startswith('sqlite_autoindex')))
+    failed = 0
+    for check in get_checks(get_sample_ids()):
+        run_check(check)
+        unexpected = check.get_unexpected_scans()
+        status = 'OK' if len(unexpected) == 0 else f'SCANS {", ".join(sorted(unexpected))}'
+        print(f'{check.name}: {len(check.plans)} statements, {status}')
+        if len(unexpected) > 0:
+            failed += 1
+        for plan in check.plans:
+            if args.verbose or len(plan.get_unindexed_tables() - check.expected_scans) > 0:
+                print(f'    {" ".join(plan.statement.split())}')
+                for detail in plan.details:
+                    print(f'        {detail}')
+    sys.exit(1 if failed > 0 else 0)
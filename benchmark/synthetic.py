@@ -0,0 +1,73 @@
+'''Generates synthetic hitter and pitcher projection DataFrames in the shape returned by projection_services.convert_to_df for benchmarking
+the value calculation. Playing time and rate distributions are loosely modeled on a full-season projection set: most players are fringe
+or part-time, hitters can be eligible at several positions, and some pitchers split time between starting and relief.'''
+from typing import List, Tuple
+
+import numpy as np
+from numpy.random import Generator
+from pandas import DataFrame, Index
+
+#Position(s) strings and their relative frequency among hitters
+hitter_positions = {
+    'C':8, 'C/1B':1, '1B':6, '1B/OF':3, '1B/3B':1, '2B':4, '2B/SS':4, '2B/OF':2, '2B/3B/SS':1, 'SS':4, 'SS/3B':2, '3B':5, '3B/OF':1,
+    'OF':20, 'Util':3,
+}
+#Share of pitchers in each role. Swingmen (SP/RP) have both starts and relief appearances.
+pitcher_roles = {'SP':0.45, 'RP':0.45, 'SP/RP':0.10}
+
+def get_hitters(num:int, rng:Generator, start_id:int=1) -> DataFrame:
+    '''Returns a DataFrame of num synthetic hitter projections with ids starting at start_id.'''
+    #Regulars, part-timers, and fringe players
+    tier = rng.choice(3, num, p=[0.25, 0.30, 0.45])
+    pa = np.round(np.select([tier == 0, tier == 1], [rng.uniform(450, 700, num), rng.uniform(150, 450, num)], rng.uniform(0, 150, num)))
+    g = np.round(pa / rng.uniform(3.9, 4.4, num))
+    ab = np.round(pa * rng.uniform(0.86, 0.91, num))
+    h = np.round(ab * rng.normal(0.250, 0.025, num).clip(0.150, 0.340))
+    doubles = np.round(h * rng.uniform(0.15, 0.25, num))
+    triples = np.round(h * rng.uniform(0.0, 0.04, num))
+    hr = np.round(h * rng.uniform(0.04, 0.25, num))
+    bb = np.round(pa * rng.uniform(0.05, 0.14, num))
+    hbp = np.round(pa * rng.uniform(0.0, 0.02, num))
+    sb = np.round(pa * rng.exponential(0.012, num))
+    cs = np.round(sb * rng.uniform(0.15, 0.4, num))
+    positions = list(hitter_positions.keys())
+    weights = np.array(list(hitter_positions.values()), dtype=float)
+    pos = rng.choice(positions, num, p=weights / weights.sum())
+    return DataFrame({
+        'Name':[f'Hitter {idx}' for idx in range(num)], 'Team':rng.choice(30, num).astype(str), 'Position(s)':pos,
+        'G':g, 'PA':pa, 'AB':ab, 'H':h, '2B':doubles, '3B':triples, 'HR':hr, 'BB':bb, 'HBP':hbp, 'SB':sb, 'CS':cs,
+    }, index=Index(range(start_id, start_id + num), name='ID'))
+
+def get_pitchers(num:int, rng:Generator, start_id:int=1) -> DataFrame:
+    '''Returns a DataFrame of num synthetic pitcher projections with ids starting at start_id.'''
+    roles = rng.choice(list(pitcher_roles.keys()), num, p=list(pitcher_roles.values()))
+    starter = roles == 'SP'
+    reliever = roles == 'RP'
+    g = np.round(np.where(starter, rng.uniform(3, 33, num), rng.uniform(3, 72, num)))
+    gs = np.where(starter, g, np.where(reliever, 0, np.round(g * rng.uniform(0.1, 0.9, num))))
+    ip = np.round(gs * rng.uniform(4.5, 6.3, num) + (g - gs) * rng.uniform(0.8, 1.3, num), 1)
+    so = np.round(ip * rng.uniform(0.65, 1.35, num))
+    h = np.round(ip * rng.uniform(0.75, 1.1, num))
+    bb = np.round(ip * rng.uniform(0.25, 0.45, num))
+    hbp = np.round(ip * rng.uniform(0.02, 0.05, num))
+    hr = np.round(ip * rng.uniform(0.08, 0.16, num))
+    sv = np.where(gs == 0, np.round(rng.exponential(6, num)), 0)
+    hld = np.where(gs == 0, np.round(rng.exponential(6, num)), 0)
+    fip = np.round(rng.normal(4.3, 0.6, num).clip(2.2, 6.5), 2)
+    return DataFrame({
+        'Name':[f'Pitcher {idx}' for idx in range(num)], 'Team':rng.choice(30, num).astype(str), 'Position(s)':roles,
+        'G':g, 'GS':gs, 'IP':ip, 'SO':so, 'H':h, 'BB':bb, 'HBP':hbp, 'HR':hr, 'SV':sv, 'HLD':hld, 'FIP':fip,
+    }, index=Index(range(start_id, start_id + num), name='ID'))
+
+def get_projections(num_players:int, seed:int=0, hitter_share:float=0.55, two_way:int=1) -> List[DataFrame]:
+    '''Returns synthetic [hitter, pitcher] projection DataFrames totaling num_players. The first two_way pitcher ids are shared with
+    hitters, as a two-way player's would be.'''
+    rng = np.random.default_rng(seed)
+    num_hitters = int(num_players * hitter_share)
+    hitters = get_hitters(num_hitters, rng)
+    pitchers = get_pitchers(num_players - num_hitters, rng, start_id=num_hitters + 1 - two_way)
+    return [hitters, pitchers]
+
+def get_position_counts(projs:List[DataFrame]) -> Tuple[int, int]:
+    '''Returns the number of multi-position hitters and swingman pitchers in the projections.'''
+    return int(projs[0]['Position(s)'].str.contains('/').sum()), int((projs[1]['Position(s)'] == 'SP/RP').sum())
@@ -0,0 +1,225 @@
+'''Times BatPoint.calc_par, ArmPoint.calc_par, and PointValues.calculate_values on synthetic projections of several sizes under every
+replacement level scheme and ranking basis. Reports the best wall time, throughput, search iterations, and peak traced memory of each case
+as JSON so runs can be compared between commits.
+
+Run from the repository root with: python -m benchmark.valuation [-s 1000 5000 20000] [-o results.json]
+Compare two runs with: python -m benchmark.valuation --compare before.json after.json'''
+import argparse
+from datetime import datetime
+from itertools import product
+import json
+import logging
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from benchmark import synthetic
+from domain.domain import ValueCalculation
+from domain.enum import CalculationDataType as CDT, Position, RankingBasis, RepLevelScheme, RepLevelSearch, ScoringFormat
+from services import batch_services
+from value.point_values import PointValues
+
+hitter_bases = [RankingBasis.PPG, RankingBasis.PPPA]
+pitcher_bases = [RankingBasis.PIP, RankingBasis.PPG]
+#Fixed advanced inputs so results do not depend on the stored advanced options
+advanced_targets = {CDT.BATTER_G_TARGET:162, CDT.GS_LIMIT:10, CDT.RP_G_TARGET:10, CDT.IP_TARGET:1500, CDT.RP_IP_TARGET:300}
+#Fields identifying a case between runs
+case_keys = ['case', 'players', 'format', 'scheme', 'search', 'hitter_basis', 'pitcher_basis']
+
+def get_value_calculation(format:ScoringFormat, scheme:RepLevelScheme, hitter_basis:RankingBasis, pitcher_basis:RankingBasis, num_teams:int=12,
+                            search:RepLevelSearch=RepLevelSearch.HEURISTIC) -> ValueCalculation:
+    '''Returns a ValueCalculation with the Create Player Values default inputs for the settings.'''
+    value_calc = ValueCalculation()
+    value_calc.format = format
+    value_calc.hitter_basis = hitter_basis
+    value_calc.pitcher_basis = pitcher_basis
+    value_calc.inputs = []
+    value_calc.set_input(CDT.NUM_TEAMS, num_teams)
+    value_calc.set_input(CDT.NON_PRODUCTIVE_DOLLARS, 300)
+    value_calc.set_input(CDT.PA_TO_RANK, 150)
+    value_calc.set_input(CDT.SP_IP_TO_RANK, 70)
+    value_calc.set_input(CDT.RP_IP_TO_RANK, 30)
+    value_calc.set_input(CDT.INCLUDE_SVH, 1)
+    value_calc.set_input(CDT.REP_LEVEL_SCHEME, scheme.value)
+    for pos in Position.get_discrete_offensive_pos() + Position.get_discrete_pitching_pos():
+        if scheme == RepLevelScheme.STATIC_REP_LEVEL:
+            if pos in Position.get_discrete_offensive_pos():
+                rep_level = batch_services.default_static_rep_levels[hitter_basis]
+            else:
+                rep_level = batch_services.default_static_pitch_rep_levels[pitcher_basis][pos.value]
+            value_calc.set_input(CDT.pos_to_rep_level().get(pos), rep_level)
+        elif scheme == RepLevelScheme.NUM_ROSTERED:
+            value_calc.set_input(CDT.pos_to_num_rostered().get(pos), batch_services.default_num_rostered[pos.value])
+        else:
+            value_calc.set_input(CDT.pos_to_num_rostered().get(pos), 0)
+    if scheme == RepLevelScheme.TOTAL_ROSTERED:
+        value_calc.set_input(CDT.REP_LEVEL_SEARCH, search.value)
+        value_calc.set_input(CDT.IP_TARGET, advanced_targets[CDT.IP_TARGET])
+        value_calc.set_input(CDT.RP_IP_TARGET, advanced_targets[CDT.RP_IP_TARGET])
+        value_calc.set_input(CDT.GS_LIMIT, advanced_targets[CDT.GS_LIMIT])
+    if scheme == RepLevelScheme.FILL_GAMES:
+        for data_type, target in advanced_targets.items():
+            value_calc.set_input(data_type, target)
+    return value_calc
+
+def time_case(prepare:Callable, calc:Callable, repeat:int, memory:bool=True) -> Tuple[float, int, object]:
+    '''Returns the best wall time of calc over repeat calls, the peak traced memory of one more call (None if memory is False), and the
+    last result. prepare is called before each call, untimed, and its result is passed to calc. Memory is traced in a separate call since
+    tracing slows down allocation-heavy code.'''
+    best = None
+    for _ in range(repeat):
+        args = prepare()
+        start = time.perf_counter()
+        result = calc(*args)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    if not memory:
+        return best, None, result
+    args = prepare()
+    tracemalloc.start()
+    calc(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+def get_result(case:str, players:int, rows:int, format:ScoringFormat, scheme:RepLevelScheme, search:RepLevelSearch, hitter_basis:RankingBasis,
+                pitcher_basis:RankingBasis, seconds:float, peak_bytes:int, iterations:int) -> Dict[str, object]:
+    '''Returns a case result as a dictionary of plain values.'''
+    return {
+        'case' : case,
+        'players' : players,
+        'format' : format.name if format is not None else None,
+        'scheme' : scheme.name,
+        'search' : search.name if scheme == RepLevelScheme.TOTAL_ROSTERED else None,
+        'hitter_basis' : hitter_basis.name if hitter_basis is not None else None,
+        'pitcher_basis' : pitcher_basis.name if pitcher_basis is not None else None,
+        'rows' : rows,
+        'seconds' : seconds,
+        'rows_per_second' : rows / seconds if seconds > 0 else None,
+        'peak_bytes' : peak_bytes,
+        'iterations' : iterations,
+    }
+
+def get_scheme_searches(schemes:List[RepLevelScheme], searches:List[RepLevelSearch]) -> List[Tuple[RepLevelScheme, RepLevelSearch]]:
+    '''Returns each scheme paired with each search method. Search methods only apply to TOTAL_ROSTERED, so other schemes are paired with
+    the first only.'''
+    return [(scheme, search) for scheme in schemes for search in (searches if scheme == RepLevelScheme.TOTAL_ROSTERED else searches[:1])]
+
+def run_size(num_players:int, formats:List[ScoringFormat], schemes:List[RepLevelScheme], repeat:int, seed:int=0, memory:bool=True,
+                searches:List[RepLevelSearch]=[RepLevelSearch.HEURISTIC]) -> List[Dict[str, object]]:
+    '''Returns the results of every case for synthetic projections of num_players.'''
+    hitters, pitchers = synthetic.get_projections(num_players, seed=seed)
+    scheme_searches = get_scheme_searches(schemes, searches)
+    results = []
+    #Hitter PAR does not depend on the format or pitcher basis
+    for (scheme, search), hitter_basis in product(scheme_searches, hitter_bases):
+        value_calc = get_value_calculation(formats[0], scheme, hitter_basis, pitcher_bases[0], search=search)
+        def prepare():
+            return PointValues(value_calc).get_point_calculators()[0], hitters.copy()
+        def calc(pos_points, pos_proj):
+            pos_points.calc_par(pos_proj, value_calc.get_input(CDT.PA_TO_RANK))
+            return pos_points
+        seconds, peak, pos_points = time_case(prepare, calc, repeat, memory)
+        results.append(get_result('BatPoint.calc_par', num_players, len(hitters), None, scheme, search, hitter_basis, None, seconds, peak, pos_points.iterations))
+    for format, (scheme, search), pitcher_basis in product(formats, scheme_searches, pitcher_bases):
+        value_calc = get_value_calculation(format, scheme, hitter_bases[0], pitcher_basis, search=search)
+        def prepare():
+            return PointValues(value_calc).get_point_calculators()[1], pitchers.copy()
+        def calc(pitch_points, pitch_proj):
+            pitch_points.calc_par(pitch_proj)
+            return pitch_points
+        seconds, peak, pitch_points = time_case(prepare, calc, repeat, memory)
+        results.append(get_result('ArmPoint.calc_par', num_players, len(pitchers), format, scheme, search, None, pitcher_basis, seconds, peak, pitch_points.iterations))
+    for format, (scheme, search), hitter_basis, pitcher_basis in product(formats, scheme_searches, hitter_bases, pitcher_bases):
+        def prepare():
+            value_calc = get_value_calculation(format, scheme, hitter_basis, pitcher_basis, search=search)
+            return (PointValues(value_calc, projs=[hitters.copy(), pitchers.copy()]),)
+        def calc(point_values):
+            point_values.calculate_values()
+            return point_values
+        seconds, peak, point_values = time_case(prepare, calc, repeat, memory)
+        iterations = sum(timing.iterations for timing in point_values.timer.stages)
+        results.append(get_result('PointValues.calculate_values', num_players, len(hitters) + len(pitchers), format, scheme, search, hitter_basis,
+                                    pitcher_basis, seconds, peak, iterations))
+        logging.info(f'{num_players} players, {format.name}, {scheme.name} ({search.name}), {hitter_basis.name}/{pitcher_basis.name}: {seconds:.3f}s')
+    return results
+
+def get_commit() -> str:
+    '''Returns the current git commit of the repository, or None if it can't be determined.'''
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(sizes:List[int], formats:List[ScoringFormat], schemes:List[RepLevelScheme], repeat:int=3, seed:int=0, memory:bool=True,
+        searches:List[RepLevelSearch]=[RepLevelSearch.HEURISTIC]) -> Dict[str, object]:
+    '''Returns the run metadata and the results of every case at every size.'''
+    results = []
+    for num_players in sizes:
+        projs = synthetic.get_projections(num_players, seed=seed)
+        multi_pos, swingmen = synthetic.get_position_counts(projs)
+        logging.info(f'{num_players} players: {len(projs[0])} hitters ({multi_pos} multi-position), {len(projs[1])} pitchers ({swingmen} swingmen)')
+        results.extend(run_size(num_players, formats, schemes, repeat, seed=seed, memory=memory, searches=searches))
+    return {
+        'meta' : {
+            'timestamp' : datetime.now().isoformat(timespec='seconds'),
+            'commit' : get_commit(),
+            'python' : platform.python_version(),
+            'numpy' : np.__version__,
+            'pandas' : pd.__version__,
+            'platform' : platform.platform(),
+            'repeat' : repeat,
+            'seed' : seed,
+        },
+        'results' : results,
+    }
+
+def compare(before:Dict[str, object], after:Dict[str, object]) -> DataFrame:
+    '''Returns the time, throughput, and peak memory of each case in both runs, with the ratio of the times. Cases only in one run are
+    omitted.'''
+    before_df = DataFrame(before['results'])
+    after_df = DataFrame(after['results'])
+    merged = before_df.merge(after_df, on=case_keys, suffixes=(' before', ' after'))
+    merged['speedup'] = merged['seconds before'] / merged['seconds after']
+    merged['memory ratio'] = merged['peak_bytes after'] / merged['peak_bytes before']
+    return merged[case_keys + ['seconds before', 'seconds after', 'speedup', 'peak_bytes before', 'peak_bytes after', 'memory ratio']]
+
+def get_args(args=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Benchmarks the value calculation on synthetic projections.')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[1000, 5000, 20000], help='Total players in each synthetic projection')
+    parser.add_argument('-f', '--formats', nargs='+', default=[ScoringFormat.FG_POINTS.name, ScoringFormat.H2H_FG_POINTS.name],
+                        choices=[f.name for f in ScoringFormat if ScoringFormat.is_points_type(f)])
+    parser.add_argument('--schemes', nargs='+', default=[s.name for s in RepLevelScheme], choices=[s.name for s in RepLevelScheme])
+    parser.add_argument('--searches', nargs='+', default=[s.name for s in RepLevelSearch], choices=[s.name for s in RepLevelSearch],
+                        help='Replacement level search methods to run for TOTAL_ROSTERED')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Timed runs of each case; the best is reported')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='Skip the traced run of each case used to measure peak memory')
+    parser.add_argument('-o', '--output', help='File to write the JSON results to instead of stdout')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='Compare two result files instead of running')
+    return parser.parse_args(args)
+
+if __name__ == '__main__':
+    args = get_args()
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    if args.compare:
+        with open(args.compare[0]) as before_file, open(args.compare[1]) as after_file:
+            comparison = compare(json.load(before_file), json.load(after_file))
+        with pd.option_context('display.width', 200, 'display.max_rows', None, 'display.max_columns', None):
+            print(comparison.to_string(index=False))
+    else:
+        output = run(args.sizes, [ScoringFormat[f] for f in args.formats], [RepLevelScheme[s] for s in args.schemes], repeat=args.repeat, seed=args.seed,
+                        memory=not args.no_memory, searches=[RepLevelSearch[s] for s in args.searches])
+        if args.output:
+            with open(args.output, 'w') as output_file:
+                json.dump(output, output_file, indent=2)
+        else:
+            print(json.dumps(output, indent=2))
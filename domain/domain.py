@@ -1,13 +1,36 @@
 from __future__ import annotations
 from sqlalchemy import Column, ForeignKey, Index
-from sqlalchemy import Integer, String, Boolean, Float, Date, Enum, TIMESTAMP
+from sqlalchemy import Integer, String, Boolean, Float, Date, Enum, TIMESTAMP, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
+from sqlalchemy.orm.attributes import set_committed_value
+import io
+import numpy as np
+from pandas import DataFrame
 import re
+import sys
+from itertools import repeat
+from typing import Dict, Iterable, List, Tuple
 from domain.enum import CalculationDataType, ProjectionType, RankingBasis, ScoringFormat, StatType, Position, IdType
 
 Base = declarative_base()
 
+def _get_cached_index(owner:Base, name:str, items:list, add) -> dict:
+    '''Gets the named per-instance lookup of the given relationship list, built by calling add(lookup, item) for each item. The lookup is rebuilt if the
+    list has been replaced or modified outside of the owner's setters.'''
+    cached = getattr(owner, name, None)
+    if cached is None or cached[0] is not items or cached[1] != len(items):
+        lookup = {}
+        for item in items:
+            add(lookup, item)
+        cached = [items, len(items), lookup]
+        setattr(owner, name, cached)
+    return cached[2]
+
+def _mark_indexed(owner:Base, name:str, items:list) -> None:
+    '''Records that the named lookup already reflects items appended by one of the owner's setters.'''
+    getattr(owner, name)[1] = len(items)
+
 class Property(Base):
     __tablename__ = "properties"
     name = Column(String, primary_key=True)
@@ -29,7 +52,7 @@ class Player(Base):
     values = relationship("PlayerValue", back_populates="player", cascade="all, delete")
     projections = relationship("PlayerProjection", back_populates="player", cascade="all, delete")
 
-    __table_args__ = (Index('idx_fg_id','FG MajorLeagueID','FG MinorLeagueID'),)
+    __table_args__ = (Index('idx_fg_id','FG MajorLeagueID','FG MinorLeagueID'), Index('idx_fg_minor_id','FG MinorLeagueID'))
 
     def get_fg_id(self) -> object:
         '''Returns the FanGraphs Major League id, if available, otherwise returns the FanGraphs Minor League id.'''
@@ -138,6 +161,8 @@ class Salary_Info(Base):
     last_10 = Column("Last 10",Float)
     roster_percentage = Column("Roster %",Float)
 
+    __table_args__ = (Index('idx_salary_info_player','player_id','format'),)
+
 class PlayerValue(Base):
     __tablename__ = "player_value"
     index = Column(Integer, primary_key=True)
@@ -152,6 +177,49 @@ class PlayerValue(Base):
 
     value = Column(Float)
 
+    __table_args__ = (Index('idx_player_value_calculation','calculation_id','player_id'), Index('idx_player_value_player','player_id'))
+
+class ValueArrays(Base):
+    '''Columnar storage of a ValueCalculation's player values as a .npy record array of player id, Position code, and value, in the order the
+    values were set. The array is stored uncompressed so it can be read in place without copying.'''
+    __tablename__ = "value_arrays"
+    calculation_id = Column(Integer, ForeignKey("value_calculation.index"), primary_key=True)
+    calculation = relationship("ValueCalculation", back_populates="arrays")
+
+    data = Column(LargeBinary, nullable=False)
+
+    dtype = np.dtype([('player_id', '<i8'), ('position', 'i1'), ('value', '<f8')])
+    #Position codes are indexes into the Position enum, so new Positions must be added at the end
+    positions = list(Position)
+
+    @staticmethod
+    def to_array(player_ids:Iterable[int], positions:Iterable[Position], values:Iterable[float]) -> np.ndarray:
+        '''Returns the record array for parallel sequences of player ids, positions, and values.'''
+        position_codes = {pos : code for code, pos in enumerate(ValueArrays.positions)}
+        player_ids = np.asarray(list(player_ids), dtype=np.int64)
+        array = np.empty(len(player_ids), dtype=ValueArrays.dtype)
+        array['player_id'] = player_ids
+        array['position'] = [position_codes[pos] for pos in positions]
+        array['value'] = list(values)
+        return array
+
+    @staticmethod
+    def get_data(array:np.ndarray) -> bytes:
+        '''Returns the record array as the contents of a .npy file.'''
+        buffer = io.BytesIO()
+        np.save(buffer, array, allow_pickle=False)
+        return buffer.getvalue()
+
+    @staticmethod
+    def read_data(data:bytes) -> np.ndarray:
+        '''Returns a read-only record array over the stored .npy contents. Only the header is parsed.'''
+        buffer = io.BytesIO(data)
+        if np.lib.format.read_magic(buffer) == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(buffer)
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(buffer)
+        return np.frombuffer(data, dtype=dtype, count=shape[0], offset=buffer.tell())
+
 class ValueCalculation(Base):
     __tablename__ = "value_calculation"
     index = Column(Integer, primary_key=True)
@@ -168,18 +236,113 @@ class ValueCalculation(Base):
 
     inputs = relationship("CalculationInput", back_populates="calculation", cascade="all, delete", lazy='joined')
     values = relationship("PlayerValue", back_populates="calculation", cascade="all, delete")
+    arrays = relationship("ValueArrays", back_populates="calculation", uselist=False, cascade="all, delete")
     data = relationship("ValueData", back_populates="calculation", cascade="all, delete", lazy='joined')
 
-    value_dict = {}
-
-    def init_value_dict(self) -> None:
-        '''Initializes a dictionary that is keyed off of player_id, then off of Position with a value of the PlayerValue'''
-        for pv in self.values:
-            if pv.player_id not in self.value_dict:
-                player_dict = {}
-                self.value_dict[pv.player_id] = player_dict
-            player_dict = self.value_dict[pv.player_id]
-            player_dict[pv.position] = pv
+    def get_input_index(self) -> dict[CalculationDataType, CalculationInput]:
+        '''Gets the data_type index of the ValueCalculation.inputs list.'''
+        return _get_cached_index(self, '_input_index', self.inputs, lambda lookup, inp: lookup.setdefault(inp.data_type, inp))
+
+    def get_output_index(self) -> dict[CalculationDataType, ValueData]:
+        '''Gets the data_type index of the ValueCalculation.data list.'''
+        return _get_cached_index(self, '_output_index', self.data, lambda lookup, data: lookup.setdefault(data.data_type, data))
+
+    def get_value_index(self) -> dict[int, dict[Position, PlayerValue]]:
+        '''Gets the index of the ValueCalculation.values list that is keyed off of player_id, then off of Position with a value of the PlayerValue.
+        Stored values are added to the values list first.'''
+        self._load_stored_values()
+        return _get_cached_index(self, '_value_index', self.values, lambda lookup, pv: lookup.setdefault(pv.player_id, {}).setdefault(pv.position, pv))
+
+    def set_stored_values(self, array:np.ndarray, players:dict[int, Player]=None) -> None:
+        '''Sets the player values read from the calculation's ValueArrays, which are used in place of the values list. PlayerValues are only created
+        for the players that are looked up, with their Player taken from players.'''
+        #The array, players by id, array rows by player id (built on first lookup), and PlayerValues created by player id
+        self._stored_values = [array, players if players is not None else {}, None, {}]
+
+    def set_stored_players(self, players:dict[int, Player]) -> None:
+        '''Sets the Players by id given to PlayerValues created from the stored values.'''
+        self._stored_values[1] = players
+
+    def has_values(self) -> bool:
+        '''Returns True if the ValueCalculation has any player values.'''
+        stored = getattr(self, '_stored_values', None)
+        if stored is not None and len(stored[0]) > 0:
+            return True
+        return len(self.values) > 0
+
+    def get_values_df(self) -> DataFrame:
+        '''Returns the player values as a DataFrame with player_id, position, and value columns, read from the stored values without creating
+        PlayerValues if they are set.'''
+        stored = getattr(self, '_stored_values', None)
+        if stored is None:
+            return DataFrame({'player_id':[pv.player_id for pv in self.values], 'position':[pv.position for pv in self.values],
+                                'value':[pv.value for pv in self.values]}, columns=['player_id', 'position', 'value'])
+        array = stored[0]
+        return DataFrame({'player_id':array['player_id'], 'position':np.array(ValueArrays.positions, dtype=object)[array['position']],
+                            'value':array['value']}, columns=['player_id', 'position', 'value'])
+
+    def get_value_player(self, player_id:int) -> Player:
+        '''Returns the Player of the player's values, or None if it is not loaded.'''
+        stored = getattr(self, '_stored_values', None)
+        if stored is not None:
+            return stored[1].get(player_id)
+        player_values = self.get_value_index().get(player_id)
+        if player_values is None or len(player_values) == 0:
+            return None
+        return next(iter(player_values.values())).player
+
+    def _get_stored_player_values(self, player_id:int) -> dict[Position, PlayerValue]:
+        '''Returns the stored values of the player by Position, creating their PlayerValues on first lookup.'''
+        array, players, rows, lookup = self._stored_values
+        player_values = lookup.get(player_id)
+        if player_values is not None:
+            return player_values
+        if rows is None:
+            rows = {}
+            for row, stored_id in enumerate(array['player_id'].tolist()):
+                rows.setdefault(stored_id, []).append(row)
+            self._stored_values[2] = rows
+        if player_id not in rows:
+            return None
+        player_values = {}
+        for row in rows[player_id]:
+            pos = ValueArrays.positions[array['position'][row]]
+            if pos in player_values:
+                continue
+            pv = PlayerValue(player_id=player_id, position=pos, value=float(array['value'][row]), calculation_id=self.index)
+            #Set without the backref so the Player's values are not loaded
+            set_committed_value(pv, 'player', players.get(player_id))
+            player_values[pos] = pv
+        lookup[player_id] = player_values
+        return player_values
+
+    def _load_stored_values(self) -> None:
+        '''Moves the stored values into the values list, as though they had been loaded, so they can be indexed and updated.'''
+        stored = getattr(self, '_stored_values', None)
+        if stored is None:
+            return
+        values = []
+        for player_id in dict.fromkeys(stored[0]['player_id'].tolist()):
+            values.extend(self._get_stored_player_values(player_id).values())
+        self._stored_values = None
+        set_committed_value(self, 'values', values)
+
+    @property
+    def value_dict(self) -> dict[int, dict[Position, PlayerValue]]:
+        '''The player_id -> Position -> PlayerValue index for this calculation.'''
+        return self.get_value_index()
+
+    def release_value_index(self) -> None:
+        '''Drops the player value index. It is rebuilt on the next lookup.'''
+        self._value_index = None
+
+    def get_value_index_size(self) -> int:
+        '''Returns the approximate size in bytes of the player value index, excluding the PlayerValues themselves, or 0 if it has not been built.'''
+        cached = getattr(self, '_value_index', None)
+        if cached is None:
+            return 0
+        lookup = cached[2]
+        return sys.getsizeof(lookup) + sum(sys.getsizeof(player_dict) for player_dict in lookup.values())
 
     def set_input(self, data_type:CalculationDataType, value:object) -> None:
         '''Sets the CalculationInput. Sanitizes so that the value is always a float. Adds it to the ValueCalculation.inputs list if it doesn't exist, otherwise updates
@@ -188,21 +351,24 @@ class ValueCalculation(Base):
             value = -999
         if isinstance(value, str):
             value = float(value)
-        for inp in self.inputs:
-            if inp.data_type == data_type:
-                inp.value = value
-                return
+        input_index = self.get_input_index()
+        inp = input_index.get(data_type)
+        if inp is not None:
+            inp.value = value
+            return
         ci = CalculationInput()
         ci.data_type = data_type
         ci.value = value
         self.inputs.append(ci)
+        input_index[data_type] = ci
+        _mark_indexed(self, '_input_index', self.inputs)
 
     def get_input(self, data_type:CalculationDataType, default:float=None) -> float:
         '''Gets the value for the given data type. Returns the default if None exists in the calculation.'''
-        for inp in self.inputs:
-            if inp.data_type == data_type:
-                return inp.value
-        return default
+        inp = self.get_input_index().get(data_type)
+        if inp is None:
+            return default
+        return inp.value
     
     def set_output(self, data_type:CalculationDataType, value:object):
         '''Sets the ValueData. Sanitizes so that the value is always a float. Adds it to the ValueCalculation.data list if it doesn't exist, otherwise updates
@@ -211,55 +377,77 @@ class ValueCalculation(Base):
             value = -999
         if isinstance(value, str):
             value = float(value)
-        for data in self.data:
-            if data.data_type == data_type:
-                data.value = value
-                return
+        output_index = self.get_output_index()
+        data = output_index.get(data_type)
+        if data is not None:
+            data.value = value
+            return
         vd = ValueData()
         vd.data_type = data_type
         vd.value = value
         self.data.append(vd)
+        output_index[data_type] = vd
+        _mark_indexed(self, '_output_index', self.data)
 
     def get_output(self, data_type:CalculationDataType, default=None) -> ValueData:
         '''Gets the ValueData for the given data type. Returns the default if None exists in the calculation.'''
-        for data in self.data:
-            if data.data_type == data_type:
-                return data.value
-        return default
+        data = self.get_output_index().get(data_type)
+        if data is None:
+            return default
+        return data.value
     
     def set_player_value(self, player_id:int, pos:Position, value:float) -> None:
         '''Sets the value of the given player at the given position. If the player/position combination doesn't exist, adds it to the ValueCalculation.values list.
         Otherwise updates the existing value.'''
-        for pv in self.values:
-            if pv.player_id == player_id and pv.position == pos:
-                pv.value = value
-                return
-        pv = PlayerValue()
-        pv.player_id = player_id
-        pv.position = pos
-        pv.value = value
-        self.values.append(pv)
-
-        if player_id not in self.value_dict:
-            player_dict = {}
-            self.value_dict[player_id] = player_dict
-        player_dict = self.value_dict[player_id]
-        player_dict[pos] = pv
+        self.set_player_values([player_id], [pos], [value])
+
+    def set_player_values(self, player_ids:Iterable[int], positions:Iterable[Position] | Position, values:Iterable[float]) -> None:
+        '''Sets the values for parallel sequences of player ids, positions, and values. A single Position may be given to apply to all players. Player/position
+        combinations that don't exist are added to the ValueCalculation.values list in one extend, otherwise the existing value is updated.'''
+        if isinstance(positions, Position):
+            positions = repeat(positions)
+        value_index = self.get_value_index()
+        new_values = []
+        for player_id, pos, value in zip(player_ids, positions, values):
+            player_id = int(player_id)
+            player_dict = value_index.setdefault(player_id, {})
+            pv = player_dict.get(pos)
+            if pv is not None:
+                pv.value = float(value)
+                continue
+            pv = PlayerValue()
+            pv.player_id = player_id
+            pv.position = pos
+            pv.value = float(value)
+            player_dict[pos] = pv
+            new_values.append(pv)
+        self.values.extend(new_values)
+        _mark_indexed(self, '_value_index', self.values)
     
     def get_player_value(self, player_id:int, pos=None) -> PlayerValue:
         '''Gets the PlayerValue for the given player_id and position.'''
-        if player_id not in self.value_dict:
+        if getattr(self, '_stored_values', None) is not None:
+            player_values = self._get_stored_player_values(player_id)
+            if player_values is None:
+                return {} if pos is None else None
+            return player_values if pos is None else player_values.get(pos, None)
+        value_index = self.get_value_index()
+        if player_id not in value_index:
             if pos is None:
                 return {}
             return None
         if pos is None:
             #Get all positions
-            return self.value_dict[player_id]
+            return value_index[player_id]
         else:
-            return self.value_dict[player_id].get(pos, None)
+            return value_index[player_id].get(pos, None)
     
     def get_position_values(self, pos:Position) -> list[PlayerValue]:
         '''Gets all player values at the given position.'''
+        if getattr(self, '_stored_values', None) is not None:
+            array = self._stored_values[0]
+            player_ids = array['player_id'][array['position'] == ValueArrays.positions.index(pos)].tolist()
+            return [self._get_stored_player_values(player_id)[pos] for player_id in dict.fromkeys(player_ids)]
         values = []
         for pv in self.values:
             if pv.position == pos:
@@ -280,6 +468,8 @@ class CalculationInput(Base):
     calculation_id = Column(Integer, ForeignKey("value_calculation.index"))
     calculation = relationship("ValueCalculation", back_populates="inputs")
 
+    __table_args__ = (Index('idx_calculation_input_calculation','calculation_id'),)
+
 class ValueData(Base):
     __tablename__ = "value_data"
     index = Column(Integer, primary_key=True)
@@ -291,7 +481,19 @@ class ValueData(Base):
 
     calculation_id = Column(Integer, ForeignKey("value_calculation.index"))
     calculation = relationship("ValueCalculation", back_populates="data")
+
+    __table_args__ = (Index('idx_value_data_calculation','calculation_id'),)
     
+class CalculationCache(Base):
+    '''A cached set of ValueCalculation outputs and player values, keyed by a hash of the projection contents and all calculation inputs.'''
+    __tablename__ = "calculation_cache"
+    key = Column(String, primary_key=True)
+    #Not a foreign key so entries can be cleared independently of the projection
+    projection_id = Column(Integer, index=True)
+    last_used = Column(TIMESTAMP, nullable=False)
+    size = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+
 class Projection(Base):
     __tablename__ = "projection"
     index = Column(Integer, primary_key=True)
@@ -311,32 +513,40 @@ class Projection(Base):
     valid_5x5 = Column(Boolean)
     valid_4x4 = Column(Boolean)
 
+    #Hash of the stored contents for the calculation cache. Set when the contents are written, or on first use for older projections.
+    content_hash = Column(String)
+
     player_projections = relationship("PlayerProjection", back_populates="projection", cascade="all, delete")
     calculations = relationship("ValueCalculation", back_populates="projection", cascade="all, delete")
+    arrays = relationship("ProjectionArrays", back_populates="projection", uselist=False, cascade="all, delete")
+
+    def get_player_projection_index(self) -> dict[str, dict]:
+        '''Gets the lookups of the Projection.player_projections list keyed off of the id type ('index', 'fg_major', 'fg_minor', 'ottoneu'), then
+        off of the id value with a value of the PlayerProjection.'''
+        return _get_cached_index(self, '_player_projection_index', self.player_projections, self.__add_player_projection)
+
+    def __add_player_projection(self, lookup:dict[str, dict], pp:PlayerProjection) -> None:
+        '''Adds the PlayerProjection to the lookups under each of its player's ids. The first PlayerProjection for an id wins.'''
+        keys = [('index', pp.player_id)]
+        player = pp.player
+        if player is not None:
+            keys.extend([('index', player.index), ('fg_major', player.fg_major_id), ('fg_minor', player.fg_minor_id), ('ottoneu', player.ottoneu_id)])
+        for id_type, key in keys:
+            if key is not None:
+                lookup.setdefault(id_type, {}).setdefault(key, pp)
 
     def get_player_projection(self, player_id:int, idx:str=None, id_type:IdType=IdType.FANGRAPHS) -> PlayerProjection:
         '''Gets the PlayerProjection for the given player_id'''
+        lookup = self.get_player_projection_index()
         if player_id is None:
             if idx is None:
                 return None
-            for pp in self.player_projections:
-                if id_type == IdType.FANGRAPHS:
-                    if idx.isnumeric():
-                        if pp.player.fg_major_id == idx:
-                            print('returning pp')
-                            return pp
-                    else:
-                        if pp.player.fg_minor_id == idx:
-                            return pp
-                else:
-                    for pp in self.player_projections:
-                        if pp.player.ottoneu_id == idx:
-                            return pp
-        else:
-            for pp in self.player_projections:
-                if pp.player_id == player_id or pp.player.index == player_id:
-                    return pp
-        return None
+            if id_type == IdType.FANGRAPHS:
+                if idx.isnumeric():
+                    return lookup.get('fg_major', {}).get(idx)
+                return lookup.get('fg_minor', {}).get(idx)
+            return lookup.get('ottoneu', {}).get(idx)
+        return lookup.get('index', {}).get(player_id)
         
 class PlayerProjection(Base):
     __tablename__ = "player_projection"
@@ -353,12 +563,68 @@ class PlayerProjection(Base):
     pitcher = Column(Boolean)
     two_way = Column(Boolean)
 
+    __table_args__ = (Index('idx_player_projection_projection','projection_id'),)
+
+    def get_stat_index(self) -> dict[StatType, ProjectionData]:
+        '''Gets the StatType index of the PlayerProjection.projection_data list. Built on first lookup after load. For stats set from the projection's
+        arrays by set_stored_stats, the ProjectionData are built on first lookup and are not part of projection_data.'''
+        stored = getattr(self, '_stored_stats', None)
+        if stored is not None:
+            if stored[1] is None:
+                stored[1] = {stat_type : ProjectionData(stat_type=stat_type, stat_value=value) for stat_type, value in stored[0].items()}
+            return stored[1]
+        return _get_cached_index(self, '_stat_index', self.projection_data, lambda lookup, data: lookup.setdefault(data.stat_type, data))
+
     def get_stat(self, stat_type:StatType) -> ProjectionData:
         '''Gets the ProejctionData associated with the input StatType'''
-        for pd in self.projection_data:
-            if pd.stat_type == stat_type:
-                return pd.stat_value
-        return None
+        stored = getattr(self, '_stored_stats', None)
+        if stored is not None:
+            return stored[0].get(stat_type)
+        data = self.get_stat_index().get(stat_type)
+        if data is None:
+            return None
+        return data.stat_value
+
+    def set_stored_stats(self, stats:dict[StatType, float]) -> None:
+        '''Sets the stat values read from the projection's arrays, which are used in place of the projection_data rows.'''
+        self._stored_stats = [stats, None]
+
+class ProjectionArrays(Base):
+    '''Columnar storage of a Projection's hitter and pitcher stats. Each is a compressed NumPy archive with a player_id array and one array per
+    StatType, keyed by the StatType name in column order.'''
+    __tablename__ = "projection_arrays"
+    projection_id = Column(Integer, ForeignKey("projection.index"), primary_key=True)
+    projection = relationship("Projection", back_populates="arrays")
+
+    hitters = Column(LargeBinary, nullable=False)
+    pitchers = Column(LargeBinary, nullable=False)
+
+    @staticmethod
+    def get_data(player_ids:np.ndarray, stat_types:List[StatType], values:np.ndarray) -> bytes:
+        '''Returns a projection table as a compressed NumPy archive of the player ids and each stat's column of the values, keyed by StatType name.'''
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, player_id=player_ids, **{stat_type.name : values[:, col] for col, stat_type in enumerate(stat_types)})
+        return buffer.getvalue()
+
+    @staticmethod
+    def read_data(data:bytes) -> Tuple[np.ndarray, Dict[StatType, np.ndarray]]:
+        '''Returns the player ids and the stat columns by StatType, in column order, of a projection table stored by get_data.'''
+        with np.load(io.BytesIO(data)) as arrays:
+            return arrays['player_id'], {StatType[name] : arrays[name] for name in arrays.files if name != 'player_id'}
+
+    @staticmethod
+    def get_stats(tables:List[Tuple[np.ndarray, Dict[StatType, np.ndarray]]]) -> Dict[int, Dict[StatType, float]]:
+        '''Returns each player's stat values from the hitter and pitcher tables, keyed by player id. Two-way players get both their hitting and
+        pitching stats.'''
+        stats = {}
+        for player_ids, columns in tables:
+            stat_types = list(columns.keys())
+            rows = np.column_stack(list(columns.values())).tolist() if len(columns) > 0 else [[] for _ in player_ids]
+            for player_id, row in zip(player_ids.tolist(), rows):
+                player_stats = stats.setdefault(player_id, {})
+                for stat_type, value in zip(stat_types, row):
+                    player_stats.setdefault(stat_type, value)
+        return stats
 
 class ProjectionData(Base):
     __tablename__ = "projection_data"
@@ -371,6 +637,8 @@ class ProjectionData(Base):
     stat_type = Column(Enum(StatType), nullable=False) 
     stat_value = Column(Float, nullable=False)
 
+    __table_args__ = (Index('idx_projection_data_player_projection','player_projection_id'),)
+
 class Salary_Refresh(Base):
     # Class to track how recently the Ottoverse average values have been refreshed
     __tablename__ = "salary_refresh"
@@ -102,6 +102,14 @@ class CalculationDataType(Enum):
     SP_WITH_ALL_IP = 43
     RP_WITH_ALL_IP = 44
     BATTER_G_TARGET = 45
+    CALCULATION_SECONDS = 46
+    PROJECTION_LOAD_SECONDS = 47
+    HITTER_SEARCH_SECONDS = 48
+    HITTER_SEARCH_ITERATIONS = 49
+    PITCHER_SEARCH_SECONDS = 50
+    PITCHER_SEARCH_ITERATIONS = 51
+    DOLLAR_VALUE_SECONDS = 52
+    REP_LEVEL_SEARCH = 53
 
     @classmethod
     def pos_to_num_rostered(self):
@@ -142,7 +150,8 @@ class CalculationDataType(Enum):
             self.SP_MULTIPLIER,
             self.RP_MULTIPLIER,
             self.SP_WITH_ALL_IP,
-            self.RP_WITH_ALL_IP
+            self.RP_WITH_ALL_IP,
+            self.REP_LEVEL_SEARCH
         ]
 
 class RepLevelScheme(Enum):
@@ -160,6 +169,17 @@ class RepLevelScheme(Enum):
             3: self.TOTAL_ROSTERED
         }
 
+class RepLevelSearch(Enum):
+    HEURISTIC = 0
+    BISECTION = 1
+
+    @classmethod
+    def enum_to_display_dict(self):
+        return {
+            self.HEURISTIC : 'Stepwise',
+            self.BISECTION : 'Bisection'
+        }
+
 class RankingBasis(Enum):
     PPG = 0
     PPPA = 1
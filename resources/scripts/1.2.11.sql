@@ -0,0 +1,9 @@
+CREATE INDEX IF NOT EXISTS idx_fg_minor_id ON player ("FG MinorLeagueID");
+CREATE INDEX IF NOT EXISTS idx_salary_info_player ON salary_info (player_id, format);
+CREATE INDEX IF NOT EXISTS idx_player_value_calculation ON player_value (calculation_id, player_id);
+CREATE INDEX IF NOT EXISTS idx_player_value_player ON player_value (player_id);
+CREATE INDEX IF NOT EXISTS idx_player_projection_projection ON player_projection (projection_id);
+CREATE INDEX IF NOT EXISTS idx_projection_data_player_projection ON projection_data (player_projection_id);
+CREATE INDEX IF NOT EXISTS idx_calculation_input_calculation ON calculation_input (calculation_id);
+CREATE INDEX IF NOT EXISTS idx_value_data_calculation ON value_data (calculation_id);
+ANALYZE;
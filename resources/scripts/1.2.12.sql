@@ -0,0 +1 @@
+ALTER TABLE projection ADD COLUMN content_hash VARCHAR;
@@ -0,0 +1,184 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+from itertools import product
+import logging
+import time
+from typing import Dict, List, Tuple
+
+from dao import session as db_session
+from domain.domain import ValueCalculation
+from domain.enum import CalculationDataType as CDT, Position, RankingBasis, RepLevelScheme, RepLevelSearch, ScoringFormat
+from domain.exception import InputException
+from services import adv_calc_services, calculation_services, projection_services
+from util.timing_util import StageTimer
+
+#Default inputs, matching the defaults of the Create Player Values UI
+default_num_rostered = {"C":24,"1B":40,"2B":38,"SS":42,"3B":24,"OF":95,"Util":200,"SP":85,"RP":70}
+default_static_rep_levels = {
+    RankingBasis.PPG : 4.5,
+    RankingBasis.PPPA : 1.0,
+}
+default_static_pitch_rep_levels = {
+    RankingBasis.PIP : {"SP":3.5, "RP":6.0},
+    RankingBasis.PPG : {"SP":20, "RP":6.0},
+}
+
+class BatchJob():
+    '''A single value calculation in a batch. Only holds plain values and enums so it can be sent to a worker process.'''
+
+    def __init__(self, projection_id:int, format:ScoringFormat, num_teams:int, hitter_basis:RankingBasis, pitcher_basis:RankingBasis,
+                    rep_level_scheme:RepLevelScheme, inputs:Dict[CDT, float]):
+        self.projection_id = projection_id
+        self.format = format
+        self.num_teams = num_teams
+        self.hitter_basis = hitter_basis
+        self.pitcher_basis = pitcher_basis
+        self.rep_level_scheme = rep_level_scheme
+        self.inputs = inputs
+
+    def get_name(self) -> str:
+        '''Returns a name describing the job's settings.'''
+        basis = RankingBasis.enum_to_display_dict()
+        name = f'{ScoringFormat.enum_to_full_name_map()[self.format]}, {self.num_teams} teams, {basis[self.hitter_basis]}/{basis[self.pitcher_basis]}, {self.rep_level_scheme.name}'
+        if self.rep_level_scheme == RepLevelScheme.TOTAL_ROSTERED:
+            search = RepLevelSearch._value2member_map_[int(self.inputs.get(CDT.REP_LEVEL_SEARCH, RepLevelSearch.HEURISTIC.value))]
+            name = f'{name} ({RepLevelSearch.enum_to_display_dict()[search]})'
+        return name
+
+    def create_value_calculation(self) -> ValueCalculation:
+        '''Returns a new ValueCalculation with the job's settings and inputs.'''
+        value_calc = ValueCalculation()
+        value_calc.projection_id = self.projection_id
+        value_calc.format = self.format
+        value_calc.hitter_basis = self.hitter_basis
+        value_calc.pitcher_basis = self.pitcher_basis
+        value_calc.inputs = []
+        for data_type, value in self.inputs.items():
+            value_calc.set_input(data_type, value)
+        return value_calc
+
+class BatchResult():
+    '''The outputs, player values, and stage timings of a completed BatchJob as plain values so they can be returned from a worker process.'''
+
+    def __init__(self, job:BatchJob, outputs:List[Tuple[CDT, float]], player_ids:List[int], positions:List[Position], values:List[float], seconds:float,
+                    timer:StageTimer=None):
+        self.job = job
+        self.outputs = outputs
+        self.player_ids = player_ids
+        self.positions = positions
+        self.values = values
+        self.seconds = seconds
+        self.timer = timer
+
+def get_job_inputs(format:ScoringFormat, num_teams:int, hitter_basis:RankingBasis, pitcher_basis:RankingBasis, rep_level_scheme:RepLevelScheme,
+                    min_pa:float=150, min_sp_ip:float=70, min_rp_ip:float=30, non_prod_dollars:int=300, include_svh:bool=True,
+                    search:RepLevelSearch=RepLevelSearch.HEURISTIC) -> Dict[CDT, float]:
+    '''Returns the calculation inputs for the settings, using the Create Player Values defaults and stored advanced options for anything
+    not in the grid.'''
+    inputs = {}
+    inputs[CDT.NUM_TEAMS] = float(num_teams)
+    inputs[CDT.NON_PRODUCTIVE_DOLLARS] = int(non_prod_dollars)
+    inputs[CDT.PA_TO_RANK] = float(min_pa)
+    inputs[CDT.SP_IP_TO_RANK] = float(min_sp_ip)
+    inputs[CDT.RP_IP_TO_RANK] = float(min_rp_ip)
+    inputs[CDT.INCLUDE_SVH] = float(include_svh)
+    inputs[CDT.REP_LEVEL_SCHEME] = float(rep_level_scheme.value)
+    if rep_level_scheme == RepLevelScheme.STATIC_REP_LEVEL:
+        for pos in Position.get_discrete_offensive_pos():
+            inputs[CDT.pos_to_rep_level().get(pos)] = float(default_static_rep_levels[hitter_basis])
+        for pos in Position.get_discrete_pitching_pos():
+            inputs[CDT.pos_to_rep_level().get(pos)] = float(default_static_pitch_rep_levels[pitcher_basis][pos.value])
+    else:
+        for pos in Position.get_discrete_offensive_pos() + Position.get_discrete_pitching_pos():
+            if rep_level_scheme == RepLevelScheme.NUM_ROSTERED:
+                inputs[CDT.pos_to_num_rostered().get(pos)] = int(default_num_rostered[pos.value])
+            else:
+                inputs[CDT.pos_to_num_rostered().get(pos)] = 0
+    if rep_level_scheme == RepLevelScheme.TOTAL_ROSTERED:
+        inputs[CDT.REP_LEVEL_SEARCH] = float(search.value)
+        #Rostered arms are balanced against innings for P/IP and starts for PPG
+        if pitcher_basis == RankingBasis.PIP:
+            inputs[CDT.IP_TARGET] = adv_calc_services.get_advanced_option(CDT.IP_TARGET, default=1500).value
+            inputs[CDT.RP_IP_TARGET] = adv_calc_services.get_advanced_option(CDT.RP_IP_TARGET, default=300).value
+        else:
+            inputs[CDT.GS_LIMIT] = adv_calc_services.get_advanced_option(CDT.GS_LIMIT, default=10).value
+    if rep_level_scheme == RepLevelScheme.FILL_GAMES:
+        inputs[CDT.BATTER_G_TARGET] = adv_calc_services.get_advanced_option(CDT.BATTER_G_TARGET, default=162).value
+        if ScoringFormat.is_h2h(format):
+            inputs[CDT.GS_LIMIT] = adv_calc_services.get_advanced_option(CDT.GS_LIMIT, default=10).value
+            inputs[CDT.RP_G_TARGET] = adv_calc_services.get_advanced_option(CDT.RP_G_TARGET, default=10).value
+        else:
+            inputs[CDT.IP_TARGET] = adv_calc_services.get_advanced_option(CDT.IP_TARGET, default=1500).value
+            inputs[CDT.RP_IP_TARGET] = adv_calc_services.get_advanced_option(CDT.RP_IP_TARGET, default=300).value
+    return inputs
+
+def get_job_grid(projection_ids:List[int], formats:List[ScoringFormat], team_counts:List[int], hitter_bases:List[RankingBasis],
+                    pitcher_bases:List[RankingBasis], rep_level_schemes:List[RepLevelScheme], searches:List[RepLevelSearch]=None, **input_args) -> List[BatchJob]:
+    '''Returns a BatchJob for every combination of the input settings. Replacement level search methods only apply to the TOTAL_ROSTERED
+    scheme, so other schemes get one job per combination regardless of the searches. Additional keyword arguments are passed to
+    get_job_inputs.'''
+    if searches is None:
+        searches = [RepLevelSearch.HEURISTIC]
+    jobs = []
+    for format in formats:
+        if not ScoringFormat.is_points_type(format):
+            raise InputException(f'Batch calculations are only available for points formats, not {format.name}')
+    for hitter_basis in hitter_bases:
+        if hitter_basis not in default_static_rep_levels:
+            raise InputException(f'Invalid hitter ranking basis {hitter_basis.name}')
+    for pitcher_basis in pitcher_bases:
+        if pitcher_basis not in default_static_pitch_rep_levels:
+            raise InputException(f'Invalid pitcher ranking basis {pitcher_basis.name}')
+    for proj_id, format, num_teams, hitter_basis, pitcher_basis, scheme in product(projection_ids, formats, team_counts, hitter_bases, pitcher_bases, rep_level_schemes):
+        for search in (searches if scheme == RepLevelScheme.TOTAL_ROSTERED else searches[:1]):
+            inputs = get_job_inputs(format, num_teams, hitter_basis, pitcher_basis, scheme, search=search, **input_args)
+            jobs.append(BatchJob(proj_id, format, num_teams, hitter_basis, pitcher_basis, scheme, inputs))
+    return jobs
+
+def init_worker() -> None:
+    '''Drops any database connections inherited from the parent process so each worker opens its own.'''
+    db_session.engine.dispose(close=False)
+
+def run_job(job:BatchJob, use_cache:bool=True, save_timings:bool=False) -> BatchResult:
+    '''Performs the value calculation for the job and returns its results. If save_timings is True, the stage timings are included in the
+    outputs to be saved with the calculation.'''
+    start = time.time()
+    value_calc = job.create_value_calculation()
+    value_calc.projection = projection_services.get_projection(job.projection_id, player_data=False)
+    if value_calc.projection is None:
+        raise InputException(f'No projection with id {job.projection_id}')
+    timer = calculation_services.perform_point_calculation(value_calc, use_cache=use_cache, save_timings=save_timings)
+    outputs = [(data.data_type, data.value) for data in value_calc.data]
+    player_ids = [pv.player_id for pv in value_calc.values]
+    positions = [pv.position for pv in value_calc.values]
+    values = [pv.value for pv in value_calc.values]
+    return BatchResult(job, outputs, player_ids, positions, values, time.time() - start, timer=timer)
+
+def get_value_calculation(result:BatchResult, name:str=None, description:str=None) -> ValueCalculation:
+    '''Returns a new ValueCalculation populated with the results of a BatchJob.'''
+    value_calc = result.job.create_value_calculation()
+    value_calc.name = name
+    value_calc.description = description
+    value_calc.timestamp = datetime.now()
+    value_calc.data = []
+    for data_type, value in result.outputs:
+        value_calc.set_output(data_type, value)
+    value_calc.values = []
+    value_calc.set_player_values(result.player_ids, result.positions, result.values)
+    return value_calc
+
+def run_batch(jobs:List[BatchJob], max_workers:int=None, name_prefix:str='Batch', callback=None, use_cache:bool=True, save_timings:bool=False) -> List[ValueCalculation]:
+    '''Runs all jobs in a process pool and saves the resulting ValueCalculations in a single transaction. Results are saved in job order
+    regardless of completion order. The callback, if provided, is called with each BatchResult in job order as it becomes available.
+    Jobs whose projection contents and inputs match a cached calculation are read from the calculation cache. If save_timings is True,
+    each calculation's stage timings are saved as outputs of the calculation.'''
+    value_calcs = []
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker) as executor:
+        for result in executor.map(partial(run_job, use_cache=use_cache, save_timings=save_timings), jobs):
+            if callback is not None:
+                callback(result)
+            name = f'{name_prefix}: {result.job.get_name()}'
+            value_calcs.append(get_value_calculation(result, name=name, description=f'Batch run of projection {result.job.projection_id}'))
+    logging.info(f'Saving {len(value_calcs)} batch calculations')
+    return calculation_services.save_calculations(value_calcs)
@@ -0,0 +1,136 @@
+import datetime
+import hashlib
+import io
+import logging
+from typing import List, Tuple
+
+from sqlalchemy import select, update
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from dao.session import Session
+from domain.domain import CalculationCache, Projection, ValueCalculation
+from domain.enum import CalculationDataType, Position
+from services import projection_services
+
+#Bump when a change to the value calculation would change results for the same inputs so old entries are never hit
+CACHE_VERSION = 1
+#Eviction limits. Least recently used entries are removed first once either is exceeded.
+max_entries = 100
+max_bytes = 256 * 1024 * 1024
+
+_positions = list(Position)
+_data_types = list(CalculationDataType)
+
+def get_projection_hash(projs:List[DataFrame]) -> str:
+    '''Returns a hash of the contents of the projection DataFrames, including player ids, positions, and column names.'''
+    digest = hashlib.sha256()
+    for proj in projs:
+        digest.update('|'.join(str(col) for col in proj.columns).encode())
+        digest.update(pd.util.hash_pandas_object(proj, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def hash_projection(projection:Projection) -> Tuple[str, List[DataFrame]]:
+    '''Returns the content hash of the saved projection, along with its DataFrames if they had to be loaded to compute it. The hash is read
+    from the projection's row, so edits made by any process are seen. Projections saved before hashes were stored are hashed on first use
+    and the hash is stored for later lookups.'''
+    with Session() as session:
+        projection_hash = session.scalar(select(Projection.content_hash).where(Projection.index == projection.index))
+    if projection_hash is not None:
+        return projection_hash, None
+    projs = projection_services.convert_to_df(projection)
+    projection_hash = get_projection_hash(projs)
+    with Session() as session:
+        #Only fill in a missing hash, so a hash set by a concurrent save of new contents is not replaced
+        session.execute(update(Projection).where(Projection.index == projection.index, Projection.content_hash == None).values(content_hash=projection_hash))
+        session.commit()
+    return projection_hash, projs
+
+def set_projection_hash(projection_id:int, projs:List[DataFrame]) -> None:
+    '''Stores the content hash of the projection's newly written DataFrames on its row.'''
+    with Session() as session:
+        session.execute(update(Projection).where(Projection.index == projection_id).values(content_hash=get_projection_hash(projs)))
+        session.commit()
+
+def get_cache_key(value_calc:ValueCalculation, projection_hash:str) -> str:
+    '''Returns the cache key for the ValueCalculation's settings and inputs against a projection with the given content hash.'''
+    digest = hashlib.sha256()
+    digest.update(f'{CACHE_VERSION}|{projection_hash}|{value_calc.format}|{value_calc.hitter_basis}|{value_calc.pitcher_basis}'.encode())
+    for inp in sorted(value_calc.inputs, key=lambda inp: inp.data_type.value):
+        digest.update(f'|{inp.data_type.value}={float(inp.value)!r}'.encode())
+    return digest.hexdigest()
+
+def load_cached_calculation(key:str, value_calc:ValueCalculation) -> bool:
+    '''Populates the ValueCalculation's outputs and player values from the cache entry for the key. Returns True if there was an entry.'''
+    with Session() as session:
+        entry = session.get(CalculationCache, key)
+        if entry is None:
+            return False
+        entry.last_used = datetime.datetime.now()
+        data = entry.data
+        session.commit()
+    with np.load(io.BytesIO(data)) as arrays:
+        for data_type, value in zip(arrays['output_types'], arrays['output_values']):
+            value_calc.set_output(_data_types[data_type], float(value))
+        value_calc.values = []
+        value_calc.set_player_values(arrays['player_ids'].tolist(), [_positions[pos] for pos in arrays['positions']], arrays['values'].tolist())
+    return True
+
+def cache_calculation(key:str, projection_id:int, value_calc:ValueCalculation) -> None:
+    '''Stores the ValueCalculation's outputs and player values under the key, then evicts entries over the cache limits.'''
+    position_codes = {pos : idx for idx, pos in enumerate(_positions)}
+    type_codes = {data_type : idx for idx, data_type in enumerate(_data_types)}
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer,
+        output_types=np.array([type_codes[data.data_type] for data in value_calc.data], dtype=np.int16),
+        output_values=np.array([data.value for data in value_calc.data], dtype=float),
+        player_ids=np.array([pv.player_id for pv in value_calc.values], dtype=np.int64),
+        positions=np.array([position_codes[pv.position] for pv in value_calc.values], dtype=np.int8),
+        values=np.array([pv.value for pv in value_calc.values], dtype=float))
+    data = buffer.getvalue()
+    with Session() as session:
+        entry = session.get(CalculationCache, key)
+        if entry is None:
+            entry = CalculationCache()
+            entry.key = key
+            session.add(entry)
+        entry.projection_id = projection_id
+        entry.last_used = datetime.datetime.now()
+        entry.size = len(data)
+        entry.data = data
+        session.commit()
+    evict()
+
+def evict(entry_limit:int=None, byte_limit:int=None) -> int:
+    '''Removes the least recently used cache entries until the cache is within the entry and size limits. Returns the number removed.'''
+    if entry_limit is None:
+        entry_limit = max_entries
+    if byte_limit is None:
+        byte_limit = max_bytes
+    with Session() as session:
+        entries = session.query(CalculationCache.key, CalculationCache.size).order_by(CalculationCache.last_used.desc()).all()
+        total = 0
+        to_remove = []
+        for idx, (key, size) in enumerate(entries):
+            total += size
+            if idx >= entry_limit or total > byte_limit:
+                to_remove.append(key)
+        if len(to_remove) > 0:
+            session.query(CalculationCache).filter(CalculationCache.key.in_(to_remove)).delete(synchronize_session=False)
+            session.commit()
+            logging.debug(f'Evicted {len(to_remove)} cached calculations')
+    return len(to_remove)
+
+def invalidate_projection(projection_id:int) -> None:
+    '''Removes all cache entries calculated from the projection.'''
+    with Session() as session:
+        session.query(CalculationCache).filter(CalculationCache.projection_id == projection_id).delete(synchronize_session=False)
+        session.commit()
+
+def clear() -> None:
+    '''Removes all cache entries.'''
+    with Session() as session:
+        session.query(CalculationCache).delete(synchronize_session=False)
+        session.commit()
@@ -1,23 +1,78 @@
 from pandas import DataFrame
 from dao.session import Session
-from domain.domain import ValueCalculation, Projection, PlayerProjection, ProjectionData
+from domain.domain import CalculationInput, Player, PlayerValue, ValueArrays, ValueCalculation, ValueData, Projection, PlayerProjection, ProjectionData
 from domain.enum import Position, CalculationDataType as CDT, StatType, ScoringFormat, RankingBasis, IdType, RepLevelScheme, ProjectionType
 from domain.exception import InputException
 from value.point_values import PointValues
-from services import player_services, projection_services
+from services import player_services, projection_services, calculation_cache_services
 from util import string_util, date_util
+from util.timing_util import StageTimer
+from sqlalchemy import delete, insert, inspect, select
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
 import math
+import numpy as np
 import logging
 import datetime
 from typing import List, Tuple, Dict
 
-def perform_point_calculation(value_calc : ValueCalculation, pd = None) -> None:
-    '''Creates a PointValues object from the ValueCalculation, calculates player values, and stores them in the ValueCalculation'''
+#ValueData outputs for recorded stage timings as (seconds, iterations) data types, by stage name
+stage_outputs = {
+    'Projection load' : (CDT.PROJECTION_LOAD_SECONDS, None),
+    'Hitter replacement search' : (CDT.HITTER_SEARCH_SECONDS, CDT.HITTER_SEARCH_ITERATIONS),
+    'Pitcher replacement search' : (CDT.PITCHER_SEARCH_SECONDS, CDT.PITCHER_SEARCH_ITERATIONS),
+    'Dollar values' : (CDT.DOLLAR_VALUE_SECONDS, None),
+}
+
+def perform_point_calculation(value_calc : ValueCalculation, pd = None, parallel:bool=False, use_cache:bool=False, previous:ValueCalculation=None,
+                                save_timings:bool=False) -> StageTimer:
+    '''Creates a PointValues object from the ValueCalculation, calculates player values, and stores them in the ValueCalculation. If parallel
+    is True, hitter and pitcher PAR are calculated concurrently in worker processes. If use_cache is True, results for the same projection
+    contents and inputs are read from the calculation cache instead of being recalculated, and new results are added to it. If a previously
+    calculated ValueCalculation is provided and only dollar inputs changed from it, its solved replacement levels are used and no replacement
+    level search is run. Any other change runs the full search from the default replacement levels. Results that reuse a previous
+    calculation are not added to the cache. Returns the StageTimer with the wall time, iterations, and rows of each stage of the calculation.
+    If save_timings is True, the timings are also set as outputs of the ValueCalculation.'''
+    timer = StageTimer()
     if pd is not None:
         pd.set_task_title("Initializing Value Calculation...")
         pd.increment_completion_percent(5)
-    value_calculation = PointValues(value_calc=value_calc)
+    projs = None
+    cache_key = None
+    if use_cache and value_calc.projection is not None and value_calc.projection.index is not None:
+        with timer.stage('Cache lookup') as timing:
+            projection_hash, projs = calculation_cache_services.hash_projection(value_calc.projection)
+            cache_key = calculation_cache_services.get_cache_key(value_calc, projection_hash)
+            hit = calculation_cache_services.load_cached_calculation(cache_key, value_calc)
+            if hit:
+                timing.rows = len(value_calc.values)
+        if hit:
+            logging.info('Loaded value calculation from cache')
+            if save_timings:
+                set_timing_outputs(value_calc, timer)
+            return timer
+    value_calculation = PointValues(value_calc=value_calc, parallel=parallel, projs=projs, previous=previous)
     value_calculation.calculate_values(progress=pd)
+    timer.extend(value_calculation.timer)
+    #The cache key only covers the projection and inputs, so results that depend on a previous calculation are not stored
+    if cache_key is not None and not value_calculation.reused_previous:
+        with timer.stage('Cache store', rows=len(value_calc.values)):
+            calculation_cache_services.cache_calculation(cache_key, value_calc.projection.index, value_calc)
+    if save_timings:
+        set_timing_outputs(value_calc, timer)
+    return timer
+
+def set_timing_outputs(value_calc: ValueCalculation, timer: StageTimer) -> None:
+    '''Sets the time since the timer was created and the time and iterations of each tracked stage as outputs of the ValueCalculation. Stages that
+    were not run, such as the replacement level searches of a cached calculation, are not set.'''
+    value_calc.set_output(CDT.CALCULATION_SECONDS, timer.get_elapsed_seconds())
+    for name, (seconds_type, iterations_type) in stage_outputs.items():
+        timing = timer.get_stage(name)
+        if timing is None:
+            continue
+        value_calc.set_output(seconds_type, timing.seconds)
+        if iterations_type is not None:
+            value_calc.set_output(iterations_type, timing.iterations)
 
 def get_num_rostered_rep_levels(value_calc: ValueCalculation) -> Dict[str,float]:
     '''Returns a dictionary of the number of players rostered above replacement level at each discrete position from a ValueCalculation'''
@@ -26,6 +81,40 @@ def get_num_rostered_rep_levels(value_calc: ValueCalculation) -> Dict[str,float]
         rl_dict[pos.value] = value_calc.get_input(CDT.pos_to_num_rostered().get(pos))
     return rl_dict
 
+def get_solved_num_rostered(value_calc: ValueCalculation) -> Dict[str,int]:
+    '''Returns a dictionary of the number of players rostered above replacement level at each discrete position from a calculated ValueCalculation's
+    outputs, or None if any are missing.'''
+    rl_dict = {}
+    for pos in Position.get_discrete_offensive_pos() + Position.get_discrete_pitching_pos():
+        num_rostered = value_calc.get_output(CDT.pos_to_num_rostered().get(pos))
+        if num_rostered is None:
+            return None
+        rl_dict[pos.value] = int(num_rostered)
+    return rl_dict
+
+def get_solved_rep_levels(value_calc: ValueCalculation) -> Dict[str,float]:
+    '''Returns a dictionary of the replacement level at each discrete position from a calculated ValueCalculation's outputs, or None if any are missing.'''
+    rl_dict = {}
+    for pos in Position.get_discrete_offensive_pos() + Position.get_discrete_pitching_pos():
+        rep_level = value_calc.get_output(CDT.pos_to_rep_level().get(pos))
+        if rep_level is None:
+            return None
+        rl_dict[pos.value] = rep_level
+    return rl_dict
+
+def is_dollar_reallocation(previous: ValueCalculation, value_calc: ValueCalculation) -> bool:
+    '''Returns True if the ValueCalculation only differs from the previous one in inputs that move dollars between players without changing
+    replacement levels, so the previous solution's number rostered at each position still applies.'''
+    if previous.projection is None or value_calc.projection is None or previous.projection.index is None \
+            or previous.projection.index != value_calc.projection.index:
+        return False
+    if previous.format != value_calc.format or previous.hitter_basis != value_calc.hitter_basis or previous.pitcher_basis != value_calc.pitcher_basis:
+        return False
+    dollar_inputs = [CDT.NON_PRODUCTIVE_DOLLARS, CDT.HITTER_SPLIT]
+    prev_inputs = {inp.data_type : inp.value for inp in previous.inputs if inp.data_type not in dollar_inputs}
+    inputs = {inp.data_type : inp.value for inp in value_calc.inputs if inp.data_type not in dollar_inputs}
+    return prev_inputs == inputs
+
 def get_rep_levels(value_calc: ValueCalculation) -> Dict[str,float]:
     '''Returns a dictionary of the replacement level at each discrete position from a ValueCalculation'''
     rl_dict = {}
@@ -33,29 +122,145 @@ def get_rep_levels(value_calc: ValueCalculation) -> Dict[str,float]:
         rl_dict[pos.value] = value_calc.get_input(CDT.pos_to_rep_level().get(pos))
     return rl_dict
 
-def save_calculation(value_calc: ValueCalculation) -> ValueCalculation:
-    '''Saves the ValueCalculation to the database and returns a fully loaded version of the now saved ValueCalculation'''
-    with Session() as session:
-        session.add(value_calc)
-        session.commit()
-        saved = load_calculation(value_calc.index)
-    return saved
+def save_calculation(value_calc: ValueCalculation, timer: StageTimer=None) -> ValueCalculation:
+    '''Saves the ValueCalculation to the database and returns it with its players and projection populated. New calculations are written
+    with set-based inserts and populated from the in-memory data instead of being reloaded. A saved calculation is updated through the ORM,
+    with its player values rewritten as its ValueArrays row. If a StageTimer is provided, the save is recorded as a stage.'''
+    if timer is None:
+        timer = StageTimer()
+    if inspect(value_calc).key is not None:
+        #Already saved, so let the ORM update it
+        values = value_calc.get_values_df()
+        with timer.stage('Save', rows=len(values)), Session() as session:
+            #Player values are only stored in the ValueArrays row, so PlayerValues created from it or set since loading are not added to the
+            #session. Rows from before value arrays are replaced.
+            set_committed_value(value_calc, 'values', [])
+            session.add(value_calc)
+            session.flush()
+            session.execute(delete(PlayerValue).where(PlayerValue.calculation_id == value_calc.index))
+            session.execute(delete(ValueArrays).where(ValueArrays.calculation_id == value_calc.index))
+            array = ValueArrays.to_array(values['player_id'], values['position'], values['value'])
+            session.execute(insert(ValueArrays).values(calculation_id=value_calc.index, data=ValueArrays.get_data(array)))
+            session.commit()
+            saved = load_calculation(value_calc.index)
+        return saved
+    with timer.stage('Save', rows=len(value_calc.values)):
+        with Session(expire_on_commit=False) as session:
+            projection = insert_calculation(value_calc, session)
+            session.commit()
+        set_persisted(value_calc, projection)
+        value_calc.set_stored_players(get_value_players(value_calc))
+    return value_calc
+
+def save_calculations(value_calcs: List[ValueCalculation], timer: StageTimer=None) -> List[ValueCalculation]:
+    '''Saves all of the ValueCalculations to the database in a single transaction with set-based inserts and returns them. Player values
+    are not populated with their players. If a StageTimer is provided, the save is recorded as a stage.'''
+    if timer is None:
+        timer = StageTimer()
+    with timer.stage('Save', rows=sum(len(vc.values) for vc in value_calcs)):
+        with Session(expire_on_commit=False) as session:
+            projections = [insert_calculation(vc, session) for vc in value_calcs]
+            session.commit()
+        for vc, projection in zip(value_calcs, projections):
+            set_persisted(vc, projection)
+    return value_calcs
+
+def insert_calculation(value_calc: ValueCalculation, session: Session) -> Projection:
+    '''Inserts the new ValueCalculation and its inputs, outputs, and player values in the session\'s transaction with executemany, setting
+    each to the keys the database assigned. Player values are written as a single ValueArrays row and set as the calculation\'s stored values.
+    A new projection is saved first through the ORM. Returns the calculation\'s projection.'''
+    projection = value_calc.projection
+    if projection is not None and inspect(projection).key is None:
+        #Detach the calculation so saving the projection does not cascade to it
+        value_calc.projection = None
+        session.add(projection)
+        session.flush()
+    if projection is not None:
+        value_calc.projection_id = projection.index
+    calc_row = _get_row(value_calc)
+    del calc_row['index']
+    value_calc.index = session.execute(insert(ValueCalculation.__table__).values(calc_row)).inserted_primary_key[0]
+    for child_type, children in [(CalculationInput, value_calc.inputs), (ValueData, value_calc.data)]:
+        if len(children) == 0:
+            continue
+        rows = []
+        for child in children:
+            child.calculation_id = value_calc.index
+            row = _get_row(child)
+            del row['index']
+            rows.append(row)
+        session.execute(insert(child_type), rows)
+        #The database assigns increasing keys in insert order, so the calculation's keys in order belong to the children in order
+        child_indices = session.execute(select(child_type.index).where(child_type.calculation_id == value_calc.index).order_by(child_type.index)).scalars().all()
+        for child, child_index in zip(children, child_indices):
+            child.index = child_index
+    array = ValueArrays.to_array([pv.player_id for pv in value_calc.values], [pv.position for pv in value_calc.values], [pv.value for pv in value_calc.values])
+    session.execute(insert(ValueArrays).values(calculation_id=value_calc.index, data=ValueArrays.get_data(array)))
+    value_calc.set_stored_values(array)
+    return projection
+
+def _get_row(obj) -> Dict[str, object]:
+    '''Returns the column values of an ORM object keyed by attribute.'''
+    return {attr.key : getattr(obj, attr.key) for attr in inspect(obj).mapper.column_attrs}
+
+def set_persisted(value_calc: ValueCalculation, projection: Projection) -> None:
+    '''Marks the inserted ValueCalculation and its inputs and outputs as saved, as though they had been loaded, and sets the calculation\'s
+    projection. The player values list is emptied, as the calculation\'s stored values are used in its place.'''
+    set_committed_value(value_calc, 'values', [])
+    for obj in [value_calc] + value_calc.inputs + value_calc.data:
+        for attr in inspect(obj).mapper.column_attrs:
+            #Unset columns were inserted as NULL
+            if attr.key not in obj.__dict__:
+                set_committed_value(obj, attr.key, None)
+        make_transient_to_detached(obj)
+    if projection is None and value_calc.projection_id is not None:
+        projection = projection_services.get_projection(value_calc.projection_id, player_data=False)
+    set_committed_value(value_calc, 'projection', projection)
+
+def get_value_players(value_calc: ValueCalculation) -> Dict[int, Player]:
+    '''Returns the players of the ValueCalculation\'s player values by player id. Players are taken from the calculation\'s projection
+    where it has its player projections loaded, and the rest are read in as few queries as the bound parameter limit allows.'''
+    players = {}
+    projection = value_calc.projection
+    if projection is not None and 'player_projections' not in inspect(projection).unloaded:
+        for pp in projection.player_projections:
+            players[pp.player_id] = pp.player
+    missing = [player_id for player_id in value_calc.get_values_df()['player_id'].unique().tolist() if player_id not in players]
+    if len(missing) > 0:
+        with Session() as session:
+            for start in range(0, len(missing), player_services.max_bound_ids):
+                stmt = select(Player).where(Player.index.in_(missing[start:start + player_services.max_bound_ids]))
+                for player in session.scalars(stmt).unique():
+                    players.setdefault(player.index, player)
+    return players
+
+def load_value_array(calc_index: int, session: Session) -> np.ndarray:
+    '''Returns the record array of the saved ValueCalculation\'s player values from its ValueArrays, or from its player_value rows if it was
+    saved before value arrays. Neither creates PlayerValues.'''
+    data = session.scalar(select(ValueArrays.data).where(ValueArrays.calculation_id == calc_index))
+    if data is not None:
+        return ValueArrays.read_data(data)
+    rows = session.execute(select(PlayerValue.player_id, PlayerValue.position, PlayerValue.value)
+                            .where(PlayerValue.calculation_id == calc_index)
+                            .order_by(PlayerValue.index)).all()
+    return ValueArrays.to_array([row[0] for row in rows], [row[1] for row in rows], [row[2] for row in rows])
 
 def load_calculation(calc_index: int) -> ValueCalculation:
-    '''Returns a ValueCalculation loaded with player values and player projections, as well as an internally populated player value dictionary'''
+    '''Returns a ValueCalculation loaded with player values and player projections. Player values are read as a record array and set as the
+    calculation\'s stored values, so PlayerValues are only created for the players that are looked up.'''
     with Session() as session:
-        value_calc = (session.query(ValueCalculation)
-                .filter_by(index = calc_index)
-                #.options(joinedload(ValueCalculation.values))
-                .first()
-        )
-        #This is hacky, but it loads these fields so much faster than trying to do the .options(joinedload()) operations. Makes no sense
-        for pv in value_calc.values:
-            break
+        value_calc = session.query(ValueCalculation).filter_by(index = calc_index).first()
+        if value_calc is None:
+            return None
+        array = load_value_array(calc_index, session)
+        set_committed_value(value_calc, 'values', [])
+        #This is hacky, but it loads the player projections so much faster than trying to do the .options(joinedload()) operations. Makes no sense
         if value_calc.projection is not None:
             for pp in value_calc.projection.player_projections:
                 break
-    value_calc.init_value_dict()
+    projection_services.set_stored_stats(value_calc.projection)
+    value_calc.set_stored_values(array)
+    value_calc.set_stored_players(get_value_players(value_calc))
     return value_calc
 
 def get_values_for_year(year:int=None) -> List[ValueCalculation]:
@@ -123,20 +328,23 @@ def get_pitching_point_rate_from_player_projection(player_proj: PlayerProjection
 def get_dataframe_with_values(value_calc : ValueCalculation, pos: Position, text_values=True) -> DataFrame:
     '''Resolves the input ValueCalculation into a DataFrame that only includes players that qualify at the input Position'''
     #assert isinstance(value_calc, ValueCalculation)
+    values = value_calc.get_values_df()
+    values = values.loc[values['position'] == pos, ['player_id', 'value']]
     if pos == Position.OVERALL:
         rows = []
-        for pv in value_calc.get_position_values(pos):
-            if pv.player is None:
-                pv.player = value_calc.projection.get_player_projection(pv.player_id).player
+        for player_id, value in values.itertuples(index=False):
+            player = value_calc.get_value_player(player_id)
+            if player is None:
+                player = value_calc.projection.get_player_projection(player_id).player
             row = []
-            row.append(pv.player.ottoneu_id)
-            row.append(pv.player.name)
-            row.append(pv.player.team)
-            row.append(pv.player.position)
+            row.append(player.ottoneu_id)
+            row.append(player.name)
+            row.append(player.team)
+            row.append(player.position)
             if text_values:
-                row.append("${:.1f}".format(pv.value))
+                row.append("${:.1f}".format(value))
             else:
-                row.append(pv.value)
+                row.append(value)
             rows.append(row)
         df = DataFrame(rows)
         header = ['otto', 'Name', 'Team', 'Pos', '$']
@@ -150,12 +358,12 @@ def get_dataframe_with_values(value_calc : ValueCalculation, pos: Position, text
         else:
             proj = proj_dfs[1]
         rows = []
-        for pv in value_calc.get_position_values(pos):
-            player = player_services.get_player(pv.player_id)
+        for player_id, value in values.itertuples(index=False):
+            player = player_services.get_player(player_id)
             row = []
             row.append(player.ottoneu_id)
-            row.append(pv.value)
-            df_row = proj.loc[pv.player_id]
+            row.append(value)
+            df_row = proj.loc[player_id]
             for col in proj.columns:
                 if col == 'ID':
                     continue
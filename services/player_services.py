@@ -1,4 +1,5 @@
 from datetime import datetime
+from sqlalchemy import insert, select
 from sqlalchemy.orm import joinedload
 import logging
 
@@ -8,7 +9,10 @@ from scrape.scrape_ottoneu import Scrape_Ottoneu
 from dao.session import Session
 from services import salary_services
 from util import string_util
-from typing import List, Tuple
+from typing import Dict, List, Tuple
+
+#Ids bound per IN clause when resolving players in bulk, under SQLite's default limit on bound parameters
+max_bound_ids = 900
 
 def create_player_universe() -> None:
     '''Scrapes the Ottoneu overall Average Salary page to get Ottoverse player infromation and save it to the database, creating Players and SalaryInfos as necessary.'''
@@ -53,6 +57,30 @@ def create_player(player_row:list, ottoneu_id:int=None, fg_id=None) -> Player:
     player.salary_info = []
     return player
 
+def insert_players(player_rows:Dict[object, dict], session:Session) -> Dict[object, int]:
+    '''Creates a player from each FanGraphs leaderboard row, keyed by FanGraphs id, and inserts them with executemany in the session's
+    transaction. Returns the new Toolbox player ids, as assigned by the database, by FanGraphs id.'''
+    rows = []
+    #The inserted FanGraphs id of each input id, by the column it is stored in
+    fg_ids = {'major':{}, 'minor':{}}
+    for fg_id, player_row in player_rows.items():
+        player = create_player(player_row, fg_id=fg_id)
+        if player.fg_major_id is not None:
+            fg_ids['major'][player.fg_major_id] = fg_id
+        else:
+            fg_ids['minor'][player.fg_minor_id] = fg_id
+        rows.append({'fg_major_id':player.fg_major_id, 'fg_minor_id':player.fg_minor_id, 'name':player.name,
+                        'search_name':player.search_name, 'team':player.team, 'position':player.position})
+    player_ids = {}
+    if len(rows) > 0:
+        session.execute(insert(Player), rows)
+        #The database assigns increasing keys in insert order, so the newest player with each FanGraphs id is the one inserted here
+        for column, ids in [(Player.fg_major_id, fg_ids['major']), (Player.fg_minor_id, fg_ids['minor'])]:
+            for chunk in _chunk(list(ids.keys())):
+                for index, fg_id in session.execute(select(Player.index, column).where(column.in_(chunk)).order_by(Player.index)):
+                    player_ids[ids[fg_id]] = index
+    return player_ids
+
 def get_player_by_fg_id(player_id) -> Player:
     '''Returns player from database based on input FanGraphs player id. Will resolve either major or minor league id.'''
     with Session() as session:
@@ -62,6 +90,32 @@ def get_player_by_fg_id(player_id) -> Player:
             player = session.query(Player).filter(Player.fg_minor_id == player_id).first()
     return player
 
+def get_player_ids_by_fg_id(fg_ids:List[str]) -> Dict[str, int]:
+    '''Returns the Toolbox player ids of the players with the input FanGraphs ids, keyed by FanGraphs id. Numeric ids are resolved against the
+    major league id and others against the minor league id. Ids without a player are omitted. As with get_player_by_fg_id, the first player wins.'''
+    major_ids = [fg_id for fg_id in fg_ids if fg_id.isdigit()]
+    minor_ids = [fg_id for fg_id in fg_ids if not fg_id.isdigit()]
+    player_ids = {}
+    with Session() as session:
+        for column, ids in [(Player.fg_major_id, major_ids), (Player.fg_minor_id, minor_ids)]:
+            for chunk in _chunk(ids):
+                for index, fg_id in session.execute(select(Player.index, column).where(column.in_(chunk)).order_by(Player.index)):
+                    player_ids.setdefault(str(fg_id), index)
+    return player_ids
+
+def get_player_ids_by_ottoneu_id(ottoneu_ids:List[int]) -> Dict[int, int]:
+    '''Returns the Toolbox player ids of the players with the input Ottoneu ids, keyed by Ottoneu id. Ids without a player are omitted.'''
+    player_ids = {}
+    with Session() as session:
+        for chunk in _chunk(ottoneu_ids):
+            for index, ottoneu_id in session.execute(select(Player.index, Player.ottoneu_id).where(Player.ottoneu_id.in_(chunk)).order_by(Player.index)):
+                player_ids.setdefault(ottoneu_id, index)
+    return player_ids
+
+def _chunk(values:List[object]) -> List[List[object]]:
+    '''Splits the values into lists small enough to bind in a single IN clause.'''
+    return [values[idx:idx + max_bound_ids] for idx in range(0, len(values), max_bound_ids)]
+
 def get_player_by_ottoneu_id(ottoneu_id:int, pd=None) -> Player:
     '''Returns player from database based on input Ottoneu player id.'''
     with Session() as session:
@@ -1,16 +1,20 @@
 from pandas import DataFrame
-from domain.domain import PlayerProjection, Projection, ProjectionData
+from domain.domain import Player, PlayerProjection, Projection, ProjectionArrays, ProjectionData
 from scrape import scrape_fg
 from domain.enum import ProjectionType, StatType, IdType
 from domain.exception import InputException
 from datetime import datetime
-from services import player_services, browser_services
+from services import player_services, browser_services, calculation_cache_services
 from dao.session import Session
+from sqlalchemy import inspect, select, type_coerce, String
 from sqlalchemy.orm import joinedload
 import pandas as pd
-import math
+import numpy as np
 from util import date_util
-from typing import List, Tuple
+from util.timing_util import StageTimer
+from typing import Dict, List, Tuple
+import logging
+import time
 
 def download_projections(projection:str, ros:bool=False, dc_pt:bool=False, progress=None) -> List[DataFrame]:
     """Returns a list of projection dataframes. Item 1 is the batting projections. Item 2 is the pitching projections"""
@@ -99,66 +103,141 @@ def convertToDcPlayingTime(proj:DataFrame, ros:bool, position:bool, fg_scraper:s
             proj[column] = dc_proj[column]
     return proj
 
-def save_projection(projection:Projection, projs:List[DataFrame], id_type:IdType, progress=None) -> Projection:
-    '''Saves the input projection and projeciton DataFrames to the database and retursn the populated Projeciton.'''
+def save_projection(projection:Projection, projs:List[DataFrame], id_type:IdType, progress=None, timer:StageTimer=None) -> Projection:
+    '''Saves the input projection and projeciton DataFrames to the database and retursn the populated Projeciton. Players are resolved in bulk,
+    missing players are created together, and the player projections are inserted with executemany in a single transaction. Stats are stored
+    in the projection's columnar arrays rather than as projection_data rows. If a StageTimer is provided, each step is recorded as a stage.'''
+    if timer is None:
+        timer = StageTimer()
+    start = time.perf_counter()
+    if projection.index is not None:
+        #Values cached for the projection's previous contents can no longer be hit
+        calculation_cache_services.invalidate_projection(projection.index)
+    with timer.stage('Player id resolution', rows=sum(len(proj) for proj in projs)):
+        player_ids = get_player_ids(projs, id_type)
+    if progress is not None:
+        progress.increment_completion_percent(10)
+    #Cleared with the new contents, so the hash of the previous contents is never read for them
+    projection.content_hash = None
     with Session() as session:
-        seen_players = {}
-        for proj in projs:
-            stat_cols = proj.columns
-            if 'IP' in stat_cols:
-                pitch = True
-            else:
-                pitch = False
-            inc_div = math.ceil(len(proj)/25)
-            inc_count=0
-            for idx, row in proj.iterrows():
-                if idx in seen_players:
-                    player = seen_players[idx]
-                    player_proj = projection.get_player_projection(player.index, idx=idx)
-                    player_proj.pitcher = False
-                    player_proj.two_way = True
+        session.add(projection)
+        session.flush()
+        with timer.stage('Player creation') as timing:
+            new_players = {}
+            for proj in projs:
+                for idx, name, team in zip(proj.index, proj['Name'], proj['Team']):
+                    if player_ids.get(idx) is None and idx not in new_players:
+                        new_players[idx] = {'Name':name, 'Team':team}
+            player_ids.update(player_services.insert_players(new_players, session))
+            timing.rows = len(new_players)
+        if progress is not None:
+            progress.increment_completion_percent(5)
+
+        with timer.stage('Player projection insert') as timing:
+            pp_rows = {}
+            tables = {}
+            for proj in projs:
+                pitch = 'IP' in proj.columns
+                if pitch:
+                    stat_map = StatType.pitch_to_enum_dict()
                 else:
-                    if id_type == IdType.FANGRAPHS:
-                        player = player_services.get_player_by_fg_id(idx)
-                    elif id_type == IdType.OTTONEU:
-                        player = player_services.get_player_by_ottoneu_id(idx)
+                    stat_map = StatType.hit_to_enum_dict()
+                stat_cols = [col for col in proj.columns if col not in ['Name','Team','-1','PlayerId'] and stat_map.get(col) is not None]
+                for idx in proj.index:
+                    pp_row = pp_rows.get(idx)
+                    if pp_row is None:
+                        pp_row = {'player_id':player_ids[idx], 'projection_id':projection.index, 'pitcher':pitch, 'two_way':False}
+                        pp_rows[idx] = pp_row
                     else:
-                        raise Exception(f'Unsupported IdType {id_type}')
-                    if player == None:
-                        player = player_services.create_player(row, fg_id=idx)
-                    seen_players[idx] = player
-                    player_proj = PlayerProjection()
-                    projection.player_projections.append(player_proj)
-                    player_proj.projection_data = []
-                    player_proj.pitcher = pitch
-                    player_proj.two_way = False
-                player_proj.player = player
-                
-                for col in stat_cols:
-                    if col not in ['Name','Team','-1','PlayerId']:
-                        if pitch:
-                            stat_type = StatType.pitch_to_enum_dict().get(col)
-                        else:
-                            stat_type = StatType.hit_to_enum_dict().get(col)                            
-                        if stat_type != None:
-                            data = ProjectionData()
-                            data.stat_type = stat_type
-                            data.stat_value = row[col]
-                            if data.stat_value is None or math.isnan(data.stat_value):
-                                data.stat_value = 0
-                            player_proj.projection_data.append(data)
-                
-                inc_count += 1
-                if inc_count == inc_div and progress is not None:
-                    progress.increment_completion_percent(1)
-                    inc_count = 0
-
-        session.add(projection)
-        session.commit()
+                        #Two-way players keep a single player projection with both sets of stats
+                        pp_row['pitcher'] = False
+                        pp_row['two_way'] = True
+                tables[pitch] = (proj, stat_cols, stat_map)
+            existing = set(session.execute(select(PlayerProjection.index).where(PlayerProjection.projection_id == projection.index)).scalars())
+            session.execute(PlayerProjection.__table__.insert(), list(pp_rows.values()))
+            #The database assigns increasing keys in insert order, so the projection's new keys in order belong to the rows in order
+            pp_indices = [pp_index for pp_index in session.execute(select(PlayerProjection.index).where(PlayerProjection.projection_id == projection.index)
+                            .order_by(PlayerProjection.index)).scalars() if pp_index not in existing]
+            for pp_row, pp_index in zip(pp_rows.values(), pp_indices):
+                pp_row['index'] = pp_index
+            timing.rows = len(pp_rows)
+        if progress is not None:
+            progress.increment_completion_percent(10)
+
+        with timer.stage('Projection arrays insert') as timing:
+            arrays = session.get(ProjectionArrays, projection.index)
+            if arrays is None:
+                arrays = ProjectionArrays(projection_id=projection.index)
+                session.add(arrays)
+            num_stats = 0
+            for pitch, (proj, stat_cols, stat_map) in tables.items():
+                #Rows are stored in player projection order, as load_projection_dfs returns them
+                order = np.argsort([pp_rows[idx]['index'] for idx in proj.index], kind='stable')
+                values = proj[stat_cols].astype(float).fillna(0).to_numpy()[order]
+                data = ProjectionArrays.get_data(proj.index[order].map(player_ids).to_numpy(dtype=np.int64), [stat_map.get(col) for col in stat_cols], values)
+                if pitch:
+                    arrays.pitchers = data
+                else:
+                    arrays.hitters = data
+                num_stats += values.size
+            #Both tables are required, so a missing one is stored empty
+            if arrays.hitters is None:
+                arrays.hitters = ProjectionArrays.get_data(np.empty(0, dtype=np.int64), [], np.empty((0, 0)))
+            if arrays.pitchers is None:
+                arrays.pitchers = ProjectionArrays.get_data(np.empty(0, dtype=np.int64), [], np.empty((0, 0)))
+            timing.rows = num_stats
+            session.commit()
+        if progress is not None:
+            progress.increment_completion_percent(25)
 
-        new_proj = get_projection(projection.index, player_data=False) 
+        new_proj = get_projection(projection.index, player_data=False)
+    calculation_cache_services.set_projection_hash(new_proj.index, convert_to_df(new_proj))
+    seconds = time.perf_counter() - start
+    logging.info(f'Saved {len(pp_rows)} player projections and {num_stats} stats in {seconds:.2f}s ({len(pp_rows) / seconds if seconds > 0 else 0:.0f} rows/s)')
     return new_proj
 
+def load_projection_arrays(proj_id:int) -> List[Tuple[np.ndarray, Dict[StatType, np.ndarray]]]:
+    '''Returns the player ids and stat columns of the hitter and pitcher tables stored for the Projection with the input id, or None if the
+    projection's stats are only stored as projection_data rows.'''
+    with Session() as session:
+        arrays = session.get(ProjectionArrays, proj_id)
+        if arrays is None:
+            return None
+        return [ProjectionArrays.read_data(arrays.hitters), ProjectionArrays.read_data(arrays.pitchers)]
+
+def set_stored_stats(proj:Projection) -> None:
+    '''Sets each loaded PlayerProjection's stats from the projection's arrays, if it has them. The arrays are read and decoded once for the
+    whole projection.'''
+    if proj is None or proj.index is None:
+        return
+    tables = load_projection_arrays(proj.index)
+    if tables is None:
+        return
+    stats = ProjectionArrays.get_stats(tables)
+    for pp in proj.player_projections:
+        pp.set_stored_stats(stats.get(pp.player_id, {}))
+
+def get_player_ids(projs:List[DataFrame], id_type:IdType) -> Dict[object, int]:
+    '''Returns the Toolbox player id of each id in the projection DataFrames\' indices, keyed by the projection id. Ids without an existing player
+    map to None. Ottoneu ids not in the database are populated from the Ottoneu player page.'''
+    ids = list(dict.fromkeys(idx for proj in projs for idx in proj.index))
+    if id_type == IdType.FANGRAPHS:
+        found = player_services.get_player_ids_by_fg_id([str(idx) for idx in ids])
+        return {idx : found.get(str(idx)) for idx in ids}
+    elif id_type == IdType.OTTONEU:
+        found = player_services.get_player_ids_by_ottoneu_id([int(idx) for idx in ids])
+        player_ids = {}
+        for idx in ids:
+            player_id = found.get(int(idx))
+            if player_id is None:
+                player = player_services.get_player_by_ottoneu_id(idx)
+                if player is not None:
+                    player_id = player.index
+            player_ids[idx] = player_id
+        return player_ids
+    else:
+        raise Exception(f'Unsupported IdType {id_type}')
+
 def create_projection_from_upload(projection: Projection, pos_file:str, pitch_file:str, name:str, desc:str='', ros:bool=False, year:int=None, progress=None):
     '''Creates a new projection from user inputs, saves it to the database, and returns the populated projection.'''
     projection.type = ProjectionType.CUSTOM
@@ -469,12 +548,20 @@ def get_projection(proj_id: int, player_data=True) -> Projection:
                 .options(joinedload(Projection.player_projections))
                 .filter_by(index = proj_id).first()
             )
+            set_stored_stats(proj)
         else:
             proj = session.query(Projection).filter(Projection.index == proj_id).first()
     return proj     
 
 def convert_to_df(proj:Projection) -> List[DataFrame]:
     '''Converts input Projection to a list of DataFrames, index 0 for hitter and index 1 for pitcher.'''
+    if proj.index is not None:
+        tables = load_projection_arrays(proj.index)
+        if tables is not None:
+            return arrays_to_dfs(proj.index, tables)
+    if proj.index is not None and 'player_projections' in inspect(proj).unloaded:
+        #Read stored player data directly instead of lazy loading it as ORM objects
+        return load_projection_dfs(proj.index)
     pos_col = []
     pitch_col = []
     #Loop to get the dataframe columns
@@ -516,14 +603,79 @@ def convert_to_df(proj:Projection) -> List[DataFrame]:
 
     return [pos_proj, pitch_proj]
 
+def arrays_to_dfs(proj_id:int, tables:List[Tuple[np.ndarray, Dict[StatType, np.ndarray]]]) -> List[DataFrame]:
+    '''Returns the same hitter and pitcher DataFrames as convert_to_df from the stored arrays of the Projection with the input id. Player names,
+    teams, and positions are read in one query.'''
+    stmt = (select(Player.index, Player.name, Player.team, Player.position)
+            .join(PlayerProjection, PlayerProjection.player_id == Player.index)
+            .where(PlayerProjection.projection_id == proj_id)
+    )
+    with Session() as session:
+        rows = session.connection().execute(stmt).all()
+    players = DataFrame(rows, columns=['ID', 'Name', 'Team', 'Position(s)']).drop_duplicates('ID').set_index('ID')
+    dfs = []
+    for player_ids, columns in tables:
+        proj = players.reindex(pd.Index(player_ids, name='ID'))
+        for stat_type, values in columns.items():
+            proj[StatType.enum_to_display_dict().get(stat_type)] = values
+        dfs.append(proj)
+    return dfs
+
+def load_projection_dfs(proj_id:int) -> List[DataFrame]:
+    '''Returns the same hitter and pitcher DataFrames as convert_to_df for the Projection with the input id, with stat columns in stored order. The
+    player projections, their stats, and their players are read in one query and the long-form stats are pivoted into columns without creating
+    ORM objects.'''
+    #Stat types are read as their stored names, which are much cheaper to pivot on than StatType members
+    stmt = (select(PlayerProjection.index, PlayerProjection.pitcher, PlayerProjection.two_way, Player.index, Player.name, Player.team, Player.position,
+                    type_coerce(ProjectionData.stat_type, String), ProjectionData.stat_value)
+            .join(Player, PlayerProjection.player_id == Player.index)
+            .outerjoin(ProjectionData, ProjectionData.player_projection_id == PlayerProjection.index)
+            .where(PlayerProjection.projection_id == proj_id)
+            .order_by(PlayerProjection.index, ProjectionData.index)
+    )
+    with Session() as session:
+        rows = session.connection().execute(stmt).all()
+    stat_rows = DataFrame(rows, columns=['pp_id', 'pitcher', 'two_way', 'ID', 'Name', 'Team', 'Position(s)', 'stat_type', 'stat_value'])
+
+    players = stat_rows.drop_duplicates('pp_id').set_index('pp_id')
+    pitcher = players['pitcher'].astype(bool)
+    two_way = players['two_way'].astype(bool)
+    stat_rows = stat_rows.dropna(subset=['stat_type'])
+    #Columns come from the first player projection of each type that has stats
+    pos_col = _get_first_stat_types(stat_rows, players.index[~pitcher & ~two_way])
+    pitch_col = _get_first_stat_types(stat_rows, players.index[pitcher])
+    #As with get_stat, the first value of a stat wins
+    stats = stat_rows.drop_duplicates(subset=['pp_id', 'stat_type']).pivot(index='pp_id', columns='stat_type', values='stat_value')
+
+    pos_proj = _get_projection_df(players, stats, two_way | ~pitcher, pos_col)
+    pitch_proj = _get_projection_df(players, stats, two_way | pitcher, pitch_col)
+    return [pos_proj, pitch_proj]
+
+def _get_first_stat_types(stat_rows:DataFrame, pp_ids:pd.Index) -> List[str]:
+    '''Returns the stat type names of the first of the input player projections that has stats.'''
+    candidates = stat_rows.loc[stat_rows['pp_id'].isin(pp_ids)]
+    if len(candidates) == 0:
+        return []
+    return list(candidates.loc[candidates['pp_id'] == candidates['pp_id'].iloc[0], 'stat_type'])
+
+def _get_projection_df(players:DataFrame, stats:DataFrame, mask:pd.Series, columns:List[str]) -> DataFrame:
+    '''Returns the projection DataFrame for the masked player projections with the input stat columns, indexed by player id.'''
+    proj = players.loc[mask, ['ID', 'Name', 'Team', 'Position(s)']]
+    values = stats.reindex(index=proj.index, columns=columns)
+    values.columns = [StatType.enum_to_display_dict().get(StatType[col]) for col in columns]
+    proj = pd.concat([proj, values], axis=1)
+    return proj.set_index('ID')
+
 def db_rows_to_df(player_proj, columns):
     row = []
     row.append(player_proj.player.index)
     row.append(player_proj.player.name)
     row.append(player_proj.player.team)
     row.append(player_proj.player.position)
+    stats = player_proj.get_stat_index()
     for col in columns:
-        row.append(player_proj.get_stat(col))
+        data = stats.get(col)
+        row.append(None if data is None else data.stat_value)
     return row
 
 def get_projections_for_current_year() -> List[Projection]:
@@ -552,8 +704,21 @@ def delete_projection_by_id(proj_id: int) -> None:
         proj = session.query(Projection).filter(Projection.index == proj_id).first()
         session.delete(proj)
         session.commit()
+    calculation_cache_services.invalidate_projection(proj_id)
 
 def get_player_projection(pp_id: int) -> PlayerProjection:
     '''Returns a PlayerProjection from the database based on index.'''
     with Session() as session:
-        return session.query(PlayerProjection).filter(PlayerProjection.index == pp_id).first()
+        pp = session.query(PlayerProjection).filter(PlayerProjection.index == pp_id).first()
+    if pp is not None:
+        tables = load_projection_arrays(pp.projection_id)
+        if tables is not None:
+            #Only the one player's row is read from each table
+            stats = {}
+            for player_ids, columns in tables:
+                row = np.flatnonzero(player_ids == pp.player_id)
+                if len(row) > 0:
+                    for stat_type, values in columns.items():
+                        stats.setdefault(stat_type, float(values[row[0]]))
+            pp.set_stored_stats(stats)
+    return pp
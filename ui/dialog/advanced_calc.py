@@ -1,7 +1,8 @@
 import tkinter as tk
 from tkinter import *    
+from tkinter import ttk
 
-from domain.enum import ScoringFormat, RepLevelScheme, RankingBasis, CalculationDataType as CDT
+from domain.enum import ScoringFormat, RepLevelScheme, RepLevelSearch, RankingBasis, CalculationDataType as CDT
 from services import adv_calc_services
 from util import string_util
 
@@ -18,6 +19,8 @@ class Dialog(tk.Toplevel):
 
         self.option_dict = adv_calc_services.get_adv_option_dict()
         self.value_dict = {}
+        #Display text to stored value for options chosen from a list
+        self.option_values = {}
 
         row=0
 
@@ -38,20 +41,41 @@ class Dialog(tk.Toplevel):
                 #Fill IP
                 row = self.add_row('Target IP filled:', CDT.IP_TARGET, row)
                 row = self.add_row('Est. RP IP per team:', CDT.RP_IP_TARGET, row)
+        if rep_scheme == RepLevelScheme.TOTAL_ROSTERED:
+            if pitch_basis == RankingBasis.PIP:
+                row = self.add_row('Target IP filled:', CDT.IP_TARGET, row, default=1500)
+                row = self.add_row('Est. RP IP per team:', CDT.RP_IP_TARGET, row, default=300)
+            else:
+                row = self.add_row('SP Games per Week:', CDT.GS_LIMIT, row, default=10)
+            row = self.add_option_row('Replacement level search:', CDT.REP_LEVEL_SEARCH, RepLevelSearch, row)
         
         tk.Button(frm, command=self.ok, text='OK', width=7).grid(row=row, column=0, padx=5)
         tk.Button(frm, command=self.cancel, text='Cancel', width=7).grid(row=row, column=1, padx=5)
     
-    def add_row(self, label_txt:str, data_type:CDT, row:int) -> int:
+    def add_row(self, label_txt:str, data_type:CDT, row:int, default:float=None) -> int:
             tk.Label(self.frm, text=label_txt).grid(row=row, column=0)
             self.value_dict[data_type] = textvar = StringVar()
             tk.Entry(self.frm, textvariable=textvar).grid(row=row, column=1)
-            textvar.set(self.option_dict.get(data_type).value)
+            option = self.option_dict.get(data_type)
+            textvar.set(option.value if option is not None else default)
+            return row+1
+    
+    def add_option_row(self, label_txt:str, data_type:CDT, option_enum, row:int) -> int:
+            tk.Label(self.frm, text=label_txt).grid(row=row, column=0)
+            self.value_dict[data_type] = textvar = StringVar()
+            display = option_enum.enum_to_display_dict()
+            self.option_values[data_type] = {text : opt.value for opt, text in display.items()}
+            ttk.Combobox(self.frm, textvariable=textvar, values=list(display.values()), state='readonly').grid(row=row, column=1)
+            default = list(option_enum)[0]
+            textvar.set(display[option_enum._value2member_map_[int(adv_calc_services.get_advanced_option(data_type, default=default.value).value)]])
             return row+1
     
     def ok(self):
         for cdt in self.value_dict:
-            adv_calc_services.set_advanced_option(cdt, self.value_dict[cdt].get())
+            value = self.value_dict[cdt].get()
+            if cdt in self.option_values:
+                value = self.option_values[cdt][value]
+            adv_calc_services.set_advanced_option(cdt, value)
         self.destroy()
 
     def cancel(self):
@@ -64,7 +64,7 @@ class DraftTool(tk.Frame):
     def on_show(self):
         if self.controller.league is None or not league_services.league_exists(self.controller.league):
             self.controller.select_league()
-        if self.controller.value_calculation is None or len(self.controller.value_calculation.values) == 0:
+        if self.controller.value_calculation is None or not self.controller.value_calculation.has_values():
             self.controller.select_value_set()
         if self.controller.league is None or self.controller.value_calculation is None:
             return False
@@ -103,14 +103,10 @@ class DraftTool(tk.Frame):
         pd.complete()
 
     def calculate_extra_value(self):
-        captured_value = 0
-        self.valued_roster_spots = 0
-        for pv in self.value_calculation.values:
-            if pv.position != Position.OVERALL or pv.value < 1:
-                continue
-            captured_value += pv.value
-            self.valued_roster_spots += 1
-        self.extra_value = self.league.num_teams * 400 - captured_value
+        values = self.value_calculation.get_values_df()
+        captured = values.loc[(values['position'] == Position.OVERALL) & ~(values['value'] < 1), 'value']
+        self.valued_roster_spots = len(captured)
+        self.extra_value = self.league.num_teams * 400 - captured.sum()
 
     def create_main(self):
         self.league_text_var = StringVar()
@@ -761,7 +757,7 @@ class DraftTool(tk.Frame):
                 hr_per_9 = "{:.2f}".format(pos_df.iat[i, 17])
                 self.pos_view[pos].insert('', tk.END, text=id, values=(name, value, inf_cost, position, team, pts,sabr_pts, rate1, rate2, rate3, rate4, sal_tup[0], sal_tup[1], sal_tup[2], k, era, whip, w, sv, hr_per_9), tags=tags)
     def get_salary_tuple(self, playerid):
-        si = self.value_calculation.get_player_value(playerid, pos=Position.OVERALL).player.get_salary_info_for_format(self.league.format)
+        si = self.value_calculation.get_value_player(playerid).get_salary_info_for_format(self.league.format)
         if si is None:
             avg = '$0.0'
             l10 = '$0.0'
@@ -1068,16 +1064,18 @@ class DraftTool(tk.Frame):
     
     def get_overall_value_rows(self):
         rows = []
-        for pv in self.value_calculation.get_position_values(Position.OVERALL):
+        values = self.value_calculation.get_values_df()
+        for player_id, value in values.loc[values['position'] == Position.OVERALL, ['player_id', 'value']].itertuples(index=False):
+            player = self.value_calculation.get_value_player(player_id)
             row = []
-            row.append(pv.player.index)
-            row.append(pv.player.ottoneu_id)
-            row.append(pv.value)
-            row.append(pv.player.name)
-            row.append(pv.player.team)
-            row.append(pv.player.position)
+            row.append(player.index)
+            row.append(player.ottoneu_id)
+            row.append(value)
+            row.append(player.name)
+            row.append(player.team)
+            row.append(player.position)
             if self.value_calculation.projection is not None:
-                pp = self.value_calculation.projection.get_player_projection(pv.player.index)
+                pp = self.value_calculation.projection.get_player_projection(player.index)
                 if pp is None or not self.value_calculation.projection.valid_points:
                     row.append(0.00) #points
                     row.append(0.00) #spoints
@@ -1142,22 +1140,24 @@ class DraftTool(tk.Frame):
                 row.append(0.00) #pitch rate sabr p/ip
                 row.append(0.00) #pitch rate pp/g
                 row.append(0.00) #pitch rate sabr pp/g
-            row.append(util.string_util.normalize(pv.player.name))
+            row.append(util.string_util.normalize(player.name))
             rows.append(row)
         return rows
 
     def get_offensive_rows(self, pos):
         rows = []
-        for pv in self.value_calculation.get_position_values(pos):
+        values = self.value_calculation.get_values_df()
+        for player_id, value in values.loc[values['position'] == pos, ['player_id', 'value']].itertuples(index=False):
+            player = self.value_calculation.get_value_player(player_id)
             row = []
-            row.append(pv.player.index)
-            row.append(pv.player.ottoneu_id)
-            row.append(pv.value)
-            row.append(pv.player.name)
-            row.append(pv.player.team)
-            row.append(pv.player.position)
+            row.append(player.index)
+            row.append(player.ottoneu_id)
+            row.append(value)
+            row.append(player.name)
+            row.append(player.team)
+            row.append(player.position)
             if self.value_calculation.projection is not None:
-                pp = self.value_calculation.projection.get_player_projection(pv.player.index)
+                pp = self.value_calculation.projection.get_player_projection(player.index)
                 if pp is not None:
                     if self.value_calculation.projection.valid_points:
                         if self.value_calculation.projection.type == ProjectionType.VALUE_DERIVED:
@@ -1245,16 +1245,18 @@ class DraftTool(tk.Frame):
     
     def get_pitching_rows(self, pos):
         rows = []
-        for pv in self.value_calculation.get_position_values(pos):
+        values = self.value_calculation.get_values_df()
+        for player_id, value in values.loc[values['position'] == pos, ['player_id', 'value']].itertuples(index=False):
+            player = self.value_calculation.get_value_player(player_id)
             row = []
-            row.append(pv.player.index)
-            row.append(pv.player.ottoneu_id)
-            row.append(pv.value)
-            row.append(pv.player.name)
-            row.append(pv.player.team)
-            row.append(pv.player.position)
+            row.append(player.index)
+            row.append(player.ottoneu_id)
+            row.append(value)
+            row.append(player.name)
+            row.append(player.team)
+            row.append(player.position)
             if self.value_calculation.projection is not None:
-                pp = self.value_calculation.projection.get_player_projection(pv.player.index)
+                pp = self.value_calculation.projection.get_player_projection(player.index)
                 if pp is not None:
                     if self.value_calculation.projection.valid_points:
                         if self.value_calculation.projection.type == ProjectionType.VALUE_DERIVED:
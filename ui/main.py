@@ -20,7 +20,7 @@ from domain.domain import Property
 from domain.enum import Preference as Pref, PropertyType
 from dao import db_update
    
-__version__ = '1.2.10'
+__version__ = '1.2.12'
 
 class Main(tk.Tk):
 
@@ -11,7 +11,7 @@ import pandas as pd
 
 from ui.table import Table
 from domain.domain import ValueCalculation
-from domain.enum import CalculationDataType as CDT, RankingBasis, RepLevelScheme, StatType, Position, ProjectionType, ScoringFormat
+from domain.enum import CalculationDataType as CDT, RankingBasis, RepLevelScheme, RepLevelSearch, StatType, Position, ProjectionType, ScoringFormat
 from services import projection_services, calculation_services, adv_calc_services
 from ui.dialog import projection_select, progress, name_desc, advanced_calc
 from ui.dialog.wizard import projection_import
@@ -55,7 +55,7 @@ class ValuesCalculation(tk.Frame):
         return True
     
     def leave_page(self):
-        if self.value_calc.index is None and len(self.value_calc.values) > 0:
+        if self.value_calc.index is None and self.value_calc.has_values():
             ret = mb.askyesnocancel('Save Calculation', 'Do you want to save the last run value calculation?')
             if ret is None:
                 return False
@@ -394,7 +394,7 @@ class ValuesCalculation(tk.Frame):
             pd.destroy()
     
     def append_player_column_data(self, val, pp, pos):
-        if len(self.value_calc.values) > 0:
+        if self.value_calc.has_values():
             pv = self.value_calc.get_player_value(pp.player.index, pos)
             if pv is None:
                 val.append("$0.0")
@@ -481,7 +481,7 @@ class ValuesCalculation(tk.Frame):
 
     def get_player_row(self, pp, enum_dict, cols, pos):
         val = []
-        if len(self.value_calc.values) > 0:
+        if self.value_calc.has_values():
             pv = self.value_calc.get_player_value(pp.player.index, pos)
             if pv is None:
                 val.append("$0.0")
@@ -591,8 +591,8 @@ class ValuesCalculation(tk.Frame):
             for pp in self.projection.player_projections:
                 val = self.get_overall_row(pp, self.projection.type == ProjectionType.VALUE_DERIVED)
                 self.tables[Position.OVERALL].insert('', tk.END, text=str(pp.player_id), values=val)
-        elif self.value_calc is not None and self.value_calc.values is not None and len(self.value_calc.values) > 0:
-            for player_id in self.value_calc.value_dict:
+        elif self.value_calc is not None and self.value_calc.has_values():
+            for player_id in self.value_calc.get_values_df()['player_id'].unique().tolist():
                 val = self.get_overall_row_no_proj(player_id)
                 self.tables[Position.OVERALL].insert('',  tk.END, text=str(player_id), values=val)
 
@@ -605,9 +605,9 @@ class ValuesCalculation(tk.Frame):
                     elif pp.get_stat(StatType.AB) is not None:
                         val = self.get_player_row(pp, StatType.hit_to_enum_dict(), all_hitting_stats, pos)
                     self.tables[pos].insert('', tk.END, text=str(pp.player_id), values=val)
-        elif self.value_calc is not None and self.value_calc.values is not None and len(self.value_calc.values) > 0:
+        elif self.value_calc is not None and self.value_calc.has_values():
             hit_col = player_columns + h_fom_columns + point_cols + all_hitting_stats
-            for player_id in self.value_calc.value_dict:
+            for player_id in self.value_calc.get_values_df()['player_id'].unique().tolist():
                 val = self.get_player_row_no_proj(player_id, pos, hit_col)
                 if val is not None:
                     self.tables[pos].insert('',  tk.END, text=str(player_id), values=val)
@@ -625,9 +625,9 @@ class ValuesCalculation(tk.Frame):
                         or (pos == Position.POS_SP and pp.get_stat(StatType.GS_PIT) > 0):
                             val = self.get_player_row(pp, StatType.pitch_to_enum_dict(), all_pitching_stats, pos)
                             self.tables[pos].insert('', tk.END, text=str(pp.player_id), values=val)
-        elif self.value_calc is not None and self.value_calc.values is not None and len(self.value_calc.values) > 0:
+        elif self.value_calc is not None and self.value_calc.has_values():
             pitch_cols = player_columns + p_fom_columns + point_cols + all_pitching_stats
-            for player_id in self.value_calc.value_dict:
+            for player_id in self.value_calc.get_values_df()['player_id'].unique().tolist():
                 val = self.get_player_row_no_proj(player_id, pos, pitch_cols)
                 if val is not None:
                     self.tables[pos].insert('',  tk.END, text=str(player_id), values=val)
@@ -926,6 +926,8 @@ class ValuesCalculation(tk.Frame):
             mb.showerror("Error starting calculation", 'There was an error checking inputs. Please see the logs.')
             logging.exception("Errors validating calculation inputs")
             return
+        #The last calculation's replacement levels are reused if only dollar inputs changed
+        previous = self.value_calc
         self.value_calc = ValueCalculation()
         self.value_calc.projection = self.projection
         self.value_calc.format = ScoringFormat.name_to_enum_map()[self.game_type.get()]
@@ -952,7 +954,7 @@ class ValuesCalculation(tk.Frame):
         logging.debug("About to perform point_calc")
         pd = progress.ProgressDialog(self, title='Performing Calculation')
         try:
-            calculation_services.perform_point_calculation(self.value_calc, pd)
+            calculation_services.perform_point_calculation(self.value_calc, pd, use_cache=True, previous=previous)
             logging.debug("Performed calc")
             self.update_values()
             #self.populate_projections()
@@ -977,6 +979,14 @@ class ValuesCalculation(tk.Frame):
                 #Fill IP
                 self.value_calc.set_input(CDT.IP_TARGET, adv_calc_services.get_advanced_option(CDT.IP_TARGET, default=1500).value)
                 self.value_calc.set_input(CDT.RP_IP_TARGET, adv_calc_services.get_advanced_option(CDT.RP_IP_TARGET, default=300).value)
+        if self.value_calc.get_input(CDT.REP_LEVEL_SCHEME) == RepLevelScheme.TOTAL_ROSTERED.value:
+            #Rostered arms are balanced against innings for P/IP and starts for PPG
+            if self.value_calc.pitcher_basis == RankingBasis.PIP:
+                self.value_calc.set_input(CDT.IP_TARGET, adv_calc_services.get_advanced_option(CDT.IP_TARGET, default=1500).value)
+                self.value_calc.set_input(CDT.RP_IP_TARGET, adv_calc_services.get_advanced_option(CDT.RP_IP_TARGET, default=300).value)
+            else:
+                self.value_calc.set_input(CDT.GS_LIMIT, adv_calc_services.get_advanced_option(CDT.GS_LIMIT, default=10).value)
+            self.value_calc.set_input(CDT.REP_LEVEL_SEARCH, adv_calc_services.get_advanced_option(CDT.REP_LEVEL_SEARCH, default=RepLevelSearch.HEURISTIC.value).value)
     
     def set_default_rep_level(self, scheme):
         if scheme == RepLevelScheme.NUM_ROSTERED:
@@ -1017,7 +1027,7 @@ class ValuesCalculation(tk.Frame):
             table.resort()
     
     def set_advanced_button_status(self):
-        if self.rep_level_scheme.get() == RepLevelScheme.FILL_GAMES.value:
+        if self.rep_level_scheme.get() == RepLevelScheme.FILL_GAMES.value or self.rep_level_scheme.get() == RepLevelScheme.TOTAL_ROSTERED.value:
             self.advanced_btn.configure(state='enable')
         elif self.game_type.get() == ScoringFormat.CLASSIC_4X4.value or self.game_type.get() == ScoringFormat.OLD_SCHOOL_5X5.value:
             self.advanced_btn.configure(state='enable')
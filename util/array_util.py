@@ -0,0 +1,7 @@
+import numpy as np
+
+def safe_divide(numerator:np.ndarray, denominator:np.ndarray) -> np.ndarray:
+    '''Returns the element-wise quotient of the two arrays, with a result of 0 wherever the denominator is 0.'''
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=(denominator != 0))
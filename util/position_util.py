@@ -0,0 +1,30 @@
+import numpy as np
+from pandas import Series
+from typing import Dict, List
+
+from domain.enum import Position
+
+#Positions represented in an eligibility mask, in bit order
+MASK_POSITIONS:List[Position] = [Position.POS_C, Position.POS_1B, Position.POS_2B, Position.POS_SS, Position.POS_3B, Position.POS_OF,
+                                 Position.POS_MI, Position.POS_UTIL, Position.POS_SP, Position.POS_RP]
+POSITION_BITS:Dict[Position, int] = {pos : 1 << idx for idx, pos in enumerate(MASK_POSITIONS)}
+
+def get_position_mask(pos_str:str) -> int:
+    '''Returns the eligibility bitmask for a Position(s) string. A position is eligible if it appears in the string, MI if 2B or SS
+    does, and Util always, since every hitter can fill Util.'''
+    mask = POSITION_BITS[Position.POS_UTIL]
+    for pos in MASK_POSITIONS:
+        if pos != Position.POS_MI and pos != Position.POS_UTIL and pos.value in pos_str:
+            mask |= POSITION_BITS[pos]
+    if mask & (POSITION_BITS[Position.POS_2B] | POSITION_BITS[Position.POS_SS]):
+        mask |= POSITION_BITS[Position.POS_MI]
+    return mask
+
+def get_position_masks(pos_strs:Series) -> np.ndarray:
+    '''Returns the eligibility bitmask for each Position(s) string. Each distinct string is only parsed once.'''
+    unique_strs, inverse = np.unique(np.asarray(pos_strs, dtype=str), return_inverse=True)
+    return np.array([get_position_mask(pos_str) for pos_str in unique_strs], dtype=np.int32)[inverse]
+
+def is_eligible(masks:np.ndarray, pos:Position) -> np.ndarray:
+    '''Returns a boolean array that is True where the eligibility mask includes the position.'''
+    return (np.asarray(masks) & POSITION_BITS[pos]) != 0
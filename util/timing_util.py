@@ -0,0 +1,58 @@
+from contextlib import contextmanager
+import logging
+import time
+from typing import Dict, Iterator, List
+
+from pandas import DataFrame
+
+class StageTiming():
+    '''Wall time, search iterations, and rows processed for one stage of a calculation.'''
+
+    def __init__(self, name:str, seconds:float=0.0, iterations:int=0, rows:int=0):
+        self.name = name
+        self.seconds = seconds
+        self.iterations = iterations
+        self.rows = rows
+
+    def to_dict(self) -> Dict[str, object]:
+        '''Returns the timing as a dictionary of plain values.'''
+        return {'Stage':self.name, 'Seconds':self.seconds, 'Iterations':self.iterations, 'Rows':self.rows}
+
+class StageTimer():
+    '''Records a StageTiming for each stage of a calculation in the order the stages start. Only holds plain values so it can be returned
+    from a worker process.'''
+
+    def __init__(self):
+        self.stages:List[StageTiming] = []
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name:str, rows:int=0) -> Iterator[StageTiming]:
+        '''Times the body of the with statement as a stage. The yielded StageTiming's iterations and rows may be set within the body.'''
+        timing = StageTiming(name, rows=rows)
+        self.stages.append(timing)
+        start = time.perf_counter()
+        try:
+            yield timing
+        finally:
+            timing.seconds = time.perf_counter() - start
+            logging.debug(f'{name}: {timing.seconds:.3f}s, {timing.iterations} iterations, {timing.rows} rows')
+
+    def extend(self, timer:'StageTimer') -> None:
+        '''Appends the stages recorded by another timer, such as one returned from a worker process.'''
+        self.stages.extend(timer.stages)
+
+    def get_stage(self, name:str) -> StageTiming:
+        '''Returns the first stage with the name, or None if no such stage was recorded.'''
+        for timing in self.stages:
+            if timing.name == name:
+                return timing
+        return None
+
+    def get_elapsed_seconds(self) -> float:
+        '''Returns the wall time since the timer was created. Stages run in worker processes overlap, so this is not the sum of the stages.'''
+        return time.perf_counter() - self.start
+
+    def to_df(self) -> DataFrame:
+        '''Returns a DataFrame with one row per recorded stage.'''
+        return DataFrame([timing.to_dict() for timing in self.stages], columns=['Stage', 'Seconds', 'Iterations', 'Rows'])
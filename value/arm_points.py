@@ -1,11 +1,17 @@
 import pandas as pd
 from pandas import DataFrame
+import numpy as np
+import logging
 import os
 from os import path
 from copy import deepcopy
+from typing import Dict
 
 from domain.domain import ValueCalculation
-from domain.enum import RepLevelScheme, RankingBasis, CalculationDataType as CDT, ScoringFormat
+from domain.enum import RepLevelScheme, RepLevelSearch, RankingBasis, CalculationDataType as CDT, ScoringFormat, Position
+from util import array_util, position_util
+from util.timing_util import StageTimer
+from value.rep_level_solver import ArmRepLevelSolver, bisect_bracket
 
 pd.options.mode.chained_assignment = None # from https://stackoverflow.com/a/20627316
 
@@ -33,6 +39,12 @@ class ArmPoint():
         self.scoring_format = value_calc.format
         
         self.no_sv_hld = value_calc.get_input(CDT.INCLUDE_SVH) == 0
+        #If False, replacement_positions and replacement_levels are already solved and are used as-is
+        self.search = True
+        self.search_method = RepLevelSearch._value2member_map_[int(value_calc.get_input(CDT.REP_LEVEL_SEARCH, RepLevelSearch.HEURISTIC.value))]
+        #Number of replacement level updates made by the replacement level search
+        self.iterations = 0
+        self.timer = StageTimer()
         
         if self.rep_level_scheme == RepLevelScheme.FILL_GAMES:
             if ScoringFormat.is_h2h(self.scoring_format):
@@ -42,6 +54,15 @@ class ArmPoint():
                 self.target_innings = value_calc.get_input(CDT.IP_TARGET) * self.num_teams
                 self.ip_per_team = value_calc.get_input(CDT.IP_TARGET)
                 self.rp_ip_per_team = value_calc.get_input(CDT.RP_IP_TARGET)
+        elif self.rep_level_scheme == RepLevelScheme.TOTAL_ROSTERED:
+            #The total rostered search balances the number of arms against innings (P/IP) or starts (PPG). The bisection gives RP the
+            #estimated RP innings when splitting P/IP roster spots
+            if self.rank_basis == RankingBasis.PIP:
+                self.target_innings = value_calc.get_input(CDT.IP_TARGET) * self.num_teams
+                self.ip_per_team = value_calc.get_input(CDT.IP_TARGET)
+                self.rp_ip_per_team = value_calc.get_input(CDT.RP_IP_TARGET)
+            else:
+                self.gs_per_week = value_calc.get_input(CDT.GS_LIMIT)
 
         if intermediate_calc:
             self.dirname = os.path.abspath(os.path.join(os.path.dirname( __file__ ), '..'))
@@ -108,54 +129,108 @@ class ArmPoint():
             return 0
         return row['No SVH Points'] / row['G']
 
+    def get_stat_array(self, df:DataFrame, col:str, default:float=0.0) -> np.ndarray:
+        '''Returns the DataFrame column as a float array, or an array filled with the default if the column is not present'''
+        if col in df.columns:
+            return df[col].to_numpy(dtype=float)
+        return np.full(len(df), default, dtype=float)
+
+    def calc_points_array(self, df:DataFrame, save:np.ndarray, hold:np.ndarray) -> np.ndarray:
+        '''Returns pitching points for every pitcher using the input save and hold arrays. Column equivalent of pitch_points_engine,
+        including the HBP regression when HBP is not available.'''
+        ip = df['IP'].to_numpy(dtype=float)
+        so = df['SO'].to_numpy(dtype=float)
+        bb = df['BB'].to_numpy(dtype=float)
+        hr = df['HR'].to_numpy(dtype=float)
+        if 'HBP' in df.columns:
+            hbp = df['HBP'].to_numpy(dtype=float)
+        else:
+            hbp = 0.0951*bb+0.4181
+        if(self.SABR):
+            return 5.0*ip+2.0*so-3.0*bb-3.0*hbp-13.0*hr+5.0*save+4.0*hold
+        else:
+            h = df['H'].to_numpy(dtype=float)
+            return 7.4*ip+2.0*so-2.6*h-3.0*bb-3.0*hbp-12.3*hr+5.0*save+4.0*hold
+
+    def calc_points_and_rates(self, df:DataFrame) -> None:
+        '''Populates the Points, No SVH Points, P/IP, and No SVH P/IP columns (and PPG columns when ranking by PPG) for every pitcher
+        in-place using column operations. Results are identical to the row-wise calc_pitch_points, calc_ppi, and calc_ppg methods.'''
+        zeros = np.zeros(len(df), dtype=float)
+        points = self.calc_points_array(df, self.get_stat_array(df, 'SV'), self.get_stat_array(df, 'HLD'))
+        no_svh_points = self.calc_points_array(df, zeros, zeros)
+        df['Points'] = points
+        df['No SVH Points'] = no_svh_points
+
+        ip = df['IP'].to_numpy(dtype=float)
+        df['P/IP'] = array_util.safe_divide(points, ip)
+        df['No SVH P/IP'] = array_util.safe_divide(no_svh_points, ip)
+        if self.rank_basis == RankingBasis.PPG:
+            g = df['G'].to_numpy(dtype=float)
+            df['PPG'] = array_util.safe_divide(points, g)
+            df['No SVH PPG'] = array_util.safe_divide(no_svh_points, g)
+
     def get_pitcher_par(self, df:DataFrame) -> DataFrame:
         
+        self.iterations = 0
+        self.converged = True
         if self.rep_level_scheme == RepLevelScheme.STATIC_REP_LEVEL:
             self.get_par(df)
             self.set_number_rostered(df)
         else:
             num_arms = 0
             total_ip = 0
-            self.get_pitcher_par_calc(df)
+            self.solver = ArmRepLevelSolver(df, self.get_rate_cols(), {'SP' : self.min_sp_ip, 'RP' : self.min_rp_ip}, self.rank_basis)
+            if self.search:
+                self.set_solver_rep_levels()
 
-            rosterable = df.loc[df['PAR'] >= 0]
-            sp_ip = rosterable.apply(self.usable_ip_calc, args=("SP",), axis=1).sum()
-            rp_ip = rosterable.apply(self.usable_ip_calc, args=("RP",), axis=1).sum()
+            totals = self.solver.get_rostered_totals(self.replacement_levels)
+            sp_ip = totals['SP IP']
+            rp_ip = totals['RP IP']
             total_ip = sp_ip + rp_ip
 
-            sp_g = rosterable.apply(self.usable_gs_calc, axis=1).sum()
-            rp_g = rosterable.apply(self.usable_rp_g_calc, axis=1).sum()
+            sp_g = totals['SP G']
+            rp_g = totals['RP G']
 
-            if self.rep_level_scheme == RepLevelScheme.FILL_GAMES:
+            if not self.search:
+                logging.debug('Using provided replacement positions and levels without searching')
+            elif self.rep_level_scheme == RepLevelScheme.FILL_GAMES:
                 if not ScoringFormat.is_h2h(self.scoring_format):
                     while sp_ip < self.num_teams * (self.ip_per_team-self.rp_ip_per_team) and self.replacement_positions['SP'] < self.max_rost_num['SP']:
                         self.replacement_positions['SP'] = self.replacement_positions['SP'] + 1
-                        self.get_pitcher_par_calc(df)
-                        rosterable = df.loc[df['PAR SP'] >= 0]
-                        sp_ip = rosterable.apply(self.usable_ip_calc, args=("SP",), axis=1).sum()
+                        self.set_solver_rep_levels()
+                        sp_ip, _ = self.solver.get_role_totals('SP', self.replacement_levels['SP'])
                     while rp_ip < self.num_teams * self.rp_ip_per_team and self.replacement_positions['RP'] < self.max_rost_num['RP']:
                         self.replacement_positions['RP'] = self.replacement_positions['RP'] + 1
-                        self.get_pitcher_par_calc(df)
-                        rosterable = df.loc[df['PAR RP'] >= 0]
-                        rp_ip = rosterable.apply(self.usable_ip_calc, args=("RP",), axis=1).sum()
+                        self.set_solver_rep_levels()
+                        rp_ip, _ = self.solver.get_role_totals('RP', self.replacement_levels['RP'])
+                    self.converged = sp_ip >= self.num_teams * (self.ip_per_team-self.rp_ip_per_team) and rp_ip >= self.num_teams * self.rp_ip_per_team
                 else:
                     while sp_g < self.num_teams * self.gs_per_week * self.weeks and self.replacement_positions['SP'] < self.max_rost_num['SP']:
                         self.replacement_positions['SP'] = self.replacement_positions['SP'] + 1
-                        self.get_pitcher_par_calc(df)
-                        rosterable = df.loc[df['PAR SP'] >= 0]
-                        sp_g = rosterable.apply(self.usable_gs_calc, axis=1).sum()
+                        self.set_solver_rep_levels()
+                        _, sp_g = self.solver.get_role_totals('SP', self.replacement_levels['SP'])
                     while rp_g < self.num_teams * self.est_rp_g_per_week * self.weeks and self.replacement_positions['RP'] < self.max_rost_num['RP']:
                         self.replacement_positions['RP'] = self.replacement_positions['RP'] + 1
-                        self.get_pitcher_par_calc(df)
-                        rosterable = df.loc[df['PAR RP'] >= 0]
-                        rp_g = rosterable.apply(self.usable_rp_g_calc, axis=1).sum()
+                        self.set_solver_rep_levels()
+                        _, rp_g = self.solver.get_role_totals('RP', self.replacement_levels['RP'])
+                    self.converged = sp_g >= self.num_teams * self.gs_per_week * self.weeks and rp_g >= self.num_teams * self.est_rp_g_per_week * self.weeks
                 self.replacement_positions['SP'] = min(self.replacement_positions['SP'] + self.surplus_pos['SP'], self.max_rost_num['SP'])
                 self.replacement_positions['RP'] = min(self.replacement_positions['RP'] + self.surplus_pos['RP'], self.max_rost_num['RP'])
-                self.get_pitcher_par_calc(df)
+                self.set_solver_rep_levels()
 
+            elif self.rep_level_scheme == RepLevelScheme.TOTAL_ROSTERED and self.search_method == RepLevelSearch.BISECTION:
+                self.bisect_total_rostered()
             elif self.rep_level_scheme == RepLevelScheme.TOTAL_ROSTERED:
+                #The search can oscillate between the same SP/RP splits without ever meeting both targets
+                seen_states = set()
                 if self.rank_basis == RankingBasis.PIP:
                     while (num_arms != self.target_pitch or (abs(total_ip-self.target_innings) > 100 and self.replacement_positions['RP'] != self.rp_limit)) and (self.replacement_positions['SP'] < self.max_rost_num['SP'] and self.replacement_positions['RP'] < self.max_rost_num['RP']):
+                        state = (self.replacement_positions['SP'], self.replacement_positions['RP'])
+                        if state in seen_states:
+                            logging.warning(f'Pitcher replacement level search revisited SP {state[0]}/RP {state[1]} after {self.iterations} iterations; using current levels')
+                            self.converged = False
+                            break
+                        seen_states.add(state)
                         #Going to do optional capping of relievers. It can get a bit out of control otherwise
                         if num_arms < self.target_pitch and (self.replacement_positions['RP'] == self.rp_limit or self.replacement_positions['RP'] < self.max_rost_num['RP']):
                             self.replacement_positions['SP'] = self.replacement_positions['SP'] + 1
@@ -197,16 +272,21 @@ class ArmPoint():
                             else:
                                 #Probably not, but just in case
                                 self.replacement_positions['RP'] = self.replacement_positions['RP'] - 1
-                        self.get_pitcher_par_calc(df)
+                        self.set_solver_rep_levels()
                         #FOM is how many arms with a non-negative PAR...
-                        rosterable = df.loc[df['PAR'] >= 0]
-                        num_arms = len(rosterable)
+                        totals = self.solver.get_rostered_totals(self.replacement_levels)
+                        num_arms = int(totals['Count'])
                         #...and how many total innings are pitched
-                        total_ip = rosterable.apply(self.usable_ip_calc, args=("SP",), axis=1).sum()
-                        total_ip += rosterable.apply(self.usable_ip_calc, args=("RP",), axis=1).sum()
+                        total_ip = totals['SP IP'] + totals['RP IP']
                 elif self.rank_basis == RankingBasis.PPG:
                     target_starts = self.num_teams * self.gs_per_week * self.weeks
                     while num_arms != self.target_pitch or abs(sp_g-target_starts) > 10 and (self.replacement_positions['SP'] < self.max_rost_num['SP'] and self.replacement_positions['RP'] < self.max_rost_num['RP']):
+                        state = (self.replacement_positions['SP'], self.replacement_positions['RP'])
+                        if state in seen_states:
+                            logging.warning(f'Pitcher replacement level search revisited SP {state[0]}/RP {state[1]} after {self.iterations} iterations; using current levels')
+                            self.converged = False
+                            break
+                        seen_states.add(state)
                         #Going to do optional capping of relievers. It can get a bit out of control otherwise
                         if num_arms < self.target_pitch and self.replacement_positions['RP'] == self.rp_limit and self.replacement_positions['SP'] < self.max_rost_num['SP']:
                             self.replacement_positions['SP'] = self.replacement_positions['SP'] + 1
@@ -241,18 +321,21 @@ class ArmPoint():
                             #Too many pitchers and we don't have enough starts
                             else:
                                 self.replacement_positions['RP'] = self.replacement_positions['RP'] - 1
-                        self.get_pitcher_par_calc(df)
+                        self.set_solver_rep_levels()
                         #FOM is how many arms with a non-negative PAR...
-                        rosterable = df.loc[df['PAR'] >= 0]
-                        num_arms = len(rosterable)
+                        totals = self.solver.get_rostered_totals(self.replacement_levels)
+                        num_arms = int(totals['Count'])
                         #...and how many GS
-                        sp_g = rosterable.apply(self.usable_gs_calc, axis=1).sum()
-            elif self.rep_level_scheme == RepLevelScheme.NUM_ROSTERED:
-                self.get_pitcher_par_calc(df)
-            else:
+                        sp_g = totals['SP G']
+                if num_arms != self.target_pitch:
+                    self.converged = False
+            elif self.rep_level_scheme != RepLevelScheme.NUM_ROSTERED:
                 raise Exception("Unusable Replacement Level Scheme")
+            self.get_par(df)
+            logging.debug(f'Pitcher replacement levels set after {self.iterations} iterations (converged: {self.converged})')
         
         if(self.intermediate_calculations):
+            rosterable = df.loc[df['PAR'] >= 0]
             filepath = os.path.join(self.intermed_subdirpath, f"pit_rost.csv")
             rosterable.to_csv(filepath, encoding='utf-8-sig')
             filepath = os.path.join(self.intermed_subdirpath, f"df_tot.csv")
@@ -260,97 +343,98 @@ class ArmPoint():
 
         return df
 
-    def usable_ip_calc(self, row, role:str) -> float:
-        '''Returns an estimated usable number of innings pitched based on the projection and pitcher ranking'''
-        return row[f'IP {role}'] * row[f'{role} Multiplier']
-
-    def usable_par_calc(self, row, role) -> float:
-        '''Returns an estimated usable number of pitching PAR based on the projection and pitcher ranking'''
-        return row[f'PAR {role}'] * row[f'{role} Multiplier']
-
-    def usable_gs_calc(self, row) -> float:
-        '''Returns an estimated usable number of games started based on the projection and pitcher ranking'''
-        return row['GS'] * row['SP Multiplier']
-    
-    def usable_rp_g_calc(self, row) -> float:
-        '''Returns an estimated usable number of relief games pitched based on the projection and pitcher ranking'''
-        return (row['G'] - row['GS']) * row['RP Multiplier']
-
-    def get_pitcher_par_calc(self, df:DataFrame) -> None:
-        '''Sets replacement levels for the current iteration and populates PAR figures for all pitchers and roles'''
-        sp_rep_level = self.get_pitcher_rep_level(df, 'SP')
-        self.replacement_levels['SP'] = sp_rep_level
-        rp_rep_level = self.get_pitcher_rep_level(df, 'RP')
-        self.replacement_levels['RP'] = rp_rep_level
-        self.get_par(df)
-
-    def get_par(self, df:DataFrame) -> None:
-        '''Calculates role PARs and overall PAR for each pitcher in-place'''
-        df['PAR SP'] = df.apply(self.calc_pitch_par_role, args=('SP', self.replacement_levels['SP']), axis=1)
-        df['PAR RP'] = df.apply(self.calc_pitch_par_role, args=('RP', self.replacement_levels['RP']), axis=1)
-        df['PAR'] = df.apply(self.sum_role_par, axis=1)
-    
-    def set_number_rostered(self, df:DataFrame) -> None:
-        '''Determines what number pitcher represents replacement level for all roles and sets it in the internal dict'''
-        sp_count = 0
-        rp_count = 0
-        for idx, row in df.iterrows():
-            if row['PAR'] > 0:
-                if 'SP' in row['Position(s)']:
-                    sp_count += 1
-                if 'RP' in row['Position(s)']:
-                    rp_count += 1
-        self.replacement_positions['SP'] = sp_count
-        self.replacement_positions['RP'] = rp_count
-
-    def calc_pitch_par_role(self, row, role:str, rep_level:float) -> float:
-        '''Returns the PAR accumulated by the pitcher in the given role at the given replacement level.'''
-        if row['G'] == 0:
-            return -1
-        if row[f'IP {role}'] == 0: return -1
+    def get_rate_cols(self) -> Dict[str, str]:
+        '''Returns the rate column used to rank each pitcher role'''
         if self.no_sv_hld:
             prefix = 'No SVH '
         else:
             prefix = ''
         if self.rank_basis == RankingBasis.PIP:
-            rate = row[f'{prefix}P/IP {role}'] - rep_level
-            return rate * row[f'IP {role}']
-        elif self.rank_basis == RankingBasis.PPG:
-            rate = row[f'{prefix}PPG {role}'] - rep_level
-            if role == 'SP':
-                return rate * row['GS']
-            else:
-                return rate * (row['G'] - row['GS'])
-
-    def sum_role_par(self, row) -> float:
-        '''Sums the pitcher's SP and RP PAR values'''
-        sp_par = row['PAR SP']
-        if row['IP SP'] == 0:
-            sp_par = 0
-        rp_par = row['PAR RP']
-        if row['IP RP'] == 0:
-            rp_par = 0
-        return sp_par + rp_par
-
-    def get_pitcher_rep_level(self, df:DataFrame, pos:str) -> float:
-        '''Returns pitcher role replacement level based on current rank value in replacement_positions dict'''
-        #Filter DataFrame to just the position of interest
-        if pos == 'RP':
-            min_ip = self.min_rp_ip
-        else:
-            min_ip = self.min_sp_ip
-        pitch_df = df.loc[df[f'IP {pos}'] >= min_ip]
-        if self.no_sv_hld:
-            prefix = 'No SVH '
-        else:
-            prefix = ''
+            return {role : f'{prefix}P/IP {role}' for role in ['SP', 'RP']}
+        return {role : f'{prefix}PPG {role}' for role in ['SP', 'RP']}
+
+    def set_solver_rep_levels(self) -> None:
+        '''Sets replacement levels for the current iteration from the solver's ranked SP and RP rates'''
+        for role in ['SP', 'RP']:
+            #Fewer than one rostered would wrap around to the bottom of the rankings
+            self.replacement_positions[role] = max(self.replacement_positions[role], 1)
+        self.replacement_levels['SP'] = self.solver.get_rep_level('SP', self.replacement_positions['SP'])
+        self.replacement_levels['RP'] = self.solver.get_rep_level('RP', self.replacement_positions['RP'])
+        self.iterations += 1
+
+    def get_role_limits(self) -> Dict[str, int]:
+        '''Returns the most SP and RP that can be rostered, within the same limits as the stepwise search.'''
+        return {'SP' : max(self.max_rost_num['SP'], 1), 'RP' : max(min(self.max_rost_num['RP'], self.rp_limit), 1)}
+
+    def set_role_rep_level(self, role:str, num_rostered:int) -> None:
+        '''Sets the number rostered and replacement level for the role.'''
+        self.replacement_positions[role] = num_rostered
+        self.set_solver_rep_levels()
+
+    def get_sp_total(self, num_sp:int) -> float:
+        '''Sets the number of SP rostered and returns the usable SP innings (P/IP) or starts (PPG) of the SP with a non-negative SP PAR,
+        which never decreases as more SP are rostered.'''
+        self.set_role_rep_level('SP', num_sp)
+        sp_ip, sp_g = self.solver.get_role_totals('SP', self.replacement_levels['SP'])
+        return sp_ip if self.rank_basis == RankingBasis.PIP else sp_g
+
+    def get_num_arms(self, num_rp:int) -> int:
+        '''Sets the number of RP rostered and returns the number of pitchers with a non-negative PAR, which never decreases as more RP
+        are rostered.'''
+        self.set_role_rep_level('RP', num_rp)
+        return int(self.solver.get_rostered_totals(self.replacement_levels)['Count'])
+
+    def bisect_role(self, func, limit:int, target:float) -> float:
+        '''Bisects the number rostered in [1, limit] for the non-decreasing func, leaving the number whose result is closest to the target
+        set, and returns that result.'''
+        num = bisect_bracket(func, 1, limit, target)
+        result = func(num)
+        if num > 1 and result != target:
+            prev_result = func(num - 1)
+            if abs(prev_result - target) > abs(result - target):
+                return func(num)
+            return prev_result
+        return result
+
+    def bisect_total_rostered(self) -> None:
+        '''Sets the number rostered and replacement levels for SP and RP so that the SP fill the league\'s SP innings (P/IP) or starts (PPG)
+        and the total number of pitchers with a non-negative PAR is as close as possible to the target. The SP totals depend only on the SP
+        replacement level, so the number of SP is settled first and the number of RP is then bisected on the rostered count. Both are
+        monotone, so the search takes O(log n) evaluations and always terminates.'''
         if self.rank_basis == RankingBasis.PIP:
-            sort_col = f"{prefix}P/IP {pos}"
-        elif self.rank_basis == RankingBasis.PPG:
-            sort_col = f"{prefix}PPG {pos}"
-        pitch_df = pitch_df.sort_values(sort_col, ascending=False)
-        #Get the nth value (here the # of players rostered at the position - 1 for 0 index) from the sorted data
-        return pitch_df.iloc[self.replacement_positions[pos] - 1][sort_col]
+            sp_target = self.num_teams * (self.ip_per_team - self.rp_ip_per_team)
+        else:
+            sp_target = self.num_teams * self.gs_per_week * self.weeks
+        limits = self.get_role_limits()
+        self.bisect_role(self.get_sp_total, limits['SP'], sp_target)
+        num_arms = self.bisect_role(self.get_num_arms, limits['RP'], self.target_pitch)
+        self.converged = num_arms == self.target_pitch
+        logging.debug(f'Pitcher bisection found {num_arms} rostered for a target of {self.target_pitch} with SP {self.replacement_positions["SP"]}/RP {self.replacement_positions["RP"]} after {self.iterations} evaluations')
+
+    def get_par(self, df:DataFrame) -> None:
+        '''Calculates role PARs and overall PAR for each pitcher in-place. A role with no innings adds nothing to the overall PAR.'''
+        g = df['G'].to_numpy(dtype=float)
+        gs = df['GS'].to_numpy(dtype=float)
+        rate_cols = self.get_rate_cols()
+        par = np.zeros(len(df))
+        for role in ['SP', 'RP']:
+            ip = df[f'IP {role}'].to_numpy(dtype=float)
+            if self.rank_basis == RankingBasis.PIP:
+                weight = ip
+            elif role == 'SP':
+                weight = gs
+            else:
+                weight = g - gs
+            role_par = np.where((g == 0) | (ip == 0), -1, (df[rate_cols[role]].to_numpy(dtype=float) - self.replacement_levels[role]) * weight)
+            df[f'PAR {role}'] = role_par
+            par = par + np.where(ip == 0, 0, role_par)
+        df['PAR'] = par
+    
+    def set_number_rostered(self, df:DataFrame) -> None:
+        '''Determines what number pitcher represents replacement level for all roles and sets it in the internal dict'''
+        masks = position_util.get_position_masks(df.loc[df['PAR'] > 0, 'Position(s)'])
+        self.replacement_positions['SP'] = int(position_util.is_eligible(masks, Position.POS_SP).sum())
+        self.replacement_positions['RP'] = int(position_util.is_eligible(masks, Position.POS_RP).sum())
 
     def not_a_belly_itcher_filter(self, row) -> bool:
         '''Determines if pitcher has sufficient innings to be included in replacement level calculations. Split role
@@ -365,6 +449,15 @@ class ArmPoint():
         start_ratio = row['GS'] / row['G']
         return row['IP'] > (self.min_sp_ip - self.min_rp_ip)*start_ratio + self.min_rp_ip
 
+    def not_a_belly_itcher_mask(self, df:DataFrame) -> np.ndarray:
+        '''Returns a boolean array of the pitchers that pass not_a_belly_itcher_filter, evaluated for all rows at once.'''
+        pos = df['Position(s)'].to_numpy()
+        ip = df['IP'].to_numpy(dtype=float)
+        g = df['G'].to_numpy(dtype=float)
+        start_ratio = array_util.safe_divide(df['GS'], g)
+        swing = (g != 0) & (ip > (self.min_sp_ip - self.min_rp_ip)*start_ratio + self.min_rp_ip)
+        return np.where(pos == 'SP', ip >= self.min_sp_ip, np.where(pos == 'RP', ip >= self.min_rp_ip, swing))
+
     def rp_ip_func(self, row) -> float:
         '''Calculates the number of innings pitched in relief based on a linear regression using games relieved per total
         games as the independent variable.'''
@@ -483,20 +576,41 @@ class ArmPoint():
         return max(1 - factor * 0.15, 0.5) #TODO: Move 0.15 factor to preference
 
     def estimate_role_splits(self, df:DataFrame) -> None:
-        '''Estimate Innings, Rates, and ranks for pitchers in each role'''
-        df['IP RP'] = df.apply(self.rp_ip_func, axis=1)
-        df['IP SP'] = df.apply(self.sp_ip_func, axis=1)
-        
-        df['FIP SP'] = df.apply(self.sp_fip_calc, axis=1)
-        df['FIP RP'] = df.apply(self.rp_fip_calc, axis=1)
+        '''Estimate Innings, Rates, and ranks for pitchers in each role. Column equivalent of the row-wise role split methods.'''
+        g = df['G'].to_numpy(dtype=float)
+        gs = df['GS'].to_numpy(dtype=float)
+        ip = df['IP'].to_numpy(dtype=float)
+        fip = df['FIP'].to_numpy(dtype=float)
+        gr = g - gs
+
+        #See rp_ip_func for the regression
+        gr_per_g = array_util.safe_divide(gr, g)
+        ip_rp = np.where(g == 0, 0.0, np.where(gs == 0, ip, np.where(gs == g, 0.0, ip * (0.7851*gr_per_g**2 + 0.1937*gr_per_g + 0.0328))))
+        ip_sp = ip - ip_rp
+        df['IP RP'] = ip_rp
+        df['IP SP'] = ip_sp
+
+        fip_sp = np.where(ip_rp == 0, fip, np.where(ip_sp == 0, 0.0, array_util.safe_divide(ip*fip + 0.6*ip_rp, ip)))
+        fip_rp = np.where(ip_rp == 0, 0.0, np.where(ip_sp == 0, fip, fip_sp - 0.6))
+        df['FIP SP'] = fip_sp
+        df['FIP RP'] = fip_rp
+
+        no_svh_pip = df['No SVH P/IP'].to_numpy(dtype=float)
+        save = self.get_stat_array(df, 'SV')
+        hold = self.get_stat_array(df, 'HLD')
+        sp_pip = np.where(ip_sp == 0, 0.0, no_svh_pip - 1.3274*(fip_sp - fip))
+        role_no_svh_pip = no_svh_pip - 1.3274*(fip_rp - fip)
+        rp_pip = np.where(ip_rp == 0, 0.0, np.where(ip_sp == 0, df['P/IP'].to_numpy(dtype=float),
+                    array_util.safe_divide(role_no_svh_pip * ip_rp + 5.0*save + 4.0*hold, ip_rp)))
+        rp_no_svh_pip = np.where(ip_rp == 0, 0.0, np.where(ip_sp == 0, no_svh_pip, array_util.safe_divide(role_no_svh_pip * ip_rp, ip_rp)))
 
         if self.rank_basis == RankingBasis.PIP:
 
-            df['P/IP SP'] = df.apply(self.sp_pip_calc, axis=1)
-            df['P/IP RP'] = df.apply(self.rp_pip_calc, axis=1)
+            df['P/IP SP'] = sp_pip
+            df['P/IP RP'] = rp_pip
 
             df['No SVH P/IP SP'] = df['P/IP SP']
-            df['No SVH P/IP RP'] = df.apply(self.rp_no_svh_pip_calc, axis=1)
+            df['No SVH P/IP RP'] = rp_no_svh_pip
 
             if self.no_sv_hld:
                 df['Rank SP Rate'] = df['No SVH P/IP SP'].rank(ascending=False)
@@ -505,15 +619,15 @@ class ArmPoint():
                 df['Rank SP Rate'] = df['P/IP SP'].rank(ascending=False)
                 df['Rank RP Rate'] = df['P/IP RP'].rank(ascending=False)
 
-            df['SP Multiplier'] = df.apply(self.sp_multiplier_assignment, axis=1)
-            df['RP Multiplier'] = df.apply(self.rp_multiplier_assignment, axis=1)
+            df['SP Multiplier'] = self.role_multiplier_array(df['Rank SP Rate'], 6, 0.05)
+            df['RP Multiplier'] = self.role_multiplier_array(df['Rank RP Rate'], 5, 0.15)
         
         elif self.rank_basis == RankingBasis.PPG:
-            df['PPG SP'] = df.apply(self.sp_ppg_calc, axis=1)
-            df['PPG RP'] = df.apply(self.rp_ppg_calc, axis=1)
+            df['PPG SP'] = np.where(gs == 0, 0.0, array_util.safe_divide(sp_pip * ip_sp, gs))
+            df['PPG RP'] = np.where(g == gs, 0.0, array_util.safe_divide(rp_pip * ip_rp, gr))
 
             df['No SVH PPG SP'] = df['PPG SP']
-            df['No SVH PPG RP'] = df.apply(self.rp_no_svh_ppg_calc, axis=1)
+            df['No SVH PPG RP'] = np.where(g == gs, 0.0, array_util.safe_divide(rp_no_svh_pip * ip_rp, gr))
 
             if self.no_sv_hld:
                 df['Rank SP Rate'] = df['No SVH PPG SP'].rank(ascending=False)
@@ -528,22 +642,26 @@ class ArmPoint():
         self.max_rost_num['SP'] = len(df.loc[df[f'IP SP'] >= self.min_sp_ip])
         self.max_rost_num['RP'] = len(df.loc[df['IP RP'] >= self.min_rp_ip])
 
+    def role_multiplier_array(self, rank:pd.Series, full_teams:int, step:float) -> np.ndarray:
+        '''Column equivalent of sp_multiplier_assignment and rp_multiplier_assignment. The top num_teams*full_teams ranks have 100% of
+        their innings used and each num_teams after that has the ratio decreased by step to a minimum of 50%'''
+        rank = rank.to_numpy(dtype=float)
+        factor = (rank - full_teams * self.num_teams) // self.num_teams + 1
+        return np.where(rank <= full_teams * self.num_teams, 1.0, np.maximum(1 - factor * step, 0.5))
+
     def calc_par(self, df:DataFrame) -> DataFrame:
         '''Returns a populated DataFrame with all required PAR information for all players above the minimum IP at all positions.'''
-        df['Points'] = df.apply(self.calc_pitch_points, axis=1)
-        df['No SVH Points'] = df.apply(self.calc_pitch_points_no_svh, axis=1)
-
-        df['P/IP'] = df.apply(self.calc_ppi, axis=1)
-        df['No SVH P/IP'] = df.apply(self.calc_ppi_no_svh, axis=1)
-        if self.rank_basis == RankingBasis.PPG:
-            df['PPG'] = df.apply(self.calc_ppg, axis=1)
-            df['No SVH PPG'] = df.apply(self.calc_ppg_no_svh, axis=1)
+        with self.timer.stage('Pitcher points and rates', rows=len(df)):
+            self.calc_points_and_rates(df)
 
         #Filter to pitchers projected to a baseline amount of playing time
-        real_pitchers = df.loc[df.apply(self.not_a_belly_itcher_filter, axis=1)]
+        real_pitchers = df.loc[self.not_a_belly_itcher_mask(df)]
 
-        self.estimate_role_splits(real_pitchers)
+        with self.timer.stage('Pitcher role splits', rows=len(real_pitchers)):
+            self.estimate_role_splits(real_pitchers)
 
-        real_pitchers = self.get_pitcher_par(real_pitchers)
+        with self.timer.stage('Pitcher replacement search', rows=len(real_pitchers)) as timing:
+            real_pitchers = self.get_pitcher_par(real_pitchers)
+            timing.iterations = self.iterations
 
         return real_pitchers
\ No newline at end of file
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 from pandas import DataFrame
 import os
@@ -6,8 +7,11 @@ from copy import deepcopy
 import logging
 
 from domain.domain import ValueCalculation
-from domain.enum import RankingBasis, RepLevelScheme, CalculationDataType as CDT, Position
+from domain.enum import RankingBasis, RepLevelScheme, RepLevelSearch, CalculationDataType as CDT, Position
 from domain.exception import InputException
+from util import array_util, position_util
+from util.timing_util import StageTimer
+from value.rep_level_solver import BatRepLevelSolver, RankedRates, bisect_bracket
 
 pd.options.mode.chained_assignment = None # from https://stackoverflow.com/a/20627316
 
@@ -17,6 +21,8 @@ class BatPoint():
     default_surplus_pos = {"C":0,"1B":0,"2B":0,"3B":0,"SS":0,"OF":0,"Util":0}
     default_replacement_levels = {}
     max_rost_num = {}
+    #Positions moved together by the bisection search. C and Util are left alone, as in the stepwise search. SS is first since it caps 1B and OF.
+    threshold_positions = [Position.POS_SS, Position.POS_2B, Position.POS_3B, Position.POS_1B, Position.POS_OF]
 
     def __init__(self, value_calc:ValueCalculation, intermediate_calc=False, target_bat=244, max_pos_value=True):
         self.intermediate_calculations = intermediate_calc
@@ -31,6 +37,14 @@ class BatPoint():
         self.total_games = {}
         self.games_filled = {}
         self.target_games = value_calc.get_input(CDT.BATTER_G_TARGET)
+        self.ranked_rates = {}
+        self.ranked_rates_df = None
+        #If False, replacement_positions and replacement_levels are already solved and are used as-is
+        self.search = True
+        self.search_method = RepLevelSearch._value2member_map_[int(value_calc.get_input(CDT.REP_LEVEL_SEARCH, RepLevelSearch.HEURISTIC.value))]
+        #Number of passes made by the replacement level search
+        self.iterations = 0
+        self.timer = StageTimer()
         if intermediate_calc:
             self.dirname = os.path.abspath(os.path.join(os.path.dirname( __file__ ), '..'))
             self.intermed_subdirpath = os.path.join(self.dirname, 'data_dirs', 'intermediate')
@@ -54,66 +68,29 @@ class BatPoint():
             return 0
         return row['Points'] / row['PA']
 
+    def calc_points_and_rates(self, df:DataFrame) -> None:
+        '''Populates the Points, P/G, and P/PA columns for every hitter in-place using column operations. Results are identical
+        to calc_bat_points, calc_ppg, and calc_pppa applied row-wise, including a rate of 0 for players with no G or PA.'''
+        points = -1.0*df['AB'].to_numpy(dtype=float) + 5.6*df['H'].to_numpy(dtype=float) + 2.9*df['2B'].to_numpy(dtype=float) \
+            + 5.7*df['3B'].to_numpy(dtype=float) + 9.4*df['HR'].to_numpy(dtype=float) + 3.0*df['BB'].to_numpy(dtype=float) \
+            + 3.0*df['HBP'].to_numpy(dtype=float) + 1.9*df['SB'].to_numpy(dtype=float) - 2.8*df['CS'].to_numpy(dtype=float)
+        df['Points'] = points
+        df['P/G'] = array_util.safe_divide(points, df['G'])
+        df['P/PA'] = array_util.safe_divide(points, df['PA'])
+
     def rank_position_players(self, df:DataFrame) -> None:
         '''Ranks all players eligible at each discrete position according to the RankingBasis per the DataFrame columns'''
         for pos in Position.get_discrete_offensive_pos():
             col = f"Rank {pos.value} Rate"
             g_col = f"{pos.value} Games"
             df[g_col] = 0
-            if pos == Position.POS_UTIL:
-                df[col] = df[self.rank_basis].rank(ascending=False)
-                self.max_rost_num['Util'] = len(df)
-            else:
-                df[col] = df.loc[df['Position(s)'].str.contains(pos.value)][self.rank_basis].rank(ascending=False)
-                df[col].fillna(-999, inplace=True)
-                self.max_rost_num[pos.value] = len(df.loc[df['Position(s)'].str.contains(pos.value)])
+            eligible = position_util.is_eligible(df['Eligibility'], pos)
+            df[col] = df[self.rank_basis].where(eligible).rank(ascending=False).fillna(-999)
+            self.max_rost_num[pos.value] = int(eligible.sum())
         col = "Rank MI Rate"
-        df[col] = df.loc[df['Position(s)'].str.contains("2B|SS", case=False, regex=True)][self.rank_basis].rank(ascending=False)
-        df[col].fillna(-999, inplace=True)
+        df[col] = df[self.rank_basis].where(position_util.is_eligible(df['Eligibility'], Position.POS_MI)).rank(ascending=False).fillna(-999)
         df['MI Games'] = 0
     
-    def calc_total_games(self, df:DataFrame) -> None:
-        '''Calculates the total games above replacement level at each discrete offensive position per the DataFrame columns'''
-        for pos in Position.get_discrete_offensive_pos():
-            if pos == Position.OFFENSE:
-                continue
-            col = f"{pos.value} Games"
-            df[col] = df.apply(self.calc_pos_games, args=(pos,), axis=1)
-            self.total_games[pos.value] = df[col].sum()
-
-    def calc_pos_games(self, row, pos:Position) -> int:
-        '''Calculates all games at the input position filled above replacement level for the given replacement level values.
-        Eligible position with lowest replacement level gets all games for a given player.'''
-        if pos == Position.POS_MI:
-            if not row['Position(s)'].contains("2B|SS", case=False, regex=True):
-                return 0
-            if row['SS_PAR'] < 0 and row['2B_PAR'] < 0:
-                return 0
-        elif pos == Position.POS_UTIL:
-            if row['Util_PAR'] < 0:
-                return 0
-        else:
-            if not pos.value in row['Position(s)']:
-                return 0
-            if row[f'{pos.value}_PAR'] < 0:
-                return 0
-        if self.max_pos_value:
-            positions = row['Position(s)'].split("/")
-            min_rep_pos = ''
-            min_rep = 999
-            for player_pos in positions:
-                if player_pos == 'SP' or player_pos == 'RP': continue
-                if self.replacement_levels[player_pos] < min_rep:
-                    min_rep = self.replacement_levels[player_pos]
-                    min_rep_pos = player_pos
-            if min_rep_pos == pos.value:
-                return row['G']
-            else:
-                return 0
-        else:
-            #TODO: Finish this. this is tricky and involves splitting multi-position guys up
-            return 0
-
     def are_games_filled(self, num_teams:int=12) -> bool:
         '''Returns true if all positions have at least the minimum required games filled above replacement level for the league.'''
         filled_games = True
@@ -162,6 +139,8 @@ class BatPoint():
 
     def get_position_par(self, df:DataFrame) -> None:
         '''Determines all player PAR values and popluates them in-place in the DataFrame.'''
+        #Parse each Position(s) string once. Every eligibility filter from here on is a bit test.
+        df['Eligibility'] = position_util.get_position_masks(df['Position(s)'])
         self.rank_position_players(df)
 
         if self.intermediate_calculations:
@@ -177,16 +156,19 @@ class BatPoint():
                 self.get_par_from_rep_level(df, pos)
             df['Max PAR'] = df.apply(self.calc_max_par, axis=1)
         else:
-            for pos in Position.get_discrete_offensive_pos():
-                if self.replacement_positions[pos.value] > self.max_rost_num[pos.value]:
-                    self.replacement_positions[pos.value] = self.max_rost_num[pos.value]
-                self.get_position_par_calc(df, pos)
+            self.solver = BatRepLevelSolver(df, self.rank_basis)
+            if self.search:
+                for pos in Position.get_discrete_offensive_pos():
+                    if self.replacement_positions[pos.value] > self.max_rost_num[pos.value]:
+                        self.replacement_positions[pos.value] = self.max_rost_num[pos.value]
+                    self.set_solver_rep_level(pos)
 
-            if self.rep_level_scheme == RepLevelScheme.FILL_GAMES:
-                #Set maximum PAR value for each player to determine how many are rosterable
-                df['Max PAR'] = df.apply(self.calc_max_par, axis=1)
-                self.calc_total_games(df)
+            if not self.search:
+                logging.debug('Using provided replacement positions and levels without searching')
+            elif self.rep_level_scheme == RepLevelScheme.FILL_GAMES:
+                self.set_solver_total_games()
                 while not self.are_games_filled(self.num_teams):
+                    self.iterations += 1
                     max_rep_lvl = 0.0
                     for pos, rep_lvl in self.replacement_levels.items():
                         if pos == 'Util': continue
@@ -200,20 +182,23 @@ class BatPoint():
                                 max_rep_lvl = rep_lvl
                                 max_pos = pos
                     self.replacement_positions[max_pos] = self.replacement_positions[max_pos] + 1
-                    #Recalcluate PAR for the position given the new replacement level
-                    self.get_position_par_calc(df, Position._value2member_map_.get(max_pos))
-                    self.get_position_par_calc(df, Position.POS_UTIL)
-                    #Set maximum PAR value for each player to determine how many are rosterable
-                    df['Max PAR'] = df.apply(self.calc_max_par, axis=1)
-                    self.calc_total_games(df)
+                    #Recalcluate the replacement level for the position and Util given the new number rostered
+                    self.set_solver_rep_level(Position._value2member_map_.get(max_pos))
+                    self.set_solver_rep_level(Position.POS_UTIL)
+                    self.set_solver_total_games()
+                if self.max_pos_value:
+                    self.solver.populate_games(df, self.replacement_levels)
                 #Augment the replacement levels by the input surpluses to get the final numbers
                 for pos in self.replacement_positions:
                     self.replacement_positions[pos] = min(self.replacement_positions[pos] + self.surplus_pos[pos], self.max_rost_num[pos])
-                    self.get_position_par_calc(df, Position._value2member_map_.get(pos))
-                df['Max PAR'] = df.apply(self.calc_max_par, axis=1)
+                    self.set_solver_rep_level(Position._value2member_map_.get(pos))
+            elif self.rep_level_scheme == RepLevelScheme.TOTAL_ROSTERED and self.search_method == RepLevelSearch.BISECTION:
+                self.bisect_total_rostered()
             elif self.rep_level_scheme == RepLevelScheme.TOTAL_ROSTERED:
                 maxed_out = False
+                seen_states = set()
                 while num_bats != self.target_bat and not maxed_out:
+                    self.iterations += 1
                     if num_bats > self.target_bat:
                         #Too many players, find the current minimum replacement level and bump that replacement_position down by 1
                         min_rep_lvl = 999.9
@@ -223,8 +208,8 @@ class BatPoint():
                                 min_rep_lvl = rep_lvl
                                 min_pos = pos
                         self.replacement_positions[min_pos] = self.replacement_positions[min_pos]-1
-                        #Recalcluate PAR for the position given the new replacement level
-                        self.get_position_par_calc(df, min_pos)
+                        #Recalcluate the replacement level for the position given the new number rostered
+                        self.set_solver_rep_level(Position._value2member_map_.get(min_pos))
                     else:
                         #Too few players, find the current maximum replacement level and bump that replacement_position up by 1
                         max_rep_lvl = 0.0
@@ -242,30 +227,79 @@ class BatPoint():
                             maxed_out = True
                         else:
                             self.replacement_positions[max_pos] = self.replacement_positions[max_pos] + 1
-                            #Recalcluate PAR for the position given the new replacement level
-                            self.get_position_par_calc(df, max_pos)
-                            self.get_position_par_calc(df, 'Util')
-                    #Set maximum PAR value for each player to determine how many are rosterable
-                    df['Max PAR'] = df.apply(self.calc_max_par, axis=1)
+                            #Recalcluate the replacement level for the position and Util given the new number rostered
+                            self.set_solver_rep_level(Position._value2member_map_.get(max_pos))
+                            self.set_solver_rep_level(Position.POS_UTIL)
                     #FOM is how many bats with a non-negative max PAR
-                    num_bats = len(df.loc[df['Max PAR'] >= 0])
-            elif self.rep_level_scheme == RepLevelScheme.NUM_ROSTERED:
-                df['Max PAR'] = df.apply(self.calc_max_par, axis=1)
-            else:
+                    num_bats = self.solver.get_num_rostered(self.replacement_levels)
+                    state = tuple(self.replacement_positions.values())
+                    if state in seen_states:
+                        #Stepping one slot at a time can straddle the target when several players cross replacement level at once
+                        logging.warning(f'Hitter replacement search stopped cycling at {num_bats} rostered for a target of {self.target_bat}')
+                        break
+                    seen_states.add(state)
+            elif self.rep_level_scheme != RepLevelScheme.NUM_ROSTERED:
                 #shouldn't get here
                 logging.error(f'Inappropriate Replacement Level Scheme {self.rep_level_scheme}')
                 raise InputException(f"Inappropriate Replacement Level Scheme {self.rep_level_scheme}")
+            mi_rep_level = min(self.solver.get_rep_level(Position.POS_SS, self.replacement_positions['SS']), self.solver.get_rep_level(Position.POS_2B, self.replacement_positions['2B']))
+            self.solver.populate_par(df, self.replacement_levels, mi_rep_level)
+
+    def set_threshold_rep_levels(self, threshold:float) -> int:
+        '''Sets the number rostered at 1B, 2B, SS, 3B, and OF to the number of eligible players with a rate at or above the threshold, within
+        the same limits as the stepwise search, and sets the resulting replacement levels. C is left as-is. Returns the number of hitters with
+        a non-negative PAR, which never decreases as the threshold is lowered.'''
+        self.iterations += 1
+        for pos in self.threshold_positions:
+            num_rostered = self.solver.ranked_rates[pos.value].get_num_at_or_above(threshold)
+            if pos == Position.POS_1B:
+                num_rostered = min(num_rostered, int(1.5*self.replacement_positions['SS']) + 1)
+            elif pos == Position.POS_OF:
+                num_rostered = min(num_rostered, 3*self.replacement_positions['SS'] + 1)
+            self.replacement_positions[pos.value] = min(max(num_rostered, 1), self.max_rost_num[pos.value])
+            self.set_solver_rep_level(pos)
+        self.set_solver_rep_level(Position.POS_UTIL)
+        return self.solver.get_num_rostered(self.replacement_levels)
 
-    def get_position_par_calc(self, df:DataFrame, pos:Position) -> None:
-        '''Calculate the PAR for each player eligible at a position based on the current replacement level.'''
-        rep_level = self.get_position_rep_level(df, pos)
-        self.replacement_levels[pos.value] = rep_level
-        self.get_par_from_rep_level(df, pos)
+    def bisect_total_rostered(self) -> None:
+        '''Sets the number rostered and replacement levels at each position so that the total number of hitters with a non-negative PAR is as
+        close as possible to the target. Instead of stepping one position at a time, a common rate threshold for 1B, 2B, SS, 3B, and OF is
+        bisected over the distinct player rates, so the search takes O(log n) evaluations and always terminates.'''
+        rates = [self.solver.ranked_rates[pos.value].rates for pos in self.threshold_positions]
+        #Best first, so the number rostered never decreases with the index
+        thresholds = np.unique(np.concatenate(rates))[::-1]
+        idx = bisect_bracket(lambda i: self.set_threshold_rep_levels(thresholds[i]), 0, len(thresholds) - 1, self.target_bat)
+        num_bats = self.set_threshold_rep_levels(thresholds[idx])
+        if idx > 0 and num_bats != self.target_bat:
+            prev_num_bats = self.set_threshold_rep_levels(thresholds[idx - 1])
+            if abs(prev_num_bats - self.target_bat) > abs(num_bats - self.target_bat):
+                num_bats = self.set_threshold_rep_levels(thresholds[idx])
+        logging.debug(f'Hitter bisection found {num_bats} rostered for a target of {self.target_bat} after {self.iterations} evaluations')
+
+    def set_solver_rep_level(self, pos:Position) -> None:
+        '''Sets the replacement level for the position from the pre-sorted solver based on the current number rostered at the position.
+        Util replacement level is equal to the highest replacement level at any other position.'''
+        if pos == Position.POS_UTIL:
+            max_rep_lvl = 0.0
+            for p, rep_level in self.replacement_levels.items():
+                if p != 'Util' and rep_level > max_rep_lvl:
+                    max_rep_lvl = rep_level
+            self.replacement_levels[pos.value] = max_rep_lvl
+        else:
+            self.replacement_levels[pos.value] = self.solver.get_rep_level(pos, self.replacement_positions[pos.value])
+
+    def set_solver_total_games(self) -> None:
+        '''Sets the total games above replacement level at each discrete offensive position for the current replacement levels.'''
+        if self.max_pos_value:
+            self.total_games = self.solver.get_total_games(self.replacement_levels)
+        else:
+            #TODO: Finish this. this is tricky and involves splitting multi-position guys up
+            self.total_games = {pos.value : 0 for pos in Position.get_discrete_offensive_pos()}
 
     def calc_bat_par(self, row, rep_level:float, pos:Position) -> float:
         '''Calculates PAR for the given player at the input position with the provided replacement level. If the player is
         not eligible at the position, PAR set to -999.9'''
-        if pos.value in row['Position(s)'] or pos == Position.POS_UTIL or (pos.value == 'MI' and ('SS' in row['Position(s)'] or '2B' in row['Position(s)'])):
+        if row['Eligibility'] & position_util.POSITION_BITS[pos]:
             #Filter to the current position
             par_rate = row[self.rank_basis] - rep_level
             #Are we doing P/PA values, or P/G values
@@ -285,10 +319,7 @@ class BatPoint():
     def set_num_rostered_from_rep_level(self, df:DataFrame, pos:Position) -> None:
         '''Determines the number of players rostered above replacement level at the given position.'''
         #Filter DataFrame to just the position of interest
-        if pos != Position.POS_UTIL:
-            pos_df = df.loc[df['Position(s)'].str.contains(pos.value)]
-        else:
-            pos_df = df
+        pos_df = df.loc[position_util.is_eligible(df['Eligibility'], pos)]
         pos_df = pos_df.sort_values(self.rank_basis, ascending=False)
         #Determine the index of the last player above the replacement level for the position
         index = 0
@@ -303,20 +334,26 @@ class BatPoint():
     def get_par_from_rep_level(self, df:DataFrame, pos:Position) -> None:
         '''Calculates the current PAR for all players for the given position.'''
         col = pos.value + "_PAR"
-        df[col] = df.apply(self.calc_bat_par, args=(self.replacement_levels[pos.value], pos), axis=1)
+        df[col] = self.calc_bat_par_array(df, self.replacement_levels[pos.value], pos)
         if pos.value in ["SS", "2B"]:
             rep_level = min(self.get_position_rep_level(df, Position.POS_SS), self.get_position_rep_level(df, Position.POS_2B))
-            df['MI_PAR'] = df.apply(self.calc_bat_par, args=(rep_level, Position.POS_MI), axis=1)
+            df['MI_PAR'] = self.calc_bat_par_array(df, rep_level, Position.POS_MI)
+
+    def calc_bat_par_array(self, df:DataFrame, rep_level:float, pos:Position) -> np.ndarray:
+        '''Returns calc_bat_par for every player in the DataFrame using column operations.'''
+        if self.rank_basis == 'P/PA':
+            weight = df['PA'].to_numpy(dtype=float)
+        else:
+            weight = df['G'].to_numpy(dtype=float)
+        par = (df[self.rank_basis].to_numpy(dtype=float) - rep_level) * weight
+        return np.where(position_util.is_eligible(df['Eligibility'], pos), par, -999.9)
     
     def get_position_rep_level(self, df:DataFrame, pos:Position) -> float:
         '''Based on the number of players to roster above replacement level, return the corresponding replacment level
         required for it to be true.'''
         if pos != Position.POS_UTIL:
-            #Filter DataFrame to just the position of interest
-            pos_df = df.loc[df['Position(s)'].str.contains(pos.value)]
-            pos_df = pos_df.sort_values(self.rank_basis, ascending=False)
-            #Get the nth value (here the # of players rostered at the position) from the sorted data - 1 for the zero index
-            return pos_df.iloc[self.replacement_positions[pos.value]-1][self.rank_basis]
+            #Get the nth best value (here the # of players rostered at the position) from the position's pre-sorted rates
+            return self.get_ranked_rates(df, pos).get_rate(self.replacement_positions[pos.value])
         else:
             #Util replacement level is equal to the highest replacement level at any position
             pos_df = df
@@ -326,14 +363,25 @@ class BatPoint():
                     max_rep_lvl = rep_level
             return max_rep_lvl
 
+    def get_ranked_rates(self, df:DataFrame, pos:Position) -> RankedRates:
+        '''Returns the sorted rates of the players in the DataFrame eligible at the position. Rates are sorted on the first request for a
+        DataFrame and reused for every later replacement level lookup on it.'''
+        if self.ranked_rates_df is not df:
+            self.ranked_rates = {}
+            self.ranked_rates_df = df
+        if pos.value not in self.ranked_rates:
+            self.ranked_rates[pos.value] = RankedRates(df[self.rank_basis], position_util.is_eligible(df['Eligibility'], pos))
+        return self.ranked_rates[pos.value]
+
     def calc_par(self, pos_proj: DataFrame, min_pa:int) -> DataFrame:
         '''Returns a populated DataFrame with all required PAR information for all players above the minimum PA at all positions.'''
-        pos_proj['Points'] = pos_proj.apply(self.calc_bat_points, axis=1)
-        pos_proj['P/G'] = pos_proj.apply(self.calc_ppg, axis=1)
-        pos_proj['P/PA'] = pos_proj.apply(self.calc_pppa, axis=1)
+        with self.timer.stage('Hitter points and rates', rows=len(pos_proj)):
+            self.calc_points_and_rates(pos_proj)
 
         #Filter to players projected to a baseline amount of playing time
         pos_min_pa = pos_proj.loc[pos_proj['PA'] >= min_pa]
 
-        self.get_position_par(pos_min_pa)
+        with self.timer.stage('Hitter replacement search', rows=len(pos_min_pa)) as timing:
+            self.get_position_par(pos_min_pa)
+            timing.iterations = self.iterations
         return pos_min_pa
@@ -0,0 +1,8 @@
+'''Entry points for running PAR calculations in worker processes. Kept free of service imports so a spawned worker can import it without
+loading the rest of the application.'''
+
+def calc_par(points, *args):
+    '''Runs calc_par for a BatPoint or ArmPoint and returns the calculator along with the resulting DataFrame. Both are picklable, and the
+    returned calculator carries the final replacement levels back to the parent process.'''
+    result = points.calc_par(*args)
+    return points, result
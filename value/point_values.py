@@ -1,13 +1,20 @@
 import logging
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
+from pandas import DataFrame
 import os
 from os import path
+from typing import Tuple
 import value.bat_points
 import value.arm_points
+from value import par_worker
 
 from services import projection_services, calculation_services
 from domain.domain import ValueCalculation
 from domain.enum import CalculationDataType, Position, RepLevelScheme, ScoringFormat
+from util import position_util
+from util.timing_util import StageTimer
 
 pd.options.mode.chained_assignment = None # from https://stackoverflow.com/a/20627316
 
@@ -22,13 +29,21 @@ class PointValues():
     replacement_levels = {}
 
     def __init__(self, value_calc:ValueCalculation, debug=False, rostered_hitters=244, rostered_pitchers=196,
-                    rp_limit=999):
+                    rp_limit=999, parallel=False, projs=None, previous=None):
         self.intermediate_calculations = debug
+        self.parallel = parallel
+        #Projection DataFrames already loaded for the calculation's projection, if any
+        self.projs = projs
+        #Previously calculated ValueCalculation whose replacement levels are reused if only dollar inputs changed, if any
+        self.previous = previous
+        #True if the previous calculation's replacement levels were used in place of a search
+        self.reused_previous = False
         self.target_bat = rostered_hitters
         self.target_pitch = rostered_pitchers
         self.rp_limit = rp_limit
         self.SABR = ScoringFormat.is_sabr(value_calc.format)
         self.value_calc = value_calc
+        self.timer = StageTimer()
 
         #Initialize directory for intermediate calc files if required
         self.dirname = os.path.abspath(os.path.join(os.path.dirname( __file__ ), '..'))
@@ -39,9 +54,20 @@ class PointValues():
         if not path.exists(self.intermed_subdirpath):
             os.mkdir(self.intermed_subdirpath)
 
+    def update_progress(self, progress, task_title:str, increment:int) -> None:
+        '''Sets the task title and increments the completion percent of the progress dialog, if there is one.'''
+        if progress is not None:
+            progress.set_task_title(task_title)
+            progress.increment_completion_percent(increment)
+
     def calculate_values(self, progress=None) -> None:
         '''Sets up and performs the player value calculations inplace for the passed ValueCalculation'''
-        projs = projection_services.convert_to_df(self.value_calc.projection)
+        with self.timer.stage('Projection load') as timing:
+            if self.projs is not None:
+                projs = self.projs
+            else:
+                projs = projection_services.convert_to_df(self.value_calc.projection)
+            timing.rows = len(projs[0]) + len(projs[1])
         self.pos_proj = projs[0]
         self.pitch_proj = projs[1]
         rep_level_scheme = RepLevelScheme._value2member_map_[int(self.value_calc.get_input(CalculationDataType.REP_LEVEL_SCHEME))]
@@ -50,6 +76,85 @@ class PointValues():
         num_teams = int(self.value_calc.get_input(CalculationDataType.NUM_TEAMS))
         sabr = self.value_calc.format == ScoringFormat.SABR_POINTS or self.value_calc.format == ScoringFormat.H2H_SABR_POINTS
         non_prod_salary = self.value_calc.get_input(CalculationDataType.NON_PRODUCTIVE_DOLLARS)
+        pos_points, pitch_points = self.get_point_calculators()
+        min_pa = self.value_calc.get_input(CalculationDataType.PA_TO_RANK)
+
+        self.update_progress(progress, 'Calculating Batters', 10)
+        if self.parallel:
+            #Hitters and pitchers share no state until $/PAR, so each runs in its own process. Results are collected hitters first
+            #regardless of which finishes first so the merge and progress updates happen in the same order as a serial run.
+            with self.timer.stage('Parallel PAR', rows=len(self.pos_proj) + len(self.pitch_proj)), ProcessPoolExecutor(max_workers=2) as executor:
+                bat_future = executor.submit(par_worker.calc_par, pos_points, self.pos_proj, min_pa)
+                arm_future = executor.submit(par_worker.calc_par, pitch_points, self.pitch_proj)
+                pos_points, pos_min_pa = bat_future.result()
+                self.update_progress(progress, 'Calculating pitchers', 40)
+                pitch_points, real_pitchers = arm_future.result()
+        else:
+            pos_min_pa = pos_points.calc_par(self.pos_proj, min_pa)
+            self.update_progress(progress, 'Calculating pitchers', 40)
+            real_pitchers = pitch_points.calc_par(self.pitch_proj)
+        #The calculators' own stages are timed where they ran, which is in the worker processes for a parallel calculation
+        self.timer.extend(pos_points.timer)
+        self.timer.extend(pitch_points.timer)
+
+        #TODO: write replacement level info to ValueCalculation.data
+        for pos in Position.get_discrete_offensive_pos():
+            self.value_calc.set_output(CalculationDataType.pos_to_rep_level().get(pos), pos_points.replacement_levels[pos.value])
+            self.value_calc.set_output(CalculationDataType.pos_to_num_rostered().get(pos), pos_points.replacement_positions[pos.value])
+        for pos in Position.get_discrete_pitching_pos():
+            self.value_calc.set_output(CalculationDataType.pos_to_rep_level().get(pos), pitch_points.replacement_levels[pos.value])
+            self.value_calc.set_output(CalculationDataType.pos_to_num_rostered().get(pos), pitch_points.replacement_positions[pos.value])
+
+        self.update_progress(progress, 'Calculating $/PAR and applying', 30)
+        with self.timer.stage('Dollar values', rows=len(pos_min_pa) + len(real_pitchers)):
+            rosterable_pos = pos_min_pa.loc[pos_min_pa['Max PAR'] >= 0]
+            rosterable_pitch = real_pitchers.loc[real_pitchers['PAR'] >= 0]
+
+            bat_par = rosterable_pos['Max PAR'].sum()
+            total_par = bat_par + rosterable_pitch['PAR'].sum()
+            arm_par = (rosterable_pitch['PAR SP'] * rosterable_pitch['SP Multiplier']).sum() + (rosterable_pitch['PAR RP'] * rosterable_pitch['RP Multiplier']).sum()
+            total_usable_par = bat_par + arm_par
+            total_players = len(rosterable_pos) + len(rosterable_pitch)
+            self.value_calc.set_output(CalculationDataType.TOTAL_HITTERS_ROSTERED, len(rosterable_pos))
+            self.value_calc.set_output(CalculationDataType.TOTAL_PITCHERS_ROSTERED, len(rosterable_pitch))
+
+            dollars = 400*num_teams
+            dollars -= non_prod_salary
+            dollars -= num_teams*40 #remove a dollar per player at or above replacement
+            self.dol_per_par = dollars / total_usable_par
+
+            self.value_calc.set_output(CalculationDataType.TOTAL_GAMES_PLAYED, rosterable_pos['G'].sum())
+            self.value_calc.set_output(CalculationDataType.TOTAL_INNINGS_PITCHED, rosterable_pitch['IP'].sum())
+            self.value_calc.set_output(CalculationDataType.TOTAL_FOM_ABOVE_REPLACEMENT, total_usable_par)
+            self.value_calc.set_output(CalculationDataType.DOLLARS_PER_FOM, self.dol_per_par)
+
+            if self.value_calc.get_input(CalculationDataType.HITTER_SPLIT) is not None:
+                bat_dollars = dollars * self.value_calc.get_input(CalculationDataType.HITTER_SPLIT) / 100
+                arm_dollars = dollars - bat_dollars
+                self.bat_dol_per_par = bat_dollars / bat_par
+                self.arm_dol_per_par = arm_dollars / arm_par
+                self.value_calc.set_output(CalculationDataType.HITTER_DOLLAR_PER_FOM, self.bat_dol_per_par)
+                self.value_calc.set_output(CalculationDataType.PITCHER_DOLLAR_PER_FOM, self.arm_dol_per_par)
+            else:
+                self.bat_dol_per_par = 0
+                self.arm_dol_per_par = 0
+
+            player_ids, positions, values = self.get_player_value_arrays(pos_min_pa, real_pitchers)
+            self.value_calc.values = []
+            self.value_calc.set_player_values(player_ids, positions, values)
+
+        if self.intermediate_calculations:
+            pos_min_pa['Value'] = self.get_dollar_values(pos_min_pa['Max PAR'], self.get_bat_dol_per_par())
+            real_pitchers['Value'] = self.get_dollar_values(real_pitchers['PAR'], self.get_arm_dol_per_par())
+            filepath = os.path.join(self.intermed_subdirpath, f"pos_value_detail.csv")
+            pos_min_pa.sort_values('Max PAR').to_csv(filepath, encoding='utf-8-sig')
+            filepath = os.path.join(self.intermed_subdirpath, f"pitch_value_detail.csv")
+            real_pitchers.sort_values('PAR').to_csv(filepath, encoding='utf-8-sig')
+
+    def get_point_calculators(self) -> Tuple[value.bat_points.BatPoint, value.arm_points.ArmPoint]:
+        '''Returns the hitter and pitcher PAR calculators for the ValueCalculation, with their replacement level inputs set for the
+        replacement level scheme and any previous calculation.'''
+        rep_level_scheme = RepLevelScheme._value2member_map_[int(self.value_calc.get_input(CalculationDataType.REP_LEVEL_SCHEME))]
         rep_nums = None
         rep_levels = None
         surplus_pos = None
@@ -59,12 +164,19 @@ class PointValues():
             rep_levels = calculation_services.get_rep_levels(self.value_calc)
         elif rep_level_scheme == RepLevelScheme.FILL_GAMES:
             surplus_pos = calculation_services.get_num_rostered_rep_levels(self.value_calc)
+        search = True
+        if self.previous is not None and (rep_level_scheme == RepLevelScheme.FILL_GAMES or rep_level_scheme == RepLevelScheme.TOTAL_ROSTERED):
+            solved_nums = calculation_services.get_solved_num_rostered(self.previous)
+            solved_levels = calculation_services.get_solved_rep_levels(self.previous)
+            #Only dollar inputs changed, so the previous solution is the solution. Any other change runs the full search from the defaults,
+            #since a search started from the previous solution can settle on a different one than a full search.
+            if solved_nums is not None and solved_levels is not None and calculation_services.is_dollar_reallocation(self.previous, self.value_calc):
+                logging.info('Reusing previous replacement levels')
+                rep_nums = solved_nums
+                rep_levels = solved_levels
+                search = False
+                self.reused_previous = True
         logging.debug(f'rep_level_scheme = {rep_level_scheme.value}')
-        min_sp_ip = self.value_calc.get_input(CalculationDataType.SP_IP_TO_RANK)
-        min_rp_ip = self.value_calc.get_input(CalculationDataType.RP_IP_TO_RANK)
-        
-        progress.set_task_title('Calculating Batters')
-        progress.increment_completion_percent(10)
 
         pos_points = value.bat_points.BatPoint(
             self.value_calc,
@@ -76,10 +188,8 @@ class PointValues():
             pos_points.replacement_levels = rep_levels
         if surplus_pos is not None:
             pos_points.surplus_pos = surplus_pos
-        pos_min_pa = pos_points.calc_par(self.pos_proj, self.value_calc.get_input(CalculationDataType.PA_TO_RANK))
+        pos_points.search = search
 
-        progress.set_task_title('Calculating pitchers')
-        progress.increment_completion_percent(40)
         #TODO Might need to add usable RP innings as argument
         pitch_points = value.arm_points.ArmPoint(
             self.value_calc,
@@ -91,129 +201,59 @@ class PointValues():
             pitch_points.replacement_levels = rep_levels
         if surplus_pos is not None:
             pitch_points.surplus_pos = surplus_pos
-            
-        real_pitchers = pitch_points.calc_par(self.pitch_proj)
+        pitch_points.search = search
+        return pos_points, pitch_points
 
-        #TODO: write replacement level info to ValueCalculation.data
-        for pos in Position.get_discrete_offensive_pos():
-            self.value_calc.set_output(CalculationDataType.pos_to_rep_level().get(pos), pos_points.replacement_levels[pos.value])
-            self.value_calc.set_output(CalculationDataType.pos_to_num_rostered().get(pos), pos_points.replacement_positions[pos.value])
-        for pos in Position.get_discrete_pitching_pos():
-            self.value_calc.set_output(CalculationDataType.pos_to_rep_level().get(pos), pitch_points.replacement_levels[pos.value])
-            self.value_calc.set_output(CalculationDataType.pos_to_num_rostered().get(pos), pitch_points.replacement_positions[pos.value])
+    def get_bat_dol_per_par(self) -> float:
+        '''Returns the $/PAR for hitters, which is the hitter-specific rate if the dollars are split and the overall rate otherwise.'''
+        if self.bat_dol_per_par > 0:
+            return self.bat_dol_per_par
+        return self.dol_per_par
 
-        progress.set_task_title('Calculating $/PAR and applying')
-        progress.increment_completion_percent(30)
-        rosterable_pos = pos_min_pa.loc[pos_min_pa['Max PAR'] >= 0]
-        rosterable_pitch = real_pitchers.loc[real_pitchers['PAR'] >= 0]
-
-        bat_par = rosterable_pos['Max PAR'].sum()
-        total_par = bat_par + rosterable_pitch['PAR'].sum()
-        arm_par = rosterable_pitch.apply(pitch_points.usable_par_calc, args=('SP',), axis=1).sum() + rosterable_pitch.apply(pitch_points.usable_par_calc, args=('RP',), axis=1).sum()
-        total_usable_par = bat_par + arm_par
-        total_players = len(rosterable_pos) + len(rosterable_pitch)
-        self.value_calc.set_output(CalculationDataType.TOTAL_HITTERS_ROSTERED, len(rosterable_pos))
-        self.value_calc.set_output(CalculationDataType.TOTAL_PITCHERS_ROSTERED, len(rosterable_pitch))
-
-        dollars = 400*num_teams
-        dollars -= non_prod_salary
-        dollars -= num_teams*40 #remove a dollar per player at or above replacement
-        self.dol_per_par = dollars / total_usable_par
-
-        self.value_calc.set_output(CalculationDataType.TOTAL_GAMES_PLAYED, rosterable_pos['G'].sum())
-        self.value_calc.set_output(CalculationDataType.TOTAL_INNINGS_PITCHED, rosterable_pitch['IP'].sum())
-        self.value_calc.set_output(CalculationDataType.TOTAL_FOM_ABOVE_REPLACEMENT, total_usable_par)
-        self.value_calc.set_output(CalculationDataType.DOLLARS_PER_FOM, self.dol_per_par)
-
-        if self.value_calc.get_input(CalculationDataType.HITTER_SPLIT) is not None:
-            bat_dollars = dollars * self.value_calc.get_input(CalculationDataType.HITTER_SPLIT) / 100
-            arm_dollars = dollars - bat_dollars
-            self.bat_dol_per_par = bat_dollars / bat_par
-            self.arm_dol_per_par = arm_dollars / arm_par
-            self.value_calc.set_output(CalculationDataType.HITTER_DOLLAR_PER_FOM, self.bat_dol_per_par)
-            self.value_calc.set_output(CalculationDataType.PITCHER_DOLLAR_PER_FOM, self.arm_dol_per_par)
-        else:
-            self.bat_dol_per_par = 0
-            self.arm_dol_per_par = 0
+    def get_arm_dol_per_par(self) -> float:
+        '''Returns the $/PAR for pitchers, which is the pitcher-specific rate if the dollars are split and the overall rate otherwise.'''
+        if self.arm_dol_per_par > 0:
+            return self.arm_dol_per_par
+        return self.dol_per_par
 
-        self.value_calc.values = [] 
+    def get_dollar_values(self, par, dol_per_par:float) -> np.ndarray:
+        '''Returns the dollar value for each PAR. Players at or above replacement level are worth $1 plus their PAR at the $/PAR rate,
+        and everyone else is worth $0.'''
+        par = np.asarray(par, dtype=float)
+        return np.where(par >= 0, par * dol_per_par + 1.0, 0)
 
-        for pos in self.bat_pos:
-            if pos == 'MI':
-                pos_value = pd.DataFrame(pos_min_pa.loc[pos_min_pa['Position(s)'].str.contains("2B|SS", case=False, regex=True)])
-            elif pos == 'Util':
-                pos_value = pd.DataFrame(pos_min_pa)
-            else:
-                pos_value = pd.DataFrame(pos_min_pa.loc[pos_min_pa['Position(s)'].str.contains(pos)])
-            if self.bat_dol_per_par > 0:
-                pos_value['Value'] = pos_value[f'{pos}_PAR'].apply(lambda x: x*self.bat_dol_per_par + 1.0 if x >= 0 else 0)
-            else:
-                pos_value['Value'] = pos_value[f'{pos}_PAR'].apply(lambda x: x*self.dol_per_par + 1.0 if x >= 0 else 0)
-            pos_value.sort_values(by=['Value','P/G'], inplace=True, ascending=[False,False])
-            pos_value['Dol_Value'] = pos_value['Value'].apply(lambda x : "${:.0f}".format(x))
-            if self.value_calc is None:
-                pos_value = pos_value[['OttoneuID', 'Dol_Value', 'Name','Team','Position(s)','Points',f'{pos}_PAR','P/G']]
-                pos_value.to_csv(f"C:\\Users\\adam.scharf\\Documents\\Personal\\FFB\\Staging\\{pos}_values.csv", encoding='utf-8-sig')
-            else:
-                for index, row in pos_value.iterrows():
-                    self.value_calc.set_player_value(index, Position._value2member_map_[pos], row['Value'])
-        if self.bat_dol_per_par > 0:
-            pos_min_pa['Value'] = pos_min_pa['Max PAR'].apply(lambda x: x*self.bat_dol_per_par + 1.0 if x >= 0 else 0)
-        else:
-            pos_min_pa['Value'] = pos_min_pa['Max PAR'].apply(lambda x: x*self.dol_per_par + 1.0 if x >= 0 else 0)
-        pos_min_pa.sort_values('Max PAR', inplace=True)
+    def get_player_value_arrays(self, pos_min_pa:DataFrame, real_pitchers:DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        '''Returns the player ids, Positions, and dollar values of every player value for the calculation as three aligned arrays. Each
+        player has a value at every position they are eligible for, Offense and/or Pitcher, and Overall, which is the sum of the two for
+        two-way players.'''
+        bat_dol_per_par = self.get_bat_dol_per_par()
+        arm_dol_per_par = self.get_arm_dol_per_par()
+        player_ids = []
+        positions = []
+        values = []
 
-        for pos in self.pitch_pos:
-            pos_value = pd.DataFrame(real_pitchers.loc[real_pitchers[f'IP {pos}'] > 0])
-            if self.arm_dol_per_par > 0:
-                pos_value['Value'] = pos_value[f'PAR {pos}'].apply(lambda x: x*self.arm_dol_per_par + 1.0 if x >= 0 else 0)
-            else:
-                pos_value['Value'] = pos_value[f'PAR {pos}'].apply(lambda x: x*self.dol_per_par + 1.0 if x >= 0 else 0)
-            pos_value.sort_values(by=['Value','P/IP'], inplace=True, ascending=[False,False])
-            pos_value['Dol_Value'] = pos_value['Value'].apply(lambda x : "${:.0f}".format(x))
-            
-            if self.value_calc is None:
-                pos_value = pos_value[['OttoneuID', 'Dol_Value', 'Name','Team','Position(s)','Points',f'PAR {pos}','P/IP']]
-                pos_value.to_csv(f"C:\\Users\\adam.scharf\\Documents\\Personal\\FFB\\Staging\\{pos}_values.csv", encoding='utf-8-sig')
-            else:
-                for index, row in pos_value.iterrows():
-                    self.value_calc.set_player_value(index, Position._value2member_map_[pos], row['Value'])
-        if self.arm_dol_per_par > 0:
-            real_pitchers['Value'] = real_pitchers['PAR'].apply(lambda x: x*self.arm_dol_per_par + 1.0 if x >= 0 else 0)
-        else:
-            real_pitchers['Value'] = real_pitchers['PAR'].apply(lambda x: x*self.dol_per_par + 1.0 if x >= 0 else 0)
-        real_pitchers.sort_values('PAR', inplace=True)
+        #Every (player, position) pair the player is eligible for, across all positions at once
+        bat_positions = [Position._value2member_map_[pos] for pos in self.bat_pos]
+        bat_par = pos_min_pa[[f'{pos}_PAR' for pos in self.bat_pos]].to_numpy(dtype=float)
+        masks = pos_min_pa['Eligibility'].to_numpy()
+        rows, cols = np.nonzero(np.column_stack([position_util.is_eligible(masks, pos) for pos in bat_positions]))
+        player_ids.append(pos_min_pa.index.to_numpy()[rows])
+        positions.append(np.array(bat_positions, dtype=object)[cols])
+        values.append(self.get_dollar_values(bat_par[rows, cols], bat_dol_per_par))
 
-        if self.intermediate_calculations:
-            filepath = os.path.join(self.intermed_subdirpath, f"pos_value_detail.csv")
-            pos_min_pa.to_csv(filepath, encoding='utf-8-sig')
-            filepath = os.path.join(self.intermed_subdirpath, f"pitch_value_detail.csv")
-            real_pitchers.to_csv(filepath, encoding='utf-8-sig')
-        
-        pos_min_pa.rename(columns={'Max PAR':'PAR'}, inplace=True)
-        for index, row in pos_min_pa.iterrows():
-            self.value_calc.set_player_value(index, Position.OFFENSE, row['Value'])
-
-        pitch_results = real_pitchers
-        for index, row in pitch_results.iterrows():
-            self.value_calc.set_player_value(index, Position.PITCHER, row['Value'])
-
-        pos_index = pos_min_pa.index
-        pitch_index = pitch_results.index
-        intersect = pos_index.intersection(pitch_index)
-
-        results = pos_min_pa
-        results['P/IP'] = 0
-        pitch_results['P/G'] = 0
-        for index in intersect:
-            results.loc[index, 'Value'] = results.loc[index]['Value'] + pitch_results.loc[index]['Value']
-            results.loc[index, 'Points'] = results.loc[index]['Points'] + pitch_results.loc[index]['Points']
-            results.loc[index, 'PAR'] = results.loc[index]['PAR'] + pitch_results.loc[index]['PAR']
-            results.loc[index, 'P/IP'] = pitch_results.loc[index]['P/IP']
-            pitch_results = pitch_results.drop(index=index)
-
-        results = results.append(pitch_results)
-        results['Dol_Value'] = results['Value'].apply(lambda x : "${:.0f}".format(x))
-        
-        for index, row in results.iterrows():
-            self.value_calc.set_player_value(index, Position.OVERALL, row['Value'])
+        pitch_positions = [Position._value2member_map_[pos] for pos in self.pitch_pos]
+        pitch_par = real_pitchers[[f'PAR {pos}' for pos in self.pitch_pos]].to_numpy(dtype=float)
+        rows, cols = np.nonzero(real_pitchers[[f'IP {pos}' for pos in self.pitch_pos]].to_numpy(dtype=float) > 0)
+        player_ids.append(real_pitchers.index.to_numpy()[rows])
+        positions.append(np.array(pitch_positions, dtype=object)[cols])
+        values.append(self.get_dollar_values(pitch_par[rows, cols], arm_dol_per_par))
+
+        offense = pd.Series(self.get_dollar_values(pos_min_pa['Max PAR'], bat_dol_per_par), index=pos_min_pa.index)
+        pitcher = pd.Series(self.get_dollar_values(real_pitchers['PAR'], arm_dol_per_par), index=real_pitchers.index)
+        overall = offense.add(pitcher, fill_value=0)
+        for pos, pos_values in [(Position.OFFENSE, offense), (Position.PITCHER, pitcher), (Position.OVERALL, overall)]:
+            player_ids.append(pos_values.index.to_numpy())
+            positions.append(np.full(len(pos_values), pos, dtype=object))
+            values.append(pos_values.to_numpy(dtype=float))
+
+        return np.concatenate(player_ids), np.concatenate(positions), np.concatenate(values)
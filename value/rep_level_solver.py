@@ -0,0 +1,226 @@
+import numpy as np
+from pandas import DataFrame
+from typing import Callable, Dict, List, Tuple
+
+from domain.enum import Position, RankingBasis
+from util import position_util
+
+class RankedRates():
+    '''The rates of the players eligible at a position, sorted best first once on creation so that the k-th best rate, the replacement
+    level for k rostered, is an array lookup for every iteration of a replacement level search.'''
+
+    def __init__(self, rate:np.ndarray, eligible:np.ndarray=None):
+        rate = np.asarray(rate, dtype=float)
+        if eligible is not None:
+            rate = rate[np.asarray(eligible, dtype=bool)]
+        self.rates = np.sort(rate)[::-1]
+
+    def __len__(self) -> int:
+        return len(self.rates)
+
+    def get_rate(self, k:int) -> float:
+        '''Returns the k-th best rate, where k=1 is the best.'''
+        return self.rates[int(k) - 1]
+
+    def get_num_at_or_above(self, rate:float) -> int:
+        '''Returns the number of rates at or above the rate.'''
+        return int(np.searchsorted(-self.rates, -rate, side='right'))
+
+def bisect_bracket(func:Callable[[int], float], low:int, high:int, target:float) -> int:
+    '''Returns the smallest k in [low, high] with func(k) at or above the target, or high if there is none, for a func that is non-decreasing
+    in k. Takes O(log(high - low)) evaluations of func. The answer is closest to the target either at the returned k or at k - 1, so
+    callers compare the two.'''
+    if func(high) < target:
+        return high
+    while low < high:
+        mid = (low + high) // 2
+        if func(mid) >= target:
+            high = mid
+        else:
+            low = mid + 1
+    return low
+
+class RankedTotals():
+    '''Totals of one or more per-player quantities for the players whose PAR is non-negative at a replacement level. Players with playing
+    time are sorted by rate once and the quantities are kept as suffix sums over that order, so a query is a single binary search. Players
+    with no playing time always have a PAR of 0, which is rosterable, and are added to every query.'''
+
+    def __init__(self, rate:np.ndarray, weight:np.ndarray, quantities:np.ndarray):
+        ranked = weight > 0
+        order = np.argsort(rate[ranked], kind='stable')
+        self.rates = rate[ranked][order]
+        self.suffix = np.vstack([np.cumsum(quantities[ranked][order][::-1], axis=0)[::-1], np.zeros(quantities.shape[1])])
+        self.always = np.sum(quantities[~ranked], axis=0)
+
+    def get_totals(self, rep_level:float) -> np.ndarray:
+        '''Returns the totals of each quantity for players at or above the replacement level.'''
+        return self.suffix[int(np.searchsorted(self.rates, rep_level, side='left'))] + self.always
+
+class PositionGroup():
+    '''Hitters that share the same Position(s) string, with the number of players and games at or above a replacement level available
+    from a binary search.'''
+
+    def __init__(self, pos_str:str, mask:int, rate:np.ndarray, weight:np.ndarray, games:np.ndarray):
+        self.pos_str = pos_str
+        #Tokens used to determine which eligible position has the lowest replacement level
+        self.tokens = [p for p in pos_str.split('/') if p != 'SP' and p != 'RP']
+        #Positions whose PAR counts towards Max PAR
+        self.par_positions = [pos.value for pos in Position.get_discrete_offensive_pos() if mask & position_util.POSITION_BITS[pos]]
+        self.totals = RankedTotals(rate, weight, np.column_stack([np.ones(len(rate)), games]))
+
+    def get_num_at_or_above(self, rep_level:float) -> int:
+        '''Returns the number of players in the group whose PAR is non-negative at the given replacement level.'''
+        return int(self.totals.get_totals(rep_level)[0])
+
+    def get_games_at_or_above(self, rep_level:float) -> float:
+        '''Returns the games played by players in the group whose PAR is non-negative at the given replacement level.'''
+        return self.totals.get_totals(rep_level)[1]
+
+    def get_min_rep_pos(self, replacement_levels:Dict[str, float]) -> str:
+        '''Returns the eligible position with the lowest replacement level, which is where the group's games are counted.'''
+        min_rep_pos = ''
+        min_rep = 999
+        for pos in self.tokens:
+            if replacement_levels[pos] < min_rep:
+                min_rep = replacement_levels[pos]
+                min_rep_pos = pos
+        return min_rep_pos
+
+class BatRepLevelSolver():
+    '''Answers the replacement level, games filled, and total rostered questions asked on every iteration of the hitter replacement level
+    search without re-sorting or re-applying over the DataFrame. Each position's rate column is sorted once on creation, so moving a
+    replacement level is a constant time lookup and games/rostered totals cost one binary search per distinct Position(s) string. PAR
+    columns are only written to the DataFrame once the search is complete.'''
+
+    def __init__(self, df:DataFrame, rank_basis:str):
+        self.rate = df[rank_basis].to_numpy(dtype=float)
+        if rank_basis == 'P/PA':
+            self.weight = df['PA'].to_numpy(dtype=float)
+        else:
+            self.weight = df['G'].to_numpy(dtype=float)
+        self.games = df['G'].to_numpy(dtype=float)
+        pos_strs = df['Position(s)'].astype(str).to_numpy()
+        masks = df['Eligibility'].to_numpy()
+
+        self.eligible = {}
+        self.ranked_rates:Dict[str, RankedRates] = {}
+        for pos in Position.get_discrete_offensive_pos():
+            self.eligible[pos.value] = position_util.is_eligible(masks, pos)
+            self.ranked_rates[pos.value] = RankedRates(self.rate, self.eligible[pos.value])
+        self.eligible[Position.POS_MI.value] = position_util.is_eligible(masks, Position.POS_MI)
+
+        unique_strs, self.group_index = np.unique(pos_strs, return_inverse=True)
+        self.groups:List[PositionGroup] = []
+        for idx, pos_str in enumerate(unique_strs):
+            members = self.group_index == idx
+            self.groups.append(PositionGroup(pos_str, masks[members][0], self.rate[members], self.weight[members], self.games[members]))
+
+    def get_rep_level(self, pos:Position, num_rostered:int) -> float:
+        '''Returns the rate of the num_rostered-th best player eligible at the position.'''
+        return self.ranked_rates[pos.value].get_rate(num_rostered)
+
+    def get_total_games(self, replacement_levels:Dict[str, float]) -> Dict[str, float]:
+        '''Returns the games filled above replacement level at each discrete offensive position. Each player's games are assigned to
+        their eligible position with the lowest replacement level.'''
+        total_games = {pos.value : 0.0 for pos in Position.get_discrete_offensive_pos()}
+        for group in self.groups:
+            pos = group.get_min_rep_pos(replacement_levels)
+            if pos in total_games:
+                total_games[pos] += group.get_games_at_or_above(replacement_levels[pos])
+        return total_games
+
+    def get_num_rostered(self, replacement_levels:Dict[str, float]) -> int:
+        '''Returns the number of hitters with a non-negative PAR at any position.'''
+        num_rostered = 0
+        for group in self.groups:
+            rep_level = min([replacement_levels[pos] for pos in group.par_positions])
+            num_rostered += group.get_num_at_or_above(rep_level)
+        return num_rostered
+
+    def calc_par(self, rep_level:float, pos:Position) -> np.ndarray:
+        '''Returns the PAR for each player at the position with the provided replacement level, or -999.9 if ineligible.'''
+        return np.where(self.eligible[pos.value], (self.rate - rep_level) * self.weight, -999.9)
+
+    def populate_par(self, df:DataFrame, replacement_levels:Dict[str, float], mi_rep_level:float) -> None:
+        '''Writes the position PAR columns, MI_PAR, and Max PAR to the DataFrame for the final replacement levels.'''
+        pars = []
+        for pos in Position.get_discrete_offensive_pos():
+            par = self.calc_par(replacement_levels[pos.value], pos)
+            df[f'{pos.value}_PAR'] = par
+            pars.append(par)
+            if pos == Position.POS_2B:
+                df['MI_PAR'] = self.calc_par(mi_rep_level, Position.POS_MI)
+        df['Max PAR'] = np.max(np.vstack(pars), axis=0)
+
+    def populate_games(self, df:DataFrame, replacement_levels:Dict[str, float]) -> None:
+        '''Writes the games filled above replacement level by each player to the position Games columns.'''
+        group_pos = np.array([group.get_min_rep_pos(replacement_levels) for group in self.groups], dtype=object)
+        player_pos = group_pos[self.group_index]
+        for pos in Position.get_discrete_offensive_pos():
+            par = self.calc_par(replacement_levels[pos.value], pos)
+            df[f'{pos.value} Games'] = np.where((player_pos == pos.value) & (par >= 0), self.games, 0)
+
+class ArmRepLevelSolver():
+    '''Answers the replacement level and usable innings/games questions asked on every iteration of the pitcher replacement level search
+    without re-filtering, re-sorting, or re-applying over the DataFrame. SP and RP rates are ranked once on creation and usable innings,
+    games, and roster counts are kept as suffix sums over the ranked order. Only split role pitchers, whose PAR combines both roles, are
+    evaluated directly on each query. PAR columns are only written to the DataFrame once the search is complete.'''
+
+    roles = ['SP', 'RP']
+    #Column order of the rostered totals
+    total_keys = ['Count', 'SP IP', 'RP IP', 'SP G', 'RP G']
+
+    def __init__(self, df:DataFrame, rate_cols:Dict[str, str], min_ip:Dict[str, float], rank_basis:RankingBasis):
+        g = df['G'].to_numpy(dtype=float)
+        gs = df['GS'].to_numpy(dtype=float)
+        ip = {role : df[f'IP {role}'].to_numpy(dtype=float) for role in self.roles}
+        self.rate = {role : df[rate_cols[role]].to_numpy(dtype=float) for role in self.roles}
+        if rank_basis == RankingBasis.PIP:
+            self.weight = ip
+        else:
+            self.weight = {'SP' : gs, 'RP' : g - gs}
+        #Role PAR is -1 for pitchers without games or innings in the role
+        self.valid = {role : (g != 0) & (ip[role] != 0) for role in self.roles}
+        usable_ip = {role : ip[role] * df[f'{role} Multiplier'].to_numpy(dtype=float) for role in self.roles}
+        usable_g = {'SP' : gs * df['SP Multiplier'].to_numpy(dtype=float), 'RP' : (g - gs) * df['RP Multiplier'].to_numpy(dtype=float)}
+
+        self.ranked_rates:Dict[str, RankedRates] = {}
+        self.role_totals = {}
+        for role in self.roles:
+            self.ranked_rates[role] = RankedRates(self.rate[role], ip[role] >= min_ip[role])
+            valid = self.valid[role]
+            self.role_totals[role] = RankedTotals(self.rate[role][valid], self.weight[role][valid], np.column_stack([usable_ip[role][valid], usable_g[role][valid]]))
+
+        quantities = np.column_stack([np.ones(len(g)), usable_ip['SP'], usable_ip['RP'], usable_g['SP'], usable_g['RP']])
+        #Single role pitchers are rostered based on their one role PAR. Pitchers with no innings in either role have a PAR of 0.
+        self.single_totals = {}
+        single = {'SP' : (ip['RP'] == 0) & self.valid['SP'], 'RP' : (ip['SP'] == 0) & self.valid['RP']}
+        for role in self.roles:
+            self.single_totals[role] = RankedTotals(self.rate[role][single[role]], self.weight[role][single[role]], quantities[single[role]])
+        self.no_ip_totals = np.sum(quantities[(ip['SP'] == 0) & (ip['RP'] == 0)], axis=0)
+        self.split = (ip['SP'] != 0) & (ip['RP'] != 0)
+        self.split_quantities = quantities[self.split]
+        self.split_rate = {role : self.rate[role][self.split] for role in self.roles}
+        self.split_weight = {role : self.weight[role][self.split] for role in self.roles}
+        self.split_valid = {role : self.valid[role][self.split] for role in self.roles}
+
+    def get_rep_level(self, role:str, num_rostered:int) -> float:
+        '''Returns the rate of the num_rostered-th best pitcher with enough innings in the role.'''
+        return self.ranked_rates[role].get_rate(num_rostered)
+
+    def get_role_totals(self, role:str, rep_level:float) -> Tuple[float, float]:
+        '''Returns the usable innings and usable games in the role for pitchers whose role PAR is non-negative.'''
+        totals = self.role_totals[role].get_totals(rep_level)
+        return totals[0], totals[1]
+
+    def get_rostered_totals(self, replacement_levels:Dict[str, float]) -> Dict[str, float]:
+        '''Returns the number of pitchers with a non-negative total PAR along with their usable innings and games in each role, keyed by
+        total_keys.'''
+        totals = self.no_ip_totals.copy()
+        for role in self.roles:
+            totals += self.single_totals[role].get_totals(replacement_levels[role])
+        split_par = np.zeros(len(self.split_quantities))
+        for role in self.roles:
+            split_par += np.where(self.split_valid[role], (self.split_rate[role] - replacement_levels[role]) * self.split_weight[role], -1)
+        totals += np.sum(self.split_quantities[split_par >= 0], axis=0)
+        return dict(zip(self.total_keys, totals))